@@ -0,0 +1,127 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/admission.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+MAX_PER_USER = 1        # Одновременно обрабатываемых запросов одного пользователя
+MAX_CONCURRENT = 8      # Одновременно обрабатываемых запросов всего
+MAX_QUEUE = 50          # Запросов, ожидающих своей очереди
+
+# Результаты допуска запроса
+ADMITTED = "admitted"
+BUSY = "busy"               # Очередь переполнена, запрос отклонён сразу
+SUPERSEDED = "superseded"   # Пока запрос ждал, пользователь прислал новый
+
+
+class AdmissionController:
+    """
+    Допуск запросов к обработке (поиск, модель): не больше max_per_user одновременно
+    от одного пользователя и max_concurrent всего. Остальные ждут в очереди длиной max_queue;
+    при переполнении запрос сразу отклоняется. Новый запрос пользователя вытесняет
+    его же ещё ожидающие запросы.
+    """
+
+    def __init__(self, max_per_user: int = MAX_PER_USER, max_concurrent: int = MAX_CONCURRENT,
+                 max_queue: int = MAX_QUEUE):
+        self.max_per_user = max_per_user
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.running = 0
+        self.running_by_user: Dict[int, int] = {}
+        self._waiting: "OrderedDict[int, tuple]" = OrderedDict()  # номер -> (пользователь, future)
+        self._counter = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.superseded = 0
+        self.max_queue_depth = 0
+
+    def _can_run(self, user_id: int) -> bool:
+        return self.running < self.max_concurrent and self.running_by_user.get(user_id, 0) < self.max_per_user
+
+    def _start(self, user_id: int):
+        self.running += 1
+        self.running_by_user[user_id] = self.running_by_user.get(user_id, 0) + 1
+        self.admitted += 1
+
+    async def acquire(self, user_id: int, on_wait: Optional[Callable[[], Awaitable[Any]]] = None) -> str:
+        """
+        Ждёт допуска запроса. Возвращает ADMITTED (после обработки обязателен release),
+        BUSY или SUPERSEDED. Допуск и отказ решаются сразу; on_wait вызывается, только если
+        запросу приходится ждать в очереди (например, чтобы показать пользователю заглушку).
+        """
+        for number, (waiting_user, future) in list(self._waiting.items()):
+            if waiting_user == user_id:
+                del self._waiting[number]
+                # Future уже отменена, если ожидающий обработчик отменён и ещё не убрал себя из очереди
+                if not future.done():
+                    future.set_result(SUPERSEDED)
+                    self.superseded += 1
+
+        if self._can_run(user_id):
+            self._start(user_id)
+            return ADMITTED
+        if len(self._waiting) >= self.max_queue:
+            self.rejected += 1
+            logger.warning(f"Очередь запросов переполнена ({len(self._waiting)}), запрос {user_id} отклонён")
+            return BUSY
+
+        self._counter += 1
+        number = self._counter
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[number] = (user_id, future)
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiting))
+        try:
+            if on_wait is not None:
+                await on_wait()
+            return await future
+        except BaseException:
+            if (self._waiting.pop(number, None) is None and future.done() and not future.cancelled()
+                    and future.result() == ADMITTED):
+                # Допуск уже выдан, но обработчик отменён или on_wait упал: освобождаем место
+                self.release(user_id)
+            raise
+
+    def release(self, user_id: int):
+        """Освобождает место после обработки запроса и допускает ожидающих."""
+        self.running -= 1
+        remaining = self.running_by_user.get(user_id, 1) - 1
+        if remaining:
+            self.running_by_user[user_id] = remaining
+        else:
+            self.running_by_user.pop(user_id, None)
+
+        for number, (waiting_user, future) in list(self._waiting.items()):
+            if self.running >= self.max_concurrent:
+                break
+            if future.done():
+                # Обработчик отменён: место ему не выдаём, иначе оно не вернётся
+                del self._waiting[number]
+                continue
+            if self._can_run(waiting_user):
+                del self._waiting[number]
+                self._start(waiting_user)
+                future.set_result(ADMITTED)
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": len(self._waiting),
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "superseded": self.superseded,
+        }
+
+
+admission = AdmissionController()
@@ -0,0 +1,260 @@
+import asyncio
+import importlib
+import logging
+import signal
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+from aiohttp import web
+from Http_client import http_client
+from Loop_monitor import loop_monitor
+from Memory import memory_accountant, register_bot_subsystems
+from Metrics import readiness, start_metrics_server, stop_metrics_server
+from Prompts import prompts_service
+from Retrieval import get_retrieval
+from Send_queue import send_queue
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/app.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+SHUTDOWN_TIMEOUT = 30  # Сколько ждать завершения начатых ответов при остановке, сек
+MODES = ("polling", "webhook")
+
+
+class App:
+    """
+    Единая точка запуска бота на aiogram 3: опрос (polling) или webhook.
+    Запуск идёт по шагам: конфигурация → сервер метрик (/health, /ready) → настройки prompts.json →
+    общие клиенты → модель → снимок базы знаний с индексом → прогрев кодировщика → бот и диспетчер → сторожа.
+    Если задан RETRIEVAL_SOCKET, модель и база знаний живут в сервисе поиска (Retrieval_server.py),
+    и вместо трёх шагов с ними бот только дожидается подключения к сервису.
+    Обновления принимаются только после всех шагов, до этого /ready отвечает 503 с текущим шагом.
+    По SIGINT/SIGTERM приём обновлений прекращается, начатые ответы дорабатываются,
+    исходящая очередь досылается, и только затем закрываются клиенты.
+    """
+
+    def __init__(self, mode: str = "polling", shutdown_timeout: float = SHUTDOWN_TIMEOUT):
+        if mode not in MODES:
+            raise ValueError(f"Неизвестный режим запуска: {mode}")
+        self.mode = mode
+        self.shutdown_timeout = shutdown_timeout
+        self.config = None
+        self.sheets = None
+        self.bot = None
+        self.dp = None
+        self.kb_source: Optional[str] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._kb_refresh: Optional[asyncio.Task] = None
+        self._update_tasks: Set[asyncio.Task] = set()
+
+    # --- Запуск ---
+
+    async def _stage(self, name: str, title: str, func, *args):
+        """Выполняет шаг запуска, замеряя его длительность (видна в /ready и метрике bot_startup_stage_seconds)."""
+        readiness.begin(name, title)
+        logger.info(f"Запуск: {title}...")
+        started = time.monotonic()
+        try:
+            result = func(*args)
+            if asyncio.iscoroutine(result):
+                result = await result
+        except Exception as e:
+            readiness.fail(name, e)
+            logger.exception(f"Ошибка на шаге запуска «{title}»")
+            raise
+        duration = time.monotonic() - started
+        readiness.done(name, title, duration)
+        logger.info(f"{title}: готово за {duration:.2f} сек")
+        return result
+
+    def _load_config(self):
+        self.config = importlib.import_module("Config")
+        self.config.validate()
+
+    async def _start_clients(self):
+        from State_backend import get_state_backend
+        await http_client.start()
+        get_state_backend()
+
+    async def _load_model(self):
+        # Google_sheets загружает модель лениво; бот загружает её здесь, а не на первом вопросе пользователя.
+        # В потоке, чтобы сервер метрик отвечал на /health, пока грузятся torch и веса
+        self.sheets = await asyncio.to_thread(importlib.import_module, "Google_sheets")
+        await asyncio.to_thread(self.sheets.get_model)
+
+    async def _load_knowledge_base(self):
+        self.kb_source = await self.sheets.initialize_knowledge_base()
+
+    async def _connect_retrieval(self):
+        await get_retrieval().start()
+
+    async def _build_bot(self):
+        from Webhook import create_bot, build_dispatcher
+        self.bot = create_bot()
+        self.dp = build_dispatcher()
+        self.dp.update.outer_middleware(self._track_update)
+        me = await self.bot.get_me()
+        logger.info(f"Бот @{me.username} (id {me.id}) подключён к Bot API")
+
+    def _start_monitors(self):
+        loop_monitor.start()
+        register_bot_subsystems()
+        memory_accountant.start()
+
+    async def startup(self) -> bool:
+        """Готовит всё, что нужно для ответа на первое сообщение. False — остановка пришла во время запуска."""
+        if get_retrieval().shared:
+            knowledge_stages = (
+                ("retrieval", "Подключение к сервису поиска", self._connect_retrieval),
+            )
+        else:
+            knowledge_stages = (
+                ("model", "Модель SentenceTransformer", self._load_model),
+                ("knowledge_base", "База знаний и индекс FAISS", self._load_knowledge_base),
+                ("warm_up", "Прогрев кодировщика", lambda: asyncio.to_thread(self.sheets.warm_up_encoder)),
+            )
+        stages = (
+            ("config", "Конфигурация", self._load_config),
+            ("metrics", "Сервер метрик", start_metrics_server),
+            ("prompts", "Настройки prompts.json", prompts_service.start_watching),
+            ("clients", "Пул HTTP-соединений и хранилище состояний", self._start_clients),
+            *knowledge_stages,
+            ("bot", "Бот и диспетчер", self._build_bot),
+            ("monitors", "Сторож цикла событий и учёт памяти", self._start_monitors),
+        )
+        for name, title, func in stages:
+            if self._stop.is_set():
+                logger.info("Остановка во время запуска, оставшиеся шаги пропущены")
+                return False
+            await self._stage(name, title, func)
+        if self.kb_source == "cache":
+            # Бот отвечает по снимку, а свежая таблица подтягивается в фоне
+            self._kb_refresh = asyncio.create_task(asyncio.to_thread(self.sheets.refresh_knowledge_base))
+            self._kb_refresh.add_done_callback(self._kb_refresh_done)
+        return True
+
+    @staticmethod
+    def _kb_refresh_done(task: asyncio.Task):
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            logger.error("Не удалось обновить базу знаний из Google Sheets, бот отвечает по снимку",
+                         exc_info=error)
+
+    # --- Приём обновлений ---
+
+    async def _serve_polling(self):
+        # Как skip_updates в прежнем bot.py: накопившиеся за время простоя обновления не обрабатываем
+        await self.bot.delete_webhook(drop_pending_updates=True)
+        polling = asyncio.create_task(self.dp.start_polling(
+            self.bot,
+            handle_signals=False,
+            close_bot_session=False,
+            allowed_updates=self.dp.resolve_used_update_types()
+        ))
+        readiness.mark_ready()
+        logger.info("Бот принимает обновления (polling)")
+        stop = asyncio.create_task(self._stop.wait())
+        await asyncio.wait((polling, stop), return_when=asyncio.FIRST_COMPLETED)
+        readiness.mark_not_ready("stopping", "Остановка")
+        if not polling.done():
+            try:
+                await self.dp.stop_polling()
+            except RuntimeError:
+                polling.cancel()
+        stop.cancel()
+        await asyncio.gather(polling, return_exceptions=True)
+        await self._drain_updates()
+
+    async def _track_update(self, handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]], update: Any,
+                            data: Dict[str, Any]) -> Any:
+        """Внешний middleware диспетчера: запоминает задачи, в которых обрабатываются обновления."""
+        task = asyncio.current_task()
+        self._update_tasks.add(task)
+        try:
+            return await handler(update, data)
+        finally:
+            self._update_tasks.discard(task)
+
+    async def _drain_updates(self):
+        """Дожидается обновлений, которые диспетчер уже взял в обработку (ответы пользователям)."""
+        pending = [task for task in self._update_tasks if not task.done()]
+        if not pending:
+            return
+        logger.info(f"Ожидание завершения {len(pending)} обновлений...")
+        done, not_done = await asyncio.wait(pending, timeout=self.shutdown_timeout)
+        if not_done:
+            logger.warning(f"Не дождались {len(not_done)} обновлений за {self.shutdown_timeout} сек, они прерваны")
+            for task in not_done:
+                task.cancel()
+
+    async def _serve_webhook(self):
+        from Webhook import create_app
+        host, port, path = self.config.WEBAPP_HOST, self.config.WEBAPP_PORT, self.config.WEBHOOK_PATH
+        runner = web.AppRunner(create_app(self.bot, self.dp), handle_signals=False)
+        await runner.setup()  # Регистрирует webhook в Telegram
+        try:
+            await web.TCPSite(runner, host, port).start()
+            readiness.mark_ready()
+            logger.info(f"Бот принимает обновления (webhook) на {host}:{port}{path}")
+            await self._stop.wait()
+        finally:
+            readiness.mark_not_ready("stopping", "Остановка")
+            # Закрытие обработчика webhook дожидается начатых обновлений и досылает очередь
+            await runner.cleanup()
+
+    # --- Остановка ---
+
+    def request_stop(self, signame: str = ""):
+        if self._stop is not None and not self._stop.is_set():
+            logger.info(f"Получен сигнал {signame or 'остановки'}, бот перестаёт принимать обновления")
+            self._stop.set()
+
+    async def shutdown(self):
+        readiness.mark_not_ready("stopping", "Остановка")
+        if self._kb_refresh is not None and not self._kb_refresh.done():
+            self._kb_refresh.cancel()
+        await send_queue.drain()
+        if self.dp is not None:
+            await self.dp.storage.close()
+        await http_client.close()
+        await get_retrieval().close()
+        await loop_monitor.stop()
+        await memory_accountant.stop()
+        if self.bot is not None:
+            await self.bot.session.close()
+        await stop_metrics_server()
+        logger.info("Бот остановлен")
+
+    async def main(self):
+        self._stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.request_stop, sig.name)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: Ctrl+C приходит как KeyboardInterrupt
+        started = time.monotonic()
+        try:
+            if await self.startup():
+                logger.info(f"Запуск завершён за {time.monotonic() - started:.2f} сек")
+                if self.mode == "webhook":
+                    await self._serve_webhook()
+                else:
+                    await self._serve_polling()
+        finally:
+            await self.shutdown()
+
+    def run(self):
+        try:
+            asyncio.run(self.main())
+        except KeyboardInterrupt:
+            logger.info("Бот остановлен по Ctrl+C")
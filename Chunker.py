@@ -0,0 +1,151 @@
+import re
+from typing import List, Tuple
+
+TELEGRAM_MAX_LENGTH = 4096  # Лимит длины сообщения Telegram
+
+# Тег (<b>, </b>, <a href="...">) или HTML-сущность (&amp;, &#39;) — неделимые куски разметки
+TOKEN_RE = re.compile(r"<(/?)([a-zA-Z][\w-]*)[^<>]*>|&#?\w+;")
+
+
+class HtmlChunker:
+    """
+    Делит текст с HTML-разметкой Telegram на части не длиннее max_length за один проход.
+    Открытые теги закрываются в конце части и открываются заново в начале следующей,
+    поэтому каждая часть — корректный HTML. Части режутся по строкам, а слишком длинная
+    строка — по пробелу или посимвольно (не разрывая теги и сущности).
+    Можно подавать готовый текст целиком или потоковый ответ кусками (feed), затем вызвать flush.
+    """
+
+    def __init__(self, max_length: int = TELEGRAM_MAX_LENGTH):
+        self.max_length = max_length
+        self.stack: List[Tuple[str, str]] = []  # Открытые теги: (имя, открывающий тег)
+        self.closing_length = 0                 # Длина закрывающих тегов для текущего стека
+        self.pieces: List[str] = []
+        self.length = 0
+        self.has_text = False
+        self.pending = ""                       # Незавершённая строка из потокового ввода
+        self.chunks: List[str] = []
+
+    def feed(self, text: str) -> List[str]:
+        """Добавляет текст; возвращает части, которые уже точно не изменятся."""
+        self.pending += text
+        end = self.pending.rfind("\n")
+        if end != -1:
+            lines, self.pending = self.pending[:end + 1], self.pending[end + 1:]
+            for line in lines.splitlines(keepends=True):
+                self._add_line(line)
+        return self._take()
+
+    def flush(self) -> List[str]:
+        """Завершает ввод и возвращает оставшиеся части."""
+        if self.pending:
+            self._add_line(self.pending)
+            self.pending = ""
+        self._emit()
+        return self._take()
+
+    def _take(self) -> List[str]:
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+    # --- Стек тегов ---
+
+    def _apply(self, match: "re.Match"):
+        closing, name = match.group(1), match.group(2)
+        if name is None:
+            return  # Сущность
+        name = name.lower()
+        if not closing:
+            self.stack.append((name, match.group(0)))
+            self.closing_length += len(name) + 3
+            return
+        for index in range(len(self.stack) - 1, -1, -1):
+            if self.stack[index][0] == name:
+                for closed_name, _ in self.stack[index:]:
+                    self.closing_length -= len(closed_name) + 3
+                del self.stack[index:]
+                return
+
+    def _closing_after(self, line: str) -> int:
+        """Длина закрывающих тегов, которые понадобятся после строки (без изменения стека)."""
+        names = [name for name, _ in self.stack]
+        for match in TOKEN_RE.finditer(line):
+            closing, name = match.group(1), match.group(2)
+            if name is None:
+                continue
+            name = name.lower()
+            if not closing:
+                names.append(name)
+            elif name in names:
+                del names[len(names) - 1 - names[::-1].index(name):]
+        return sum(len(name) + 3 for name in names)
+
+    # --- Сборка частей ---
+
+    def _append(self, text: str, is_text: bool = True):
+        self.pieces.append(text)
+        self.length += len(text)
+        if is_text and text.strip():
+            self.has_text = True
+
+    def _emit(self):
+        """Закрывает текущую часть и начинает новую с повторно открытыми тегами."""
+        if self.has_text:
+            closing = "".join(f"</{name}>" for name, _ in reversed(self.stack))
+            self.chunks.append(("".join(self.pieces) + closing).strip())
+        self.pieces = [opening for _, opening in self.stack]
+        self.length = sum(len(piece) for piece in self.pieces)
+        self.has_text = False
+
+    def _add_line(self, line: str):
+        if self.length + len(line) + self._closing_after(line) <= self.max_length:
+            self._add_whole(line)
+            return
+        if self.has_text:
+            self._emit()
+            if self.length + len(line) + self._closing_after(line) <= self.max_length:
+                self._add_whole(line)
+                return
+        self._add_split(line)
+
+    def _add_whole(self, line: str):
+        self._append(line)
+        for match in TOKEN_RE.finditer(line):
+            self._apply(match)
+
+    def _add_split(self, line: str):
+        """Добавляет строку, которая не помещается в одну часть, по кускам."""
+        position = 0
+        for match in TOKEN_RE.finditer(line):
+            self._add_text(line[position:match.start()])
+            token = match.group(0)
+            closing_after = self._closing_after(token)
+            if self.length + len(token) + closing_after > self.max_length and self.has_text:
+                self._emit()
+            self._append(token, is_text=match.group(2) is None)
+            self._apply(match)
+            position = match.end()
+        self._add_text(line[position:])
+
+    def _add_text(self, text: str):
+        while text:
+            budget = self.max_length - self.length - self.closing_length
+            if len(text) <= budget:
+                self._append(text)
+                return
+            if budget <= 0 and self.has_text:
+                self._emit()
+                continue
+            budget = max(budget, 1)
+            cut = text.rfind(" ", 0, budget + 1)
+            if cut < budget // 2:
+                cut = budget
+            self._append(text[:cut])
+            self._emit()
+            text = text[cut:].lstrip(" ")
+
+
+def split_html(text: str, max_length: int = TELEGRAM_MAX_LENGTH) -> List[str]:
+    """Делит готовый ответ на части с корректной HTML-разметкой."""
+    chunker = HtmlChunker(max_length)
+    return chunker.feed(text) + chunker.flush()
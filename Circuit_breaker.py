@@ -0,0 +1,208 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from Search_cache import SEARCH_CACHE_DB
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/circuit_breaker.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"        # Источник работает, запросы проходят
+OPEN = "open"            # Источник отключён, запросы сразу пропускаются
+HALF_OPEN = "half_open"  # Пробные запросы после паузы
+
+# Настройки по умолчанию (переопределяются полем "circuit_breaker" в search_instructions)
+DEFAULT_BREAKER_SETTINGS = {
+    "window": 60,          # Скользящее окно статистики, сек
+    "min_requests": 5,     # Минимум запросов в окне для принятия решения
+    "error_rate": 0.5,     # Доля ошибок, при которой источник отключается
+    "slow_call": 3.0,      # Запрос дольше этого (сек) считается неудачным; меньше бюджета контекста (4 сек),
+                           # иначе медленный запрос отменяется раньше, чем успевает стать медленным
+    "open_seconds": 30,    # Сколько держать источник отключённым перед пробой
+    "probes": 1,           # Число одновременных пробных запросов в half_open
+    "probe_successes": 2   # Сколько успешных проб нужно для восстановления
+}
+
+# Как часто сохранять статистику для админ-панели, сек
+PERSIST_INTERVAL = 5
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для внешнего источника поиска.
+    Считает ошибки и медленные ответы в скользящем окне; при превышении порога
+    отключает источник (open), через open_seconds пропускает пробные запросы
+    (half_open) и восстанавливает источник после нескольких успешных проб.
+    """
+
+    def __init__(self, name: str, settings: Optional[dict] = None):
+        self.name = name
+        self.settings = dict(DEFAULT_BREAKER_SETTINGS)
+        self.settings.update(settings or {})
+        self.state = CLOSED
+        self.calls = deque()  # (время, успех, длительность)
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        self.total_calls = 0
+        self.total_failures = 0
+        self.rejected = 0
+        self.last_error = ""
+        self.state_changed_at = time.time()
+
+    def _trim(self, now: float):
+        window = self.settings["window"]
+        while self.calls and now - self.calls[0][0] > window:
+            self.calls.popleft()
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning(f"Источник {self.name}: {self.state} -> {state}")
+            self.state = state
+            self.state_changed_at = time.time()
+
+    def allow(self) -> bool:
+        """Возвращает True, если запрос к источнику можно выполнять."""
+        now = time.time()
+        if self.state == OPEN:
+            if now - self.opened_at < self.settings["open_seconds"]:
+                self.rejected += 1
+                return False
+            self._set_state(HALF_OPEN)
+            self.probe_successes = 0
+        if self.state == HALF_OPEN:
+            if self.probes_in_flight >= self.settings["probes"]:
+                self.rejected += 1
+                return False
+            self.probes_in_flight += 1
+        return True
+
+    def record(self, success: bool, latency: float, error: str = ""):
+        """Учитывает результат запроса."""
+        now = time.time()
+        if success and latency > self.settings["slow_call"]:
+            success = False
+            error = f"медленный ответ {latency:.1f} сек"
+        self.total_calls += 1
+        if not success:
+            self.total_failures += 1
+            self.last_error = error
+
+        if self.state == HALF_OPEN:
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+            if not success:
+                self.opened_at = now
+                self._set_state(OPEN)
+                return
+            self.probe_successes += 1
+            if self.probe_successes >= self.settings["probe_successes"]:
+                self.calls.clear()
+                self._set_state(CLOSED)
+            return
+
+        self.calls.append((now, success, latency))
+        self._trim(now)
+        if self.state == CLOSED and len(self.calls) >= self.settings["min_requests"]:
+            failures = sum(1 for _, ok, _ in self.calls if not ok)
+            if failures / len(self.calls) >= self.settings["error_rate"]:
+                self.opened_at = now
+                self._set_state(OPEN)
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        self._trim(now)
+        window_calls = len(self.calls)
+        window_failures = sum(1 for _, ok, _ in self.calls if not ok)
+        latencies = sorted(latency for _, _, latency in self.calls)
+        return {
+            "site": self.name,
+            "state": self.state,
+            "window_calls": window_calls,
+            "error_rate": window_failures / window_calls if window_calls else 0.0,
+            "avg_latency": sum(latencies) / window_calls if window_calls else 0.0,
+            "p95_latency": latencies[int(window_calls * 0.95) - 1] if window_calls else 0.0,
+            "total_calls": self.total_calls,
+            "total_failures": self.total_failures,
+            "rejected": self.rejected,
+            "last_error": self.last_error,
+            "state_changed_at": self.state_changed_at,
+            "updated_at": now,
+        }
+
+
+class BreakerRegistry:
+    """
+    Хранит предохранители по сайтам и сохраняет их состояние в SQLite,
+    чтобы админ-панель (отдельный процесс) могла показать деградировавшие источники.
+    """
+
+    def __init__(self, path: str = SEARCH_CACHE_DB):
+        self.path = path
+        self.breakers = {}
+        self._last_persist = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, site: str, settings: Optional[dict] = None) -> CircuitBreaker:
+        breaker = self.breakers.get(site)
+        if breaker is None:
+            breaker = self.breakers[site] = CircuitBreaker(site, settings)
+        elif settings:
+            breaker.settings.update(settings)
+        return breaker
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute('''CREATE TABLE IF NOT EXISTS site_health (
+            site TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        )''')
+        return conn
+
+    def persist(self, force: bool = False):
+        """Сохраняет состояние предохранителей (не чаще PERSIST_INTERVAL, если не force)."""
+        now = time.time()
+        if not force and now - self._last_persist < PERSIST_INTERVAL:
+            return
+        self._last_persist = now
+        try:
+            with self._lock:
+                conn = self._connect()
+                try:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO site_health VALUES (?, ?)",
+                        [(site, json.dumps(breaker.snapshot(), ensure_ascii=False))
+                         for site, breaker in self.breakers.items()]
+                    )
+                finally:
+                    conn.close()
+        except Exception as e:
+            logger.error(f"Ошибка сохранения состояния источников: {e}")
+
+    def load_snapshots(self) -> list:
+        """Читает сохранённое состояние источников (используется админ-панелью)."""
+        try:
+            conn = self._connect()
+            try:
+                rows = conn.execute("SELECT data FROM site_health ORDER BY site").fetchall()
+            finally:
+                conn.close()
+            return [json.loads(row[0]) for row in rows]
+        except Exception as e:
+            logger.error(f"Ошибка чтения состояния источников: {e}")
+            return []
+
+
+breakers = BreakerRegistry()
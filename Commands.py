@@ -2,12 +2,16 @@ import logging
 import asyncio
 from aiogram import Bot, Dispatcher, types
 from aiogram.filters import Command
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from Google_sheets import add_to_knowledge_base
+from Retrieval import get_retrieval
 from Config import GROUP_ID, GROUP_INVITE_LINK
-from Keyboards import get_main_keyboard
+from Membership import is_user_in_group
+from Keyboards import get_main_keyboard, build_dispatch_table, BUILTIN_BUTTONS
+from Prompts import get_prompts, get_snapshot
+from Profiler import profiler, DEFAULT_DURATION
+from Send_queue import send_queue, PRIORITY_FIRST
 
 # Настройка логирования
 logging.basicConfig(
@@ -24,20 +28,6 @@ logger = logging.getLogger(__name__)
 class AddQAStates(StatesGroup):
     waiting_for_data = State()
 
-async def is_user_in_group(bot: Bot, user_id: int, group_id: str, check_admin: bool = False) -> bool:
-    """
-    Проверяет, состоит ли пользователь в указанной группе.
-    Если check_admin=True, проверяет, является ли пользователь администратором или создателем группы.
-    """
-    try:
-        member = await bot.get_chat_member(chat_id=group_id, user_id=user_id)
-        if check_admin:
-            return member.status in ["administrator", "creator"]
-        return member.status in ["member", "administrator", "creator"]
-    except Exception as e:
-        logger.error(f"Ошибка проверки членства в группе {group_id} для пользователя {user_id}: {e}")
-        return False
-
 def create_subscription_keyboard() -> InlineKeyboardMarkup:
     """
     Создаёт клавиатуру с кнопкой для подписки на закрытую группу.
@@ -65,7 +55,48 @@ def escape_html(text: str) -> str:
     """
     Экранирует специальные HTML-символы в тексте.
     """
-    return text.replace("<", "&lt;").replace(">", "&gt;").replace("&", "&amp;")
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+def get_dispatch_table() -> dict:
+    """
+    Возвращает таблицу команд и кнопок для текущей версии prompts.json.
+    """
+    return get_snapshot().derived("dispatch_table", build_dispatch_table)
+
+def prompt_command(message: types.Message):
+    """
+    Фильтр команд и кнопок из prompts.json (settings.commands, settings.buttons): передаёт обработчику готовый DispatchEntry.
+    Команды с собственным обработчиком (/start, /add_qa и т.д.) до него не доходят — они зарегистрированы раньше;
+    кнопки "Новый диалог", "О боте", "Помощь" остаются за Handlers.py, а простые диалоги — за сопоставителем (Matcher.py).
+    """
+    if not message.text:
+        return False
+    if message.text.startswith("/"):
+        name = message.text.split()[0].split("@")[0].lower()
+    else:
+        name = message.text.lower().strip()
+        if name in BUILTIN_BUTTONS:
+            return False
+    entry = get_dispatch_table().get(name)
+    if entry is None:
+        return False
+    return {"entry": entry}
+
+def register_prompt_commands(dp: Dispatcher):
+    """
+    Регистрирует ответы на команды и кнопки, настроенные в админ-панели (prompts.json).
+    """
+    async def cmd_from_prompts(message: types.Message, entry):
+        if entry.admin_only:
+            # Как is_admin в прежнем bot.py: только пользователи из settings.admins (админ-панель)
+            admins = get_prompts().get("settings", {}).get("admins") or []
+            if message.from_user.id not in admins:
+                await send_queue.answer(message, "Эта команда доступна только администраторам.",
+                                        priority=PRIORITY_FIRST)
+                return
+        await send_queue.answer(message, entry.response, reply_markup=entry.reply_markup, priority=PRIORITY_FIRST)
+
+    dp.message.register(cmd_from_prompts, prompt_command)
 
 def register_commands(dp: Dispatcher):
     """
@@ -85,9 +116,10 @@ def register_commands(dp: Dispatcher):
         if not user_in_group:
             logger.info(f"Пользователь {message.from_user.id} не состоит в группе {GROUP_ID}")
             keyboard = create_subscription_keyboard()
-            await message.reply(
+            await send_queue.reply(
+                message,
                 "Добрый день! Для использования данного бота вам необходимо подписаться на нашу закрытую группу.",
-                reply_markup=keyboard
+                reply_markup=keyboard, priority=PRIORITY_FIRST
             )
             return
 
@@ -95,14 +127,14 @@ def register_commands(dp: Dispatcher):
         bot_username = (await bot.get_me()).username
         keyboard = create_welcome_keyboard(bot_username)
         main_keyboard = get_main_keyboard()
-        await message.reply(
-            "Добро пожаловать! Я Зелёный, твой умный помощник. Выберите действие: 😊",
-            reply_markup=keyboard
+        await send_queue.reply(
+            message, "Добро пожаловать! Я Зелёный, твой умный помощник. Выберите действие: 😊",
+            reply_markup=keyboard, priority=PRIORITY_FIRST
         )
         # Отправляем основную клавиатуру
-        await message.reply(
-            "Задавайте свои вопросы, я готов помочь! 😊",
-            reply_markup=main_keyboard
+        await send_queue.reply(
+            message, "Задавайте свои вопросы, я готов помочь! 😊",
+            reply_markup=main_keyboard, priority=PRIORITY_FIRST
         )
 
     async def cmd_add_qa(message: types.Message, bot: Bot, state: FSMContext):
@@ -118,9 +150,9 @@ def register_commands(dp: Dispatcher):
         if not user_in_group:
             logger.info(f"Пользователь {message.from_user.id} не состоит в группе {GROUP_ID}")
             keyboard = create_subscription_keyboard()
-            await message.reply(
-                "Чтобы использовать эту команду, пожалуйста, подпишитесь на нашу закрытую группу.",
-                reply_markup=keyboard
+            await send_queue.reply(
+                message, "Чтобы использовать эту команду, пожалуйста, подпишитесь на нашу закрытую группу.",
+                reply_markup=keyboard, priority=PRIORITY_FIRST
             )
             return
 
@@ -128,8 +160,8 @@ def register_commands(dp: Dispatcher):
         is_admin = await is_user_in_group(bot, message.from_user.id, GROUP_ID, check_admin=True)
         if not is_admin:
             logger.info(f"Пользователь {message.from_user.id} не является администратором группы {GROUP_ID}")
-            await message.reply(
-                "Эта команда доступна только администраторам группы."
+            await send_queue.reply(
+                message, "Эта команда доступна только администраторам группы.", priority=PRIORITY_FIRST
             )
             return
 
@@ -147,7 +179,7 @@ def register_commands(dp: Dispatcher):
             "Ключевые слова: Wi-Fi, настройка\n"
             "Информация: 1. Откройте настройки роутера. 2. Выберите сеть. 3. Введите пароль."
         )
-        await message.reply(template, parse_mode="HTML")
+        await send_queue.reply(message, template, parse_mode="HTML", priority=PRIORITY_FIRST)
 
     async def handle_add_qa_response(message: types.Message, state: FSMContext):
         """
@@ -173,11 +205,16 @@ def register_commands(dp: Dispatcher):
                     answer = part.replace("Информация:", "").strip()
 
             if not question or not answer:
-                await message.reply("Пожалуйста, укажите вопрос и информацию. Ключевые слова необязательны.")
+                await send_queue.reply(
+                    message, "Пожалуйста, укажите вопрос и информацию. Ключевые слова необязательны.",
+                    priority=PRIORITY_FIRST
+                )
                 return
 
             # Добавляем запись в базу знаний
-            success = add_to_knowledge_base(question, keywords, answer)
+            success = await get_retrieval().add_entries(
+                [{"question": question, "keywords": keywords, "answer": answer}]
+            )
             if success:
                 # Формируем ответ с экранированием текста
                 response = (
@@ -186,12 +223,14 @@ def register_commands(dp: Dispatcher):
                     f"<b>Ключевые слова:</b> {escape_html(keywords) if keywords else 'Не указаны'}\n\n"
                     f"<b>Информация:</b> {escape_html(answer)}"
                 )
-                await message.reply(response, parse_mode="HTML")
+                await send_queue.reply(message, response, parse_mode="HTML", priority=PRIORITY_FIRST)
             else:
-                await message.reply("Не удалось добавить запись в базу знаний. Попробуйте позже.")
+                await send_queue.reply(message, "Не удалось добавить запись в базу знаний. Попробуйте позже.",
+                                       priority=PRIORITY_FIRST)
         except Exception as e:
             logger.error(f"Ошибка при выполнении команды /add_qa: {e}")
-            await message.reply("Произошла ошибка при добавлении записи. Попробуйте позже.")
+            await send_queue.reply(message, "Произошла ошибка при добавлении записи. Попробуйте позже.",
+                                   priority=PRIORITY_FIRST)
         finally:
             # Сбрасываем состояние после обработки
             await state.clear()
@@ -208,18 +247,18 @@ def register_commands(dp: Dispatcher):
         if not user_in_group:
             logger.info(f"Пользователь {message.from_user.id} не состоит в группе {GROUP_ID}")
             keyboard = create_subscription_keyboard()
-            await message.reply(
-                "Чтобы использовать эту команду, пожалуйста, подпишитесь на нашу закрытую группу.",
-                reply_markup=keyboard
+            await send_queue.reply(
+                message, "Чтобы использовать эту команду, пожалуйста, подпишитесь на нашу закрытую группу.",
+                reply_markup=keyboard, priority=PRIORITY_FIRST
             )
             return
 
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="Подробнее", url="https://example.com")]
         ])
-        await message.reply(
-            "Заголовок 1\n\nИнформация: Здесь будет информация для команды /inf1.",
-            reply_markup=keyboard
+        await send_queue.reply(
+            message, "Заголовок 1\n\nИнформация: Здесь будет информация для команды /inf1.",
+            reply_markup=keyboard, priority=PRIORITY_FIRST
         )
 
     async def cmd_inf2(message: types.Message, bot: Bot):
@@ -234,19 +273,62 @@ def register_commands(dp: Dispatcher):
         if not user_in_group:
             logger.info(f"Пользователь {message.from_user.id} не состоит в группе {GROUP_ID}")
             keyboard = create_subscription_keyboard()
-            await message.reply(
-                "Чтобы использовать эту команду, пожалуйста, подпишитесь на нашу закрытую группу.",
-                reply_markup=keyboard
+            await send_queue.reply(
+                message, "Чтобы использовать эту команду, пожалуйста, подпишитесь на нашу закрытую группу.",
+                reply_markup=keyboard, priority=PRIORITY_FIRST
             )
             return
 
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="Подробнее", url="https://example.com")]
         ])
-        await message.reply(
-            "Заголовок 2\n\nИнформация: Здесь будет информация для команды /inf2.",
-            reply_markup=keyboard
+        await send_queue.reply(
+            message, "Заголовок 2\n\nИнформация: Здесь будет информация для команды /inf2.",
+            reply_markup=keyboard, priority=PRIORITY_FIRST
+        )
+
+    async def cmd_profile(message: types.Message, bot: Bot):
+        """
+        Обрабатывает команду /profile [секунды].
+        Профилирует работающего бота и присылает профиль для speedscope.app.
+        Доступно только администраторам группы.
+        """
+        logger.info(f"Получена команда /profile от {message.from_user.id}")
+
+        is_admin = await is_user_in_group(bot, message.from_user.id, GROUP_ID, check_admin=True)
+        if not is_admin:
+            await send_queue.reply(message, "Эта команда доступна только администраторам группы.",
+                                   priority=PRIORITY_FIRST)
+            return
+
+        args = (message.text or "").split()
+        try:
+            seconds = float(args[1]) if len(args) > 1 else DEFAULT_DURATION
+        except ValueError:
+            await send_queue.reply(message, "Укажите длительность в секундах, например: /profile 30",
+                                   priority=PRIORITY_FIRST)
+            return
+
+        if not profiler.start(seconds):
+            await send_queue.reply(message, "Профилирование уже идёт, дождитесь его окончания.",
+                                   priority=PRIORITY_FIRST)
+            return
+        await send_queue.reply(message, f"Профилирование запущено на {profiler.duration:.0f} сек.",
+                               priority=PRIORITY_FIRST)
+
+        result = await profiler.wait()
+        if not result:
+            await send_queue.reply(message, "Не удалось сохранить профиль, подробности в logs/profiler.log.",
+                                   priority=PRIORITY_FIRST)
+            return
+        top = "\n".join(f"{count:>6}  {escape_html(frame)}" for frame, count in result["top"])
+        await send_queue.reply_document(
+            message, FSInputFile(result["speedscope"]), priority=PRIORITY_FIRST,
+            caption=f"Выборок: {result['samples']} за {result['duration']} сек. Откройте файл на speedscope.app"
         )
+        if top:
+            await send_queue.reply(message, f"<b>Самые частые функции:</b>\n<pre>{top}</pre>", parse_mode="HTML",
+                                   priority=PRIORITY_FIRST)
 
     # Регистрируем обработчики
     dp.message.register(cmd_start, Command("start"))
@@ -254,5 +336,7 @@ def register_commands(dp: Dispatcher):
     dp.message.register(handle_add_qa_response, AddQAStates.waiting_for_data)
     dp.message.register(cmd_inf1, Command("inf1"))
     dp.message.register(cmd_inf2, Command("inf2"))
+    dp.message.register(cmd_profile, Command("profile"))
+    register_prompt_commands(dp)
 
     logger.info("Команды успешно зарегистрированы")
\ No newline at end of file
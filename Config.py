@@ -26,25 +26,33 @@ GROUP_INVITE_LINK = os.getenv("GROUP_INVITE_LINK")
 GOOGLE_CREDENTIALS_PATH = os.getenv("GOOGLE_CREDENTIALS_PATH")
 SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")
 
-# Проверка, что переменные загружены
-if not TELEGRAM_TOKEN:
-    logger.error("TELEGRAM_TOKEN не найден в .env")
-    raise ValueError("TELEGRAM_TOKEN не найден в .env")
-if not GROQ_API_KEY:
-    logger.error("GROQ_API_KEY не найден в .env")
-    raise ValueError("GROQ_API_KEY не найден в .env")
-if not GROUP_ID:
-    logger.error("GROUP_ID не найден в .env")
-    raise ValueError("GROUP_ID не найден в .env")
-if not GROUP_INVITE_LINK:
-    logger.error("GROUP_INVITE_LINK не найден в .env")
-    raise ValueError("GROUP_INVITE_LINK не найден в .env")
-if not GOOGLE_CREDENTIALS_PATH:
-    logger.error("GOOGLE_CREDENTIALS_PATH не найден в .env")
-    raise ValueError("GOOGLE_CREDENTIALS_PATH не найден в .env")
-if not SPREADSHEET_ID:
-    logger.error("SPREADSHEET_ID не найден в .env")
-    raise ValueError("SPREADSHEET_ID не найден в .env")
+# Режим webhook (необязательные переменные)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")                  # Публичный адрес, например https://bot.example.com/webhook
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")            # Секрет для заголовка X-Telegram-Bot-Api-Secret-Token
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+WEBHOOK_MAX_CONCURRENT = int(os.getenv("WEBHOOK_MAX_CONCURRENT", "16"))
+WEBHOOK_MAX_BACKLOG = int(os.getenv("WEBHOOK_MAX_BACKLOG", "256"))  # Принятых, но не обработанных обновлений
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")        # Другой сервер Bot API (локальный или тестовый)
 
-# Вывод токена для отладки
-logger.info(f"TELEGRAM_TOKEN: {repr(TELEGRAM_TOKEN)}")
+# Обязательные переменные для бота. Импорт Config их не проверяет, чтобы админ-панели и утилитам,
+# которым нужна только часть настроек, не требовалось окружение бота целиком
+REQUIRED_VARIABLES = ("TELEGRAM_TOKEN", "GROQ_API_KEY", "GROUP_ID", "GROUP_INVITE_LINK",
+                      "GOOGLE_CREDENTIALS_PATH", "SPREADSHEET_ID")
+
+def validate(required=REQUIRED_VARIABLES):
+    """
+    Проверяет, что переменные окружения из required (и WEBHOOK_SECRET, если задан WEBHOOK_URL) заданы;
+    иначе ValueError со списком недостающих.
+    Вызывается при запуске бота (App), до подключения к Telegram.
+    """
+    # Секрет webhook общий для всех копий бота, поэтому задаётся явно, а не генерируется при запуске
+    if WEBHOOK_URL and "WEBHOOK_SECRET" not in required:
+        required = tuple(required) + ("WEBHOOK_SECRET",)
+    missing = [name for name in required if not globals().get(name)]
+    for name in missing:
+        logger.error(f"{name} не найден в .env")
+    if missing:
+        raise ValueError(f"Не найдены в .env: {', '.join(missing)}")
+    logger.info("Обязательные переменные окружения заданы")
@@ -0,0 +1,315 @@
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import logging
+import multiprocessing
+import os
+import sqlite3
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from Extractors import extract_sections
+from Http_client import http_client
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/crawler.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Файл состояния обхода (для продолжения после прерывания)
+CRAWL_STATE_DB = os.path.join("cache", "crawl_state.db")
+
+DEFAULT_CONCURRENCY = 8       # Одновременных загрузок всего
+DEFAULT_HOST_DELAY = 1.0      # Пауза между запросами к одному хосту, сек
+DEFAULT_BATCH_SIZE = 20       # Записей в одной пачке для базы знаний
+DEFAULT_PARSE_WORKERS = 2     # Процессов для разбора страниц
+CRAWL_TIMEOUTS = {"connect": 5, "total": 30}
+# Обход запускается и из процесса бота (parse_and_add_to_sheet), где уже работают потоки
+# (сторож цикла, профилировщик, torch): разборщики стартуют не через fork, а из чистого процесса
+PARSE_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+
+def parse_pool(pages: int, parse_workers: int):
+    """
+    Пул процессов для разбора страниц. Для одной страницы (parse_and_add_to_sheet) запуск
+    процессов дороже самого разбора: тогда пул не создаётся (None), и страница разбирается
+    в потоке по умолчанию через run_in_executor.
+    """
+    if pages <= 1 or parse_workers <= 0:
+        return contextlib.nullcontext()
+    return ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context(PARSE_START_METHOD))
+
+
+class CrawlState:
+    """
+    Состояние обхода в SQLite: статусы страниц и хэши уже добавленных разделов.
+    Страница помечается выполненной только после того, как её записи попали в базу знаний,
+    поэтому прерванный обход продолжается с необработанных страниц без дублей.
+    """
+
+    def __init__(self, path: str = CRAWL_STATE_DB):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS pages (
+            url TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            records INTEGER NOT NULL DEFAULT 0,
+            error TEXT NOT NULL DEFAULT '',
+            updated REAL NOT NULL
+        )''')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS sections (
+            hash TEXT PRIMARY KEY,
+            url TEXT NOT NULL
+        )''')
+
+    def add_pages(self, urls: List[str], force: bool = False):
+        now = time.time()
+        if force:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO pages (url, status, updated) VALUES (?, 'pending', ?)",
+                [(url, now) for url in urls]
+            )
+        else:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO pages (url, status, updated) VALUES (?, 'pending', ?)",
+                [(url, now) for url in urls]
+            )
+            # Упавшие в прошлый раз страницы пробуем снова
+            self.conn.executemany(
+                "UPDATE pages SET status = 'pending', error = '' WHERE url = ? AND status = 'failed'",
+                [(url,) for url in urls]
+            )
+
+    def pending_pages(self, urls: List[str]) -> List[str]:
+        done = {
+            row[0] for row in self.conn.execute("SELECT url FROM pages WHERE status = 'done'")
+        }
+        return [url for url in urls if url not in done]
+
+    def mark(self, url: str, status: str, records: int = 0, error: str = ""):
+        self.conn.execute(
+            "UPDATE pages SET status = ?, records = ?, error = ?, updated = ? WHERE url = ?",
+            (status, records, error, time.time(), url)
+        )
+
+    def known_hashes(self) -> set:
+        return {row[0] for row in self.conn.execute("SELECT hash FROM sections")}
+
+    def add_hashes(self, rows: List[tuple]):
+        self.conn.executemany("INSERT OR IGNORE INTO sections VALUES (?, ?)", rows)
+
+    def close(self):
+        self.conn.close()
+
+
+def section_hash(entry: Dict[str, str]) -> str:
+    """Хэш содержимого раздела (без учёта регистра и лишних пробелов)."""
+    normalized = " ".join(f"{entry['question']}\n{entry['answer']}".lower().split())
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+def parse_sitemap(xml_text: str) -> tuple:
+    """
+    Разбирает sitemap.xml. Возвращает (ссылки на страницы, ссылки на вложенные sitemap).
+    """
+    root = ET.fromstring(xml_text)
+    locs = [loc.text.strip() for loc in root.iter(f"{SITEMAP_NS}loc") if loc.text]
+    if root.tag == f"{SITEMAP_NS}sitemapindex":
+        return [], locs
+    return locs, []
+
+
+class HostThrottle:
+    """Выдерживает паузу между запросами к одному хосту."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.locks: Dict[str, asyncio.Lock] = {}
+        self.last_request: Dict[str, float] = {}
+
+    async def wait(self, url: str):
+        host = urlsplit(url).hostname or ""
+        lock = self.locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            elapsed = time.monotonic() - self.last_request.get(host, 0.0)
+            if elapsed < self.delay:
+                await asyncio.sleep(self.delay - elapsed)
+            self.last_request[host] = time.monotonic()
+
+
+async def expand_sitemap(sitemap_url: str, throttle: HostThrottle, max_depth: int = 3) -> List[str]:
+    """Загружает sitemap (в том числе индекс sitemap) и возвращает список страниц."""
+    pages, queue, seen = [], [(sitemap_url, 0)], set()
+    loop = asyncio.get_running_loop()
+    while queue:
+        url, depth = queue.pop(0)
+        if url in seen or depth > max_depth:
+            continue
+        seen.add(url)
+        await throttle.wait(url)
+        status, text = await http_client.get_text(url, CRAWL_TIMEOUTS)
+        if status != 200:
+            logger.error(f"Не удалось загрузить sitemap {url}: статус {status}")
+            continue
+        page_urls, nested = await loop.run_in_executor(None, parse_sitemap, text)
+        pages.extend(page_urls)
+        queue.extend((nested_url, depth + 1) for nested_url in nested)
+    logger.info(f"Из sitemap {sitemap_url} получено страниц: {len(pages)}")
+    return pages
+
+
+async def crawl(urls: Optional[List[str]] = None, sitemap: Optional[str] = None,
+                concurrency: int = DEFAULT_CONCURRENCY, host_delay: float = DEFAULT_HOST_DELAY,
+                batch_size: int = DEFAULT_BATCH_SIZE, parse_workers: int = DEFAULT_PARSE_WORKERS,
+                force: bool = False, progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """
+    Обходит список страниц и/или sitemap, извлекает разделы "вопрос-ответ"
+    и пачками добавляет их в базу знаний.
+    Загрузка идёт с ограничением числа соединений и паузой между запросами к одному хосту,
+    разбор — в пуле процессов (одна страница — в потоке, см. parse_pool).
+    Разделы с одинаковым содержимым добавляются один раз.
+    Возвращает отчёт {"pages", "done", "failed", "skipped", "records", "duplicates"}.
+    """
+    from Retrieval import get_retrieval
+
+    throttle = HostThrottle(host_delay)
+    all_urls = list(dict.fromkeys(urls or []))
+    if sitemap:
+        all_urls.extend(url for url in await expand_sitemap(sitemap, throttle) if url not in all_urls)
+
+    state = CrawlState()
+    state.add_pages(all_urls, force=force)
+    todo = state.pending_pages(all_urls)
+    report = {
+        "pages": len(all_urls), "done": 0, "failed": 0, "skipped": len(all_urls) - len(todo),
+        "records": 0, "duplicates": 0
+    }
+    if report["skipped"]:
+        logger.info(f"Пропущено уже обработанных страниц: {report['skipped']}")
+
+    seen_hashes = state.known_hashes()
+    ingest_queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+
+    def notify(url: str):
+        logger.info(
+            f"Прогресс обхода: {report['done'] + report['failed']}/{len(todo)} страниц, "
+            f"записей {report['records']}, дублей {report['duplicates']} ({url})"
+        )
+        if progress:
+            progress(dict(report, url=url))
+
+    async def fetch_and_parse(url: str, pool: Optional[ProcessPoolExecutor]):
+        async with semaphore:
+            try:
+                await throttle.wait(url)
+                status, html = await http_client.get_text(url, CRAWL_TIMEOUTS)
+                if status != 200:
+                    raise RuntimeError(f"статус {status}")
+                entries = await loop.run_in_executor(pool, extract_sections, html)
+            except Exception as e:
+                logger.error(f"Ошибка при обработке страницы {url}: {e}")
+                state.mark(url, "failed", error=str(e))
+                report["failed"] += 1
+                notify(url)
+                return
+        unique = []
+        for entry in entries:
+            digest = section_hash(entry)
+            if digest in seen_hashes:
+                report["duplicates"] += 1
+                continue
+            seen_hashes.add(digest)
+            unique.append((digest, entry))
+        await ingest_queue.put((url, unique))
+
+    async def ingest():
+        batch, batch_pages = [], []
+
+        async def flush():
+            records = [entry for _, _, entry in batch]
+            success = await get_retrieval().add_entries(records)
+            for url, count in batch_pages:
+                if success:
+                    state.mark(url, "done", records=count)
+                    report["done"] += 1
+                    report["records"] += count
+                else:
+                    state.mark(url, "failed", error="ошибка добавления в базу знаний")
+                    report["failed"] += 1
+                notify(url)
+            if success:
+                state.add_hashes([(digest, url) for url, digest, _ in batch])
+            batch.clear()
+            batch_pages.clear()
+
+        while True:
+            item = await ingest_queue.get()
+            if item is None:
+                break
+            url, unique = item
+            batch.extend((url, digest, entry) for digest, entry in unique)
+            batch_pages.append((url, len(unique)))
+            if len(batch) >= batch_size:
+                await flush()
+        if batch_pages:
+            await flush()
+
+    ingest_task = asyncio.create_task(ingest())
+    try:
+        with parse_pool(len(todo), parse_workers) as pool:
+            fetchers = asyncio.gather(*(fetch_and_parse(url, pool) for url in todo))
+            # Добавление в базу завершается только после всех страниц; если оно закончилось раньше — упало,
+            # и очередь никто не разбирает: загрузчики зависли бы на put, поэтому останавливаем их
+            await asyncio.wait((fetchers, ingest_task), return_when=asyncio.FIRST_COMPLETED)
+            if not fetchers.done():
+                fetchers.cancel()
+                await asyncio.gather(fetchers, return_exceptions=True)
+                ingest_task.result()
+            fetchers.result()
+        finish = asyncio.ensure_future(ingest_queue.put(None))
+        await asyncio.wait((finish, ingest_task), return_when=asyncio.FIRST_COMPLETED)
+        finish.cancel()
+        await ingest_task
+    finally:
+        if not ingest_task.done():
+            ingest_task.cancel()
+        state.close()
+
+    logger.info(f"Обход завершён: {report}")
+    return report
+
+
+async def _main(args):
+    try:
+        await crawl(urls=args.urls, sitemap=args.sitemap, concurrency=args.concurrency,
+                    host_delay=args.delay, batch_size=args.batch_size, force=args.force)
+    finally:
+        await http_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Обход сайтов и пополнение базы знаний")
+    parser.add_argument("urls", nargs="*", help="адреса страниц")
+    parser.add_argument("--sitemap", help="адрес sitemap.xml")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--delay", type=float, default=DEFAULT_HOST_DELAY, help="пауза между запросами к хосту, сек")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--force", action="store_true", help="обработать заново уже обработанные страницы")
+    asyncio.run(_main(parser.parse_args()))
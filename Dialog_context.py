@@ -0,0 +1,180 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from State_backend import StateBackend, get_state_backend, DIALOG_NAMESPACE, DIALOG_TTL
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/dialog_context.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGES = 10                   # Сколько последних сообщений диалога хранить
+MAX_MESSAGE_CHARS = 2000            # Длинные ответы хранятся обрезанными
+MAX_CACHED_USERS = 5000             # Пользователей в памяти процесса
+MAX_CACHED_BYTES = 8 * 1024 * 1024  # Суммарный размер текстов в памяти процесса, байт
+CACHE_IDLE_TTL = 30 * 60            # Через сколько без сообщений контекст вытесняется из памяти, сек
+# Кэш в памяти верен, только если контекст пишет один процесс бота: хранилище (SQLite или сервер состояния)
+# доступно нескольким процессам, и кэш одного отстал бы от записи другого. DIALOG_CACHE=1 включает кэш
+# для развёртывания с единственным процессом бота.
+DIALOG_CACHE = os.getenv("DIALOG_CACHE") == "1"
+
+# Компактное хранение роли: номер вместо строки в каждом сообщении
+ROLES = ("user", "assistant")
+ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+
+CompactHistory = Tuple[Tuple[int, str], ...]
+
+
+def compact(messages: List[Dict[str, str]]) -> CompactHistory:
+    """Переводит сообщения в кортежи (код роли, текст), обрезая длинные тексты."""
+    return tuple(
+        (ROLE_CODES.get(message["role"], 0), message["content"][:MAX_MESSAGE_CHARS]) for message in messages
+    )
+
+
+def expand(history: CompactHistory) -> List[Dict[str, str]]:
+    return [{"role": ROLES[code], "content": content} for code, content in history]
+
+
+def history_size(history: CompactHistory) -> int:
+    """Приблизительный объём памяти истории: тексты в UTF-8 плюс накладные расходы на сообщение."""
+    return sum(len(content.encode('utf-8')) + 64 for _, content in history)
+
+
+class BoundedContextCache:
+    """
+    Ограниченный кэш контекстов в памяти процесса: не больше max_users пользователей
+    и max_bytes текста. Вытесняются давно не обращавшиеся (idle_ttl), затем самые давно использованные (LRU).
+    """
+
+    def __init__(self, max_users: int = MAX_CACHED_USERS, max_bytes: int = MAX_CACHED_BYTES,
+                 idle_ttl: float = CACHE_IDLE_TTL):
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()  # пользователь -> (история, размер, время)
+        self.bytes = 0
+        self.evicted = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> Optional[CompactHistory]:
+        entry = self._entries.get(user_id)
+        now = time.monotonic()
+        if entry is None or now - entry[2] > self.idle_ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Обращение продлевает запись и переносит её в конец: порядок остаётся по времени последнего использования
+        self._entries[user_id] = (entry[0], entry[1], now)
+        self._entries.move_to_end(user_id)
+        return entry[0]
+
+    def put(self, user_id: int, history: CompactHistory):
+        self.discard(user_id)
+        size = history_size(history)
+        self._entries[user_id] = (history, size, time.monotonic())
+        self.bytes += size
+        self._evict()
+
+    def discard(self, user_id: int):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self.bytes -= entry[1]
+
+    def trim(self, max_bytes: int):
+        """Устанавливает новый лимит размера (бюджет памяти) и сразу вытесняет лишнее."""
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def _evict(self):
+        now = time.monotonic()
+        # Записи упорядочены по времени последнего использования: устаревшие — в начале
+        while self._entries:
+            user_id, (_, size, updated) = next(iter(self._entries.items()))
+            over_limit = len(self._entries) > self.max_users or self.bytes > self.max_bytes
+            if not over_limit and now - updated <= self.idle_ttl:
+                break
+            self._entries.popitem(last=False)
+            self.bytes -= size
+            self.evicted += 1
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._entries),
+            "bytes": self.bytes,
+            "evicted": self.evicted,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class DialogContextStore:
+    """
+    Контекст диалогов пользователей: последние MAX_MESSAGES сообщений
+    [{"role": "user" | "assistant", "content": ...}] в общем хранилище состояния.
+    Контекст переживает перезапуск и доступен всем копиям бота; истекает через ttl после последнего сообщения.
+    Если процесс бота единственный (DIALOG_CACHE=1), недавние диалоги дополнительно держатся
+    в ограниченном кэше в памяти; иначе всегда читаются из хранилища, чтобы не видеть устаревший контекст.
+    """
+
+    def __init__(self, backend: Optional[StateBackend] = None, max_messages: int = MAX_MESSAGES,
+                 ttl: float = DIALOG_TTL, cache: Optional[BoundedContextCache] = None,
+                 use_cache: Optional[bool] = None):
+        self.backend = backend or get_state_backend()
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self.cache = cache or BoundedContextCache()
+        self.use_cache = DIALOG_CACHE if use_cache is None else use_cache
+
+    async def _load(self, user_id: int) -> CompactHistory:
+        if self.use_cache:
+            history = self.cache.get(user_id)
+            if history is not None:
+                return history
+        try:
+            stored = await self.backend.get(DIALOG_NAMESPACE, str(user_id)) or []
+        except Exception as e:
+            logger.error(f"Ошибка чтения контекста диалога {user_id}: {e}")
+            stored = []
+        # Записи прежнего формата хранятся словарями {"role", "content"}
+        history = tuple(
+            compact([item])[0] if isinstance(item, dict) else (item[0], item[1]) for item in stored
+        )
+        if self.use_cache:
+            self.cache.put(user_id, history)
+        return history
+
+    async def get(self, user_id: int) -> List[Dict[str, str]]:
+        return expand(await self._load(user_id))
+
+    async def append(self, user_id: int, *messages: Dict[str, str]):
+        """Добавляет сообщения в контекст, оставляя последние max_messages."""
+        history = ((await self._load(user_id)) + compact(list(messages)))[-self.max_messages:]
+        if self.use_cache:
+            self.cache.put(user_id, history)
+        try:
+            await self.backend.set(DIALOG_NAMESPACE, str(user_id), [list(item) for item in history], ttl=self.ttl)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения контекста диалога {user_id}: {e}")
+
+    async def clear(self, user_id: int):
+        self.cache.discard(user_id)
+        try:
+            await self.backend.delete(DIALOG_NAMESPACE, str(user_id))
+        except Exception as e:
+            logger.error(f"Ошибка очистки контекста диалога {user_id}: {e}")
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+
+dialog_context = DialogContextStore()
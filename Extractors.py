@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import re
+from typing import List, Optional, Tuple
+from bs4 import BeautifulSoup, SoupStrainer
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/extractors.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Быстрый парсер на C (lxml), если установлен; иначе встроенный html.parser
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+    logger.warning("lxml не установлен, используется html.parser (медленнее)")
+
+# Селекторы по умолчанию для поддерживаемых сайтов.
+# Переопределяются полем "extractor" в search_instructions.
+DEFAULT_EXTRACTORS = {
+    "consultant.ru": {
+        "search_url": "https://www.consultant.ru/search/?q={query}",
+        "item": "div.search-result-item",
+        "title": "a.search-result-item__title",
+        "description": "div.search-result-item__description",
+        "limit": 3,
+        "block_markers": ["captcha"]
+    },
+    "dns-shop.ru": {
+        "search_url": "https://www.google.com/search?q=site:dns-shop.ru+{query}",
+        "item": "div.g",
+        "title": "h3",
+        "description": "div.VwiC3b",
+        "limit": 3,
+        "block_markers": ["/sorry/index", "unusual traffic", "g-recaptcha"]
+    }
+}
+
+
+def parse_selector(selector: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Разбирает простой селектор вида "tag", "tag.class" или ".class" в пару (tag, class).
+    """
+    tag, _, css_class = selector.partition(".")
+    return tag or None, css_class or None
+
+
+class SiteExtractor:
+    """
+    Извлекает результаты поиска (заголовок, описание) из HTML-страницы.
+    Строит дерево только для блоков результатов (SoupStrainer), а не для всей страницы.
+    """
+
+    def __init__(self, item: str, title: str, description: str, limit: int = 3, **_):
+        self.item_tag, self.item_class = parse_selector(item)
+        self.title_tag, self.title_class = parse_selector(title)
+        self.description_tag, self.description_class = parse_selector(description)
+        self.limit = limit
+        self.strainer = SoupStrainer(self.item_tag, class_=self.item_class)
+
+    def extract(self, html: str) -> List[Tuple[str, str]]:
+        soup = BeautifulSoup(html, HTML_PARSER, parse_only=self.strainer)
+        results = []
+        for item in soup.find_all(self.item_tag, class_=self.item_class, limit=self.limit):
+            title = item.find(self.title_tag, class_=self.title_class)
+            description = item.find(self.description_tag, class_=self.description_class)
+            title_text = title.get_text(strip=True) if title else "Без заголовка"
+            desc_text = description.get_text(strip=True) if description else "Без описания"
+            results.append((title_text, desc_text))
+        return results
+
+
+_extractors = {}
+
+
+def get_extractor_config(site: str, instruction: dict) -> Optional[dict]:
+    """
+    Возвращает настройки извлечения для сайта: значения по умолчанию,
+    дополненные полем "extractor" из search_instructions.
+    """
+    config = dict(DEFAULT_EXTRACTORS.get(site, {}))
+    config.update(instruction.get("extractor", {}))
+    if not all(key in config for key in ("search_url", "item", "title", "description")):
+        return None
+    return config
+
+
+def get_extractor(config: dict) -> SiteExtractor:
+    """Возвращает (и кэширует) экстрактор для набора селекторов."""
+    key = (config["item"], config["title"], config["description"], config.get("limit", 3))
+    if key not in _extractors:
+        _extractors[key] = SiteExtractor(**config)
+    return _extractors[key]
+
+
+def is_blocked_page(html: str, config: dict) -> bool:
+    """
+    Проверяет, не вернул ли сайт вместо результатов капчу или страницу блокировки.
+    """
+    html_lower = html.lower()
+    return any(marker in html_lower for marker in config.get("block_markers", []))
+
+
+async def extract_results(html: str, config: dict) -> List[Tuple[str, str]]:
+    """
+    Разбирает страницу в отдельном потоке, чтобы не блокировать цикл событий.
+    """
+    return await asyncio.to_thread(get_extractor(config).extract, html)
+
+
+# Стоп-слова для ключевых слов статей (совпадают с Google_sheets.STOP_WORDS)
+SECTION_STOP_WORDS = {'и', 'в', 'на', 'с', 'по', 'у', 'как', 'все', 'а', 'для', 'то', 'что', 'это', 'не', 'или', 'если'}
+SECTION_HEADERS = ['h1', 'h2', 'h3']
+
+
+def extract_sections(html: str) -> List[dict]:
+    """
+    Извлекает из страницы пары "заголовок -> абзацы под ним" в виде записей базы знаний
+    {"question", "keywords", "answer"}. Функция без состояния, поэтому её можно
+    выполнять в пуле процессов.
+    """
+    soup = BeautifulSoup(html, HTML_PARSER, parse_only=SoupStrainer(SECTION_HEADERS + ['p']))
+    entries = []
+    for header in soup.find_all(SECTION_HEADERS):
+        question = header.get_text(strip=True)
+        if not question:
+            continue
+        if not question.endswith('?'):
+            question += '?'
+        answer_parts = []
+        next_element = header.find_next_sibling()
+        while next_element and next_element.name not in SECTION_HEADERS:
+            if next_element.name == 'p':
+                answer_parts.append(next_element.get_text(strip=True))
+            next_element = next_element.find_next_sibling()
+        answer = "\n".join(part for part in answer_parts if part).strip()
+        if not answer:
+            continue
+        words = [word for word in re.sub(r'[^\w\s]', '', question.lower()).split() if word not in SECTION_STOP_WORDS]
+        keywords = ",".join(list(dict.fromkeys(words))[:3])
+        entries.append({"question": question, "keywords": keywords, "answer": answer})
+    return entries
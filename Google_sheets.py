@@ -1,16 +1,23 @@
+from __future__ import annotations
+import asyncio
+import functools
 import logging
-from typing import List, Dict, Any
+import threading
+import time
+from typing import List, Dict, Any, NamedTuple, Optional, TYPE_CHECKING
 import json
 import os
-import faiss
-import numpy as np
 import gspread
 from google.oauth2.service_account import Credentials
-from sentence_transformers import SentenceTransformer
 from Config import GOOGLE_CREDENTIALS_PATH, SPREADSHEET_ID
+from Tracing import span
+from Metrics import kb_entries, kb_generation
 import re
-import requests
-from bs4 import BeautifulSoup
+
+if TYPE_CHECKING:
+    # numpy, faiss и sentence_transformers (с torch) импортируются при первом использовании:
+    # админ-панели для работы с таблицей они не нужны, а бот загружает модель явно при запуске (App)
+    import faiss
 
 
 # Настройка логирования
@@ -24,15 +31,43 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Инициализация модели для векторизации текста
-logger.info("Инициализация модели SentenceTransformer...")
-model = SentenceTransformer('all-MiniLM-L6-v2')
-logger.info("Модель SentenceTransformer успешно загружена")
+# Модель для векторизации текста загружается при первом обращении (get_model)
+MODEL_NAME = 'all-MiniLM-L6-v2'
+model = None
+_model_lock = threading.Lock()
 
-# Глобальные переменные для хранения базы знаний
+# Глобальные переменные для хранения базы знаний (только для чтения, меняются через _publish)
 knowledge_base: List[Dict[str, Any]] = []
 vector_index: faiss.IndexFlatL2 = None
 questions: List[str] = []
+knowledge_base_modified = ""  # Время изменения таблицы, с которого снят загруженный снимок
+
+
+class KnowledgeSnapshot(NamedTuple):
+    """Записи, вопросы и индекс FAISS одной версии базы знаний."""
+    entries: List[Dict[str, Any]]
+    questions: List[str]
+    index: Optional[faiss.IndexFlatL2]
+
+
+# Опубликованная версия не изменяется: поиск (в том числе в другом потоке) берёт снимок один раз
+# и работает с ним, а изменения строят новые списки и копию индекса и подменяют снимок целиком
+_snapshot = KnowledgeSnapshot([], [], None)
+# Изменения выполняются по одному, каждое — от последней опубликованной версии
+_write_lock = threading.RLock()
+
+def _publish(entries: List[Dict[str, Any]], loaded_questions: List[str], index: Optional[faiss.IndexFlatL2]):
+    global _snapshot, knowledge_base, questions, vector_index
+    _snapshot = KnowledgeSnapshot(entries, loaded_questions, index)
+    knowledge_base, questions, vector_index = entries, loaded_questions, index
+
+def _serialized(func):
+    """Выполняет изменение базы знаний под _write_lock."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _write_lock:
+            return func(*args, **kwargs)
+    return wrapper
 
 # Путь к файлам кеша
 CACHE_DIR = "cache"
@@ -47,6 +82,21 @@ if not os.path.exists(CACHE_DIR):
 # Список стоп-слов (общие слова, которые не несут смысла для поиска)
 STOP_WORDS = {'и', 'в', 'на', 'с', 'по', 'у', 'как', 'все', 'а', 'для', 'то', 'что', 'это', 'не', 'или', 'если'}
 
+def get_model():
+    """
+    Возвращает модель SentenceTransformer, загружая её при первом вызове (несколько секунд и сотни МБ).
+    Блокирующая: из асинхронного кода вызывается через asyncio.to_thread.
+    """
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                logger.info("Инициализация модели SentenceTransformer...")
+                from sentence_transformers import SentenceTransformer
+                model = SentenceTransformer(MODEL_NAME)
+                logger.info("Модель SentenceTransformer успешно загружена")
+    return model
+
 def init_google_sheets():
     """
     Инициализирует подключение к Google Sheets.
@@ -73,6 +123,7 @@ def init_google_sheets():
 
 def save_cache(knowledge_base: List[Dict[str, Any]], questions: List[str], vector_index: faiss.IndexFlatL2, last_modified: str):
     try:
+        import faiss
         with open(KNOWLEDGE_BASE_CACHE, 'w', encoding='utf-8') as f:
             json.dump(knowledge_base, f, ensure_ascii=False, indent=4)
         with open(QUESTIONS_CACHE, 'w', encoding='utf-8') as f:
@@ -93,6 +144,7 @@ def load_cache() -> tuple[List[Dict[str, Any]], faiss.IndexFlatL2, List[str], st
             knowledge_base = json.load(f)
         with open(QUESTIONS_CACHE, 'r', encoding='utf-8') as f:
             questions = json.load(f)
+        import faiss
         vector_index = faiss.read_index(INDEX_CACHE)
         with open(TIMESTAMP_CACHE, 'r', encoding='utf-8') as f:
             last_modified = f.read().strip()
@@ -102,12 +154,13 @@ def load_cache() -> tuple[List[Dict[str, Any]], faiss.IndexFlatL2, List[str], st
         logger.error(f"Ошибка загрузки кеша: {e}")
         return [], None, [], ""
 
+@_serialized
 def load_knowledge_base() -> tuple[List[Dict[str, Any]], faiss.IndexFlatL2, List[str]]:
     """
     Загружает базу знаний из Google Sheets.
+    Записи, вопросы и индекс публикуются вместе (_publish), после векторизации:
+    пока идёт загрузка, поиск видит прежнюю базу, а не записи без индекса.
     """
-    global knowledge_base, vector_index, questions
-
     sheet = init_google_sheets()
     if not sheet:
         logger.error("Не удалось загрузить базу знаний")
@@ -126,261 +179,423 @@ def load_knowledge_base() -> tuple[List[Dict[str, Any]], faiss.IndexFlatL2, List
             if "Keywords" in entry:
                 entry["Keywords"] = str(entry["Keywords"])  # Принудительно преобразуем в строку
 
-        knowledge_base = data
-        questions = [row["Question"] for row in data if "Question" in row and row["Question"]]
-        logger.info(f"Количество вопросов для векторизации: {len(questions)}")
-        if not questions:
+        loaded_questions = [row["Question"] for row in data if "Question" in row and row["Question"]]
+        logger.info(f"Количество вопросов для векторизации: {len(loaded_questions)}")
+        if not loaded_questions:
             logger.warning("Вопросы в базе знаний отсутствуют")
-            return knowledge_base, None, []
+            _publish(data, [], None)
+            return data, None, []
 
         # Векторизация вопросов
+        import faiss
+        import numpy as np
         logger.info("Векторизация вопросов...")
-        question_embeddings = model.encode(questions, show_progress_bar=True)
+        question_embeddings = get_model().encode(loaded_questions, show_progress_bar=True)
         dimension = question_embeddings.shape[1]
-        vector_index = faiss.IndexFlatL2(dimension)
-        vector_index.add(np.array(question_embeddings, dtype=np.float32))
+        loaded_index = faiss.IndexFlatL2(dimension)
+        loaded_index.add(np.array(question_embeddings, dtype=np.float32))
         logger.info("Векторизация завершена")
+        _publish(data, loaded_questions, loaded_index)
 
         # Сохранение кеша
         sheet_metadata = sheet.fetch_sheet_metadata()
         last_modified = sheet_metadata.get('properties', {}).get('modifiedTime', '')
-        save_cache(knowledge_base, questions, vector_index, last_modified)
-        return knowledge_base, vector_index, questions
+        save_cache(data, loaded_questions, loaded_index, last_modified)
+        return data, loaded_index, loaded_questions
     except Exception as e:
         logger.error(f"Ошибка загрузки базы знаний: {e}")
         raise
 
-async def initialize_knowledge_base():
+def publish_kb_metrics():
+    """Обновляет метрики размера и поколения базы знаний после загрузки или изменения."""
+    kb_entries.set(len(knowledge_base))
+    kb_generation.inc()
+
+async def initialize_knowledge_base(prefer_cache: bool = True) -> str:
     """
     Асинхронно инициализирует базу знаний.
+    Сначала берётся снимок с диска (база, вопросы и индекс FAISS из кеша), чтобы бот мог отвечать сразу;
+    Google Sheets загружается, только если снимка нет. Загрузка идёт в потоке и не блокирует цикл событий.
+    Возвращает источник: "cache" или "sheets".
     """
     logger.info("Инициализация базы знаний...")
-    global knowledge_base, vector_index, questions
-    knowledge_base, vector_index, questions = load_knowledge_base()
-    logger.info(f"База знаний инициализирована: {len(knowledge_base)} записей, {len(questions)} вопросов")
+    global knowledge_base_modified
+    source = "sheets"
+    if prefer_cache:
+        cached_knowledge_base, cached_index, cached_questions, last_modified = await asyncio.to_thread(load_cache)
+        if cached_knowledge_base and cached_index is not None and cached_questions:
+            _publish(cached_knowledge_base, cached_questions, cached_index)
+            knowledge_base_modified = last_modified
+            source = "cache"
+    if source == "sheets":
+        await asyncio.to_thread(load_knowledge_base)
+    publish_kb_metrics()
+    logger.info(f"База знаний инициализирована из {'кеша' if source == 'cache' else 'Google Sheets'}: "
+                f"{len(knowledge_base)} записей, {len(questions)} вопросов")
+    return source
+
+@_serialized
+def refresh_knowledge_base() -> bool:
+    """
+    Перезагружает базу знаний из Google Sheets, если таблица изменилась после загруженного снимка.
+    Блокирующая: вызывается в потоке после запуска бота, пока он отвечает по снимку.
+    """
+    global knowledge_base_modified
+    sheet = init_google_sheets()
+    if not sheet:
+        return False
+    try:
+        current = sheet.fetch_sheet_metadata().get('properties', {}).get('modifiedTime', '')
+    except Exception as e:
+        logger.error(f"Ошибка получения метаданных Google Sheets: {e}")
+        return False
+    if current and current == knowledge_base_modified:
+        logger.info("База знаний в Google Sheets не менялась, снимок актуален")
+        return False
+    load_knowledge_base()
+    knowledge_base_modified = current
+    publish_kb_metrics()
+    logger.info(f"База знаний обновлена из Google Sheets: {len(knowledge_base)} записей")
+    return True
 
-async def get_relevant_entries(query: str) -> str:
+WARM_UP_BATCH = ["Как оформить гарантийный ремонт?", "Сроки гарантии на технику"]
+
+def warm_up_encoder():
     """
-    Возвращает наиболее релевантные записи из базы знаний на основе ключевых слов, вопросов и ответов.
+    Прогревает модель и индекс пробным пакетом. Первый вызов encode инициализирует токенизатор
+    и выделяет буферы; без прогрева эта задержка достаётся первому пользователю.
     """
-    global knowledge_base, vector_index, questions
+    import numpy as np
+    embeddings = get_model().encode(WARM_UP_BATCH, show_progress_bar=False)
+    index = _snapshot.index
+    if index is not None and index.ntotal:
+        index.search(np.array(embeddings[:1], dtype=np.float32), 3)
+    logger.info(f"Кодировщик прогрет пакетом из {len(WARM_UP_BATCH)} запросов")
 
-    logger.info(f"Проверка состояния базы знаний перед поиском: knowledge_base={len(knowledge_base)} записей, questions={len(questions)} вопросов, vector_index={'загружен' if vector_index is not None else 'не загружен'}")
+NOT_LOADED_MESSAGE = "База знаний недоступна. Попробуй позже! 😔"
+NOT_FOUND_MESSAGE = "Не нашёл подходящих записей в базе знаний. Попробуй переформулировать вопрос! 😅"
+SEARCH_ERROR_MESSAGE = "Произошла ошибка при поиске в базе знаний. Попробуй позже! 😔"
+
+KB_RETRY_DELAY = 30  # Пауза перед повторной загрузкой базы знаний после неудачи, сек
 
-    if not knowledge_base or vector_index is None or not questions:
-        logger.warning("База знаний не загружена, выполняется загрузка...")
-        loaded_knowledge_base, loaded_vector_index, loaded_questions = load_knowledge_base()
-        if not loaded_knowledge_base or loaded_vector_index is None or not loaded_questions:
-            logger.error("Не удалось загрузить базу знаний")
-            return "База знаний недоступна. Попробуй позже! 😔"
-        knowledge_base, vector_index, questions = loaded_knowledge_base, loaded_vector_index, loaded_questions
-        logger.info(f"База знаний загружена: {len(knowledge_base)} записей, {len(questions)} вопросов")
+_kb_load: Optional[asyncio.Task] = None
+_kb_retry_at = 0.0
 
+def knowledge_base_loaded() -> bool:
+    snapshot = _snapshot
+    return bool(snapshot.entries) and snapshot.index is not None and bool(snapshot.questions)
+
+async def _load_knowledge_base_once() -> bool:
+    global _kb_retry_at
+    logger.warning("База знаний не загружена, выполняется загрузка...")
     try:
-        # Предобработка запроса
-        query_lower = re.sub(r'[^\w\s]', '', query.lower()).strip()
-        query_words = set(query_lower.split()) - STOP_WORDS  # Удаляем стоп-слова
-        logger.info(f"Предобработанный запрос: {query_lower}, слова: {query_words}")
-
-        # Поиск по ключевым словам, вопросам и ответам
-        relevant_entries = []
-        for idx, entry in enumerate(knowledge_base):
-            question = entry.get("Question", "Вопрос отсутствует")
-            answer = entry.get("Answer", "Ответ отсутствует")
-
-            # Обрабатываем Keywords
-            keywords_raw = entry.get("Keywords", "")
-            if not isinstance(keywords_raw, str):
-                logger.warning(f"Некорректный тип данных для Keywords в записи {idx}: {keywords_raw} (тип: {type(keywords_raw)}). Преобразуем в строку.")
-                keywords_raw = str(keywords_raw)
-            keywords = keywords_raw.lower().split(",")
-            keywords = [kw.strip() for kw in keywords if kw.strip()]
-            keywords_set = set(keywords) - STOP_WORDS
-
-            # Обрабатываем Question
-            question_lower = re.sub(r'[^\w\s]', '', question.lower()).strip()
-            question_words = set(question_lower.split()) - STOP_WORDS
-
-            # Обрабатываем Answer
-            answer_lower = re.sub(r'[^\w\s]', '', answer.lower()).strip()
-            answer_words = set(answer_lower.split()) - STOP_WORDS
-
-            # Проверяем совпадения
-            matched_keywords = [kw for kw in keywords_set if kw in query_words]
-            matched_question_words = [word for word in question_words if word in query_words]
-            matched_answer_words = [word for word in answer_words if word in query_words]
-
-            # Рассчитываем релевантность
-            # Даём разный вес совпадениям: Keywords - 1.0, Question - 0.8, Answer - 0.6
-            keyword_score = len(matched_keywords) / (len(keywords_set) if keywords_set else 1) * 1.0
-            question_score = len(matched_question_words) / (len(question_words) if question_words else 1) * 0.8
-            answer_score = len(matched_answer_words) / (len(answer_words) if answer_words else 1) * 0.6
-            total_score = keyword_score + question_score + answer_score
-
-            # Устанавливаем порог релевантности
-            RELEVANCE_THRESHOLD = 0.5
-            if total_score < RELEVANCE_THRESHOLD:
-                continue
-
-            # Если есть совпадения, добавляем запись
-            if matched_keywords or matched_question_words or matched_answer_words:
-                # Обрезаем ответ до 1000 символов
-                if len(answer) > 1000:
-                    answer = answer[:1000] + "..."
-                relevant_entries.append({
-                    "question": question,
-                    "answer": answer,
-                    "matched_keywords": matched_keywords,
-                    "matched_question_words": matched_question_words,
-                    "matched_answer_words": matched_answer_words,
-                    "score": total_score
-                })
-                logger.info(
-                    f"Найдена запись: Вопрос: {question}, "
-                    f"Совпавшие ключевые слова: {matched_keywords}, "
-                    f"Совпавшие слова в вопросе: {matched_question_words}, "
-                    f"Совпавшие слова в ответе: {matched_answer_words}, "
-                    f"Общая оценка: {total_score:.2f}"
-                )
-
-        # Сортируем записи по релевантности
-        relevant_entries = sorted(relevant_entries, key=lambda x: x["score"], reverse=True)
+        # Загрузка блокирующая (Google Sheets + векторизация), выносим её из цикла событий
+        with span("kb.load"):
+            await asyncio.to_thread(load_knowledge_base)
+    except Exception as e:
+        logger.error(f"Ошибка загрузки базы знаний: {e}")
+    if not knowledge_base_loaded():
+        _kb_retry_at = time.monotonic() + KB_RETRY_DELAY
+        logger.error(f"Не удалось загрузить базу знаний, следующая попытка не раньше чем через {KB_RETRY_DELAY} сек")
+        return False
+    publish_kb_metrics()
+    logger.info(f"База знаний загружена: {len(knowledge_base)} записей, {len(questions)} вопросов")
+    return True
+
+async def ensure_knowledge_base() -> bool:
+    """
+    Загружает базу знаний, если она ещё не загружена. False — загрузить не удалось.
+    Одновременные запросы ждут одну общую загрузку; отмена ожидающего запроса (бюджет контекста)
+    её не прерывает. После неудачи новая попытка — не раньше чем через KB_RETRY_DELAY.
+    """
+    global _kb_load
+    if knowledge_base_loaded():
+        return True
+    logger.info(f"Проверка состояния базы знаний перед поиском: knowledge_base={len(knowledge_base)} записей, questions={len(questions)} вопросов, vector_index={'загружен' if vector_index is not None else 'не загружен'}")
+    if _kb_load is None or _kb_load.done():
+        if time.monotonic() < _kb_retry_at:
+            return False
+        _kb_load = asyncio.create_task(_load_knowledge_base_once())
+    return await asyncio.shield(_kb_load)
+
+def keyword_entries(query: str, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Записи из entries, совпавшие с запросом по ключевым словам, вопросу и ответу, по убыванию релевантности.
+    """
+    # Предобработка запроса
+    query_lower = re.sub(r'[^\w\s]', '', query.lower()).strip()
+    query_words = set(query_lower.split()) - STOP_WORDS  # Удаляем стоп-слова
+    logger.info(f"Предобработанный запрос: {query_lower}, слова: {query_words}")
+
+    # Поиск по ключевым словам, вопросам и ответам
+    relevant_entries = []
+    for idx, entry in enumerate(entries):
+        question = entry.get("Question", "Вопрос отсутствует")
+        answer = entry.get("Answer", "Ответ отсутствует")
+
+        # Обрабатываем Keywords
+        keywords_raw = entry.get("Keywords", "")
+        if not isinstance(keywords_raw, str):
+            logger.warning(f"Некорректный тип данных для Keywords в записи {idx}: {keywords_raw} (тип: {type(keywords_raw)}). Преобразуем в строку.")
+            keywords_raw = str(keywords_raw)
+        keywords = keywords_raw.lower().split(",")
+        keywords = [kw.strip() for kw in keywords if kw.strip()]
+        keywords_set = set(keywords) - STOP_WORDS
+
+        # Обрабатываем Question
+        question_lower = re.sub(r'[^\w\s]', '', question.lower()).strip()
+        question_words = set(question_lower.split()) - STOP_WORDS
+
+        # Обрабатываем Answer
+        answer_lower = re.sub(r'[^\w\s]', '', answer.lower()).strip()
+        answer_words = set(answer_lower.split()) - STOP_WORDS
+
+        # Проверяем совпадения
+        matched_keywords = [kw for kw in keywords_set if kw in query_words]
+        matched_question_words = [word for word in question_words if word in query_words]
+        matched_answer_words = [word for word in answer_words if word in query_words]
+
+        # Рассчитываем релевантность
+        # Даём разный вес совпадениям: Keywords - 1.0, Question - 0.8, Answer - 0.6
+        keyword_score = len(matched_keywords) / (len(keywords_set) if keywords_set else 1) * 1.0
+        question_score = len(matched_question_words) / (len(question_words) if question_words else 1) * 0.8
+        answer_score = len(matched_answer_words) / (len(answer_words) if answer_words else 1) * 0.6
+        total_score = keyword_score + question_score + answer_score
+
+        # Устанавливаем порог релевантности
+        RELEVANCE_THRESHOLD = 0.5
+        if total_score < RELEVANCE_THRESHOLD:
+            continue
+
+        # Если есть совпадения, добавляем запись
+        if matched_keywords or matched_question_words or matched_answer_words:
+            # Обрезаем ответ до 1000 символов
+            if len(answer) > 1000:
+                answer = answer[:1000] + "..."
+            relevant_entries.append({
+                "question": question,
+                "answer": answer,
+                "matched_keywords": matched_keywords,
+                "matched_question_words": matched_question_words,
+                "matched_answer_words": matched_answer_words,
+                "score": total_score
+            })
+            logger.info(
+                f"Найдена запись: Вопрос: {question}, "
+                f"Совпавшие ключевые слова: {matched_keywords}, "
+                f"Совпавшие слова в вопросе: {matched_question_words}, "
+                f"Совпавшие слова в ответе: {matched_answer_words}, "
+                f"Общая оценка: {total_score:.2f}"
+            )
+
+    # Сортируем записи по релевантности
+    return sorted(relevant_entries, key=lambda x: x["score"], reverse=True)
+
+def vector_entries(entries: List[Dict[str, Any]], distances, indices) -> List[Dict[str, Any]]:
+    """
+    Записи из entries по результату поиска в индексе FAISS той же версии базы
+    для одного запроса (строки distances и indices).
+    """
+    relevant_entries = []
+    VECTOR_RELEVANCE_THRESHOLD = 0.1  # Снижаем порог для векторизации
+    for idx, distance in zip(indices, distances):
+        if idx >= len(entries):
+            logger.warning(f"Индекс {idx} вне диапазона knowledge_base (длина: {len(entries)})")
+            continue
+        entry = entries[idx]
+        question = entry.get("Question", "Вопрос отсутствует")
+        answer = entry.get("Answer", "Ответ отсутствует")
+        keywords_raw = entry.get("Keywords", "")
+        if not isinstance(keywords_raw, str):
+            logger.warning(f"Некорректный тип данных для Keywords в записи {idx} (векторизация): {keywords_raw} (тип: {type(keywords_raw)}). Преобразуем в строку.")
+            keywords_raw = str(keywords_raw)
+        keywords = keywords_raw.lower()
+
+        # Проверяем релевантность по расстоянию
+        if distance > VECTOR_RELEVANCE_THRESHOLD:
+            logger.info(f"Запись отклонена (векторизация): Вопрос: {question}, Расстояние: {distance}")
+            continue
+
+        # Обрезаем ответ до 1000 символов
+        if len(answer) > 1000:
+            answer = answer[:1000] + "..."
+
+        relevant_entries.append({
+            "question": question,
+            "answer": answer,
+            "matched_keywords": [],
+            "matched_question_words": [],
+            "matched_answer_words": [],
+            "score": 1 - distance  # Оценка релевантности на основе расстояния
+        })
+        logger.info(f"Найдена запись по векторизации: Вопрос: {question}, Ответ: {answer}, Расстояние: {distance}")
+
+    return relevant_entries
+
+def format_entries(relevant_entries: List[Dict[str, Any]]) -> str:
+    """Текст для модели: топ-3 записи (или меньше, если найдено меньше)."""
+    if not relevant_entries:
+        logger.warning("Релевантные записи не найдены")
+        return NOT_FOUND_MESSAGE
+    result = ""
+    for i, entry in enumerate(relevant_entries[:3]):
+        result += f"Запись {i+1}:\nВопрос: {entry['question']}\nОтвет: {entry['answer']}\n\n"
+    logger.info(f"Передаём в Groq следующие данные из базы знаний:\n{result}")
+    return result
+
+async def search_many(queries: List[str]) -> List[str]:
+    """
+    Ищет записи для пачки запросов. Запросы без совпадений по словам векторизуются одним вызовом
+    encode и ищутся в индексе одним вызовом search — так пачка стоит почти как один запрос.
+    """
+    if not await ensure_knowledge_base():
+        return [NOT_LOADED_MESSAGE] * len(queries)
+    # Записи и индекс одной версии, даже если во время поиска база изменится
+    snapshot = _snapshot
+    try:
+        results = [keyword_entries(query, snapshot.entries) for query in queries]
 
         # Если ничего не найдено, используем векторизацию
-        if not relevant_entries:
-            logger.info("Совпадений по словам не найдено, переходим к векторизации")
-            query_embedding = model.encode([query])[0]
-            query_embedding = np.array([query_embedding], dtype=np.float32)
+        misses = [position for position, entries in enumerate(results) if not entries]
+        if misses:
+            logger.info(f"Совпадений по словам не найдено для {len(misses)} из {len(queries)} запросов, переходим к векторизации")
+            import numpy as np
+            with span("kb.encode"):
+                encoder = await asyncio.to_thread(get_model)
+                embeddings = await asyncio.to_thread(encoder.encode, [queries[position] for position in misses])
+            embeddings = np.array(embeddings, dtype=np.float32)
 
             # Поиск ближайших записей (топ-3)
-            distances, indices = vector_index.search(query_embedding, 3)
-
-            VECTOR_RELEVANCE_THRESHOLD = 0.1  # Снижаем порог для векторизации
-            for idx, distance in zip(indices[0], distances[0]):
-                if idx >= len(knowledge_base):
-                    logger.warning(f"Индекс {idx} вне диапазона knowledge_base (длина: {len(knowledge_base)})")
-                    continue
-                entry = knowledge_base[idx]
-                question = entry.get("Question", "Вопрос отсутствует")
-                answer = entry.get("Answer", "Ответ отсутствует")
-                keywords_raw = entry.get("Keywords", "")
-                if not isinstance(keywords_raw, str):
-                    logger.warning(f"Некорректный тип данных для Keywords в записи {idx} (векторизация): {keywords_raw} (тип: {type(keywords_raw)}). Преобразуем в строку.")
-                    keywords_raw = str(keywords_raw)
-                keywords = keywords_raw.lower()
-
-                # Проверяем релевантность по расстоянию
-                if distance > VECTOR_RELEVANCE_THRESHOLD:
-                    logger.info(f"Запись отклонена (векторизация): Вопрос: {question}, Расстояние: {distance}")
-                    continue
-
-                # Обрезаем ответ до 1000 символов
-                if len(answer) > 1000:
-                    answer = answer[:1000] + "..."
-                
-                relevant_entries.append({
-                    "question": question,
-                    "answer": answer,
-                    "matched_keywords": [],
-                    "matched_question_words": [],
-                    "matched_answer_words": [],
-                    "score": 1 - distance  # Оценка релевантности на основе расстояния
-                })
-                logger.info(f"Найдена запись по векторизации: Вопрос: {question}, Ответ: {answer}, Расстояние: {distance}")
-
-        # Формируем результат
-        if not relevant_entries:
-            logger.warning("Релевантные записи не найдены")
-            return "Не нашёл подходящих записей в базе знаний. Попробуй переформулировать вопрос! 😅"
-
-        # Берём топ-3 записи (или меньше, если найдено меньше)
-        result = ""
-        for i, entry in enumerate(relevant_entries[:3]):
-            result += f"Запись {i+1}:\nВопрос: {entry['question']}\nОтвет: {entry['answer']}\n\n"
-        logger.info(f"Передаём в Groq следующие данные из базы знаний:\n{result}")
-        return result
+            with span("kb.index_search"):
+                distances, indices = await asyncio.to_thread(snapshot.index.search, embeddings, 3)
+            for row, position in enumerate(misses):
+                results[position] = vector_entries(snapshot.entries, distances[row], indices[row])
+
+        return [format_entries(entries) for entries in results]
     except Exception as e:
         logger.error(f"Ошибка при поиске релевантных записей: {e}")
-        return "Произошла ошибка при поиске в базе знаний. Попробуй позже! 😔"
+        return [SEARCH_ERROR_MESSAGE] * len(queries)
+
+async def get_relevant_entries(query: str) -> str:
+    """
+    Возвращает наиболее релевантные записи из базы знаний на основе ключевых слов, вопросов и ответов.
+    """
+    return (await search_many([query]))[0]
 
-def add_to_knowledge_base(question: str, keywords: str, answer: str):
+def add_to_knowledge_base(question: str, keywords: str, answer: str) -> bool:
     """
-    Добавляет новую запись в базу знаний в Google Sheets.
+    Добавляет новую запись в базу знаний в Google Sheets и обновляет локальную базу, индекс и кеш.
+    """
+    return add_many_to_knowledge_base([{"question": question, "keywords": keywords, "answer": answer}])
+
+@_serialized
+def add_many_to_knowledge_base(entries: List[Dict[str, str]]) -> bool:
     """
+    Добавляет пачку записей {"question", "keywords", "answer"} в Google Sheets одним запросом
+    и обновляет локальную базу знаний, векторный индекс и кеш (одна векторизация на пачку).
+    Новая версия базы строится рядом с текущей (копия индекса) и публикуется после векторизации.
+    """
+    if not entries:
+        return True
     try:
         sheet = init_google_sheets()
         if not sheet:
-            logger.error("Не удалось подключиться к Google Sheets для добавления записи")
-            return
-        
-        sheet.sheet1.append_row([question, keywords, answer])
-        logger.info(f"Добавлена новая запись: Вопрос: {question}, Ключевые слова: {keywords}")
+            logger.error("Не удалось подключиться к Google Sheets для добавления записей")
+            return False
+
+        sheet.sheet1.append_rows([[entry["question"], entry["keywords"], entry["answer"]] for entry in entries])
+        logger.info(f"В Google Sheets добавлено записей: {len(entries)}")
+
+        snapshot = _snapshot
+        new_questions = [entry["question"] for entry in entries]
+        new_entries = [
+            {"Question": entry["question"], "Keywords": entry["keywords"], "Answer": entry["answer"]}
+            for entry in entries
+        ]
+
+        # Индекс обновляем, только если он уже построен; иначе он будет построен при загрузке
+        index = snapshot.index
+        if index is not None:
+            import faiss
+            import numpy as np
+            new_embeddings = get_model().encode(new_questions)
+            index = faiss.clone_index(index)
+            index.add(np.array(new_embeddings, dtype=np.float32))
+        _publish(snapshot.entries + new_entries, snapshot.questions + new_questions, index)
+        publish_kb_metrics()
+
+        if index is not None:
+            sheet_metadata = sheet.fetch_sheet_metadata()
+            last_modified = sheet_metadata.get('properties', {}).get('modifiedTime', '')
+            save_cache(knowledge_base, questions, index, last_modified)
+        return True
     except Exception as e:
-        logger.error(f"Ошибка добавления записи в базу знаний: {e}")
-        raise
+        logger.error(f"Ошибка при пакетном добавлении записей в базу знаний: {e}")
+        return False
 
+@_serialized
+def delete_from_knowledge_base(index: int) -> bool:
+    """
+    Удаляет запись с номером index (как в get_all_records) из Google Sheets и из загруженной базы.
+    Индекс FAISS нумерует векторы по порядку вопросов, поэтому удаление сдвигает номера так же, как в списке;
+    если вопросы не сопоставлены записям один к одному, индекс перестраивается загрузкой из таблицы.
+    """
+    sheet = init_google_sheets()
+    if not sheet:
+        logger.error("Не удалось подключиться к Google Sheets для удаления записи")
+        return False
     try:
-        # Добавляем запись в Google Sheets
-        sheet.sheet1.append_row([question, keywords, answer])
-        logger.info(f"Новая запись добавлена в Google Sheets: {question}")
-
-        # Обновляем локальную базу знаний и кеш
-        global knowledge_base, vector_index, questions
-        knowledge_base.append({"Question": question, "Keywords": keywords, "Answer": answer})
-        questions.append(question)
-
-        # Обновляем векторный индекс
-        new_embedding = model.encode([question])[0]
-        vector_index.add(np.array([new_embedding], dtype=np.float32))
-
-        # Сохраняем обновлённый кеш
-        sheet_metadata = sheet.fetch_sheet_metadata()
-        last_modified = sheet_metadata.get('properties', {}).get('modifiedTime', '')
-        save_cache(knowledge_base, questions, vector_index, last_modified)
-
-        logger.info(f"База знаний обновлена: добавлена запись '{question}'")
+        sheet.sheet1.delete_rows(index + 2)  # +2 учитывает заголовок и нумерацию строк с 1
+        logger.info(f"Из Google Sheets удалена запись {index}")
+        snapshot = _snapshot
+        if 0 <= index < len(snapshot.entries):
+            aligned = (snapshot.index is not None
+                       and len(snapshot.questions) == len(snapshot.entries) == snapshot.index.ntotal)
+            if aligned:
+                import faiss
+                import numpy as np
+                new_index = faiss.clone_index(snapshot.index)
+                new_index.remove_ids(np.array([index], dtype=np.int64))
+                _publish(snapshot.entries[:index] + snapshot.entries[index + 1:],
+                         snapshot.questions[:index] + snapshot.questions[index + 1:], new_index)
+                sheet_metadata = sheet.fetch_sheet_metadata()
+                save_cache(knowledge_base, questions, new_index,
+                           sheet_metadata.get('properties', {}).get('modifiedTime', ''))
+            else:
+                load_knowledge_base()
+            publish_kb_metrics()
         return True
     except Exception as e:
-        logger.error(f"Ошибка при добавлении записи в базу знаний: {e}")
+        logger.error(f"Ошибка удаления записи {index} из базы знаний: {e}")
         return False
 
+def fetch_entries() -> List[Dict[str, Any]]:
+    """Записи таблицы без векторизации (для просмотра в админ-панели)."""
+    sheet = init_google_sheets()
+    if not sheet:
+        return []
+    data = sheet.sheet1.get_all_records()
+    for entry in data:
+        if "Keywords" in entry:
+            entry["Keywords"] = str(entry["Keywords"])
+    return data
+
+def kb_stats() -> Dict[str, Any]:
+    snapshot = _snapshot
+    return {
+        "entries": len(snapshot.entries),
+        "questions": len(snapshot.questions),
+        "vectors": snapshot.index.ntotal if snapshot.index is not None else 0,
+        "model_loaded": model is not None,
+        "modified": knowledge_base_modified,
+    }
+
 async def parse_and_add_to_sheet(url: str) -> bool:
     """
     Парсит указанный сайт, извлекает вопросы, ключевые слова и ответы, и добавляет их в Google Sheets.
+    Использует асинхронный краулер (Crawler.py). Страница разбирается заново, даже если уже обрабатывалась:
+    повторный разбор запрошен явно, а разделы, уже попавшие в базу, отсеиваются по хэшу содержимого.
     """
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        # Ищем заголовки (вопросы) и текст (ответы)
-        entries = []
-        for header in soup.find_all(['h1', 'h2', 'h3']):
-            question = header.get_text(strip=True)
-            if not question.endswith('?'):
-                question += '?'
-            answer = ""
-            next_element = header.find_next_sibling()
-            while next_element and next_element.name not in ['h1', 'h2', 'h3']:
-                if next_element.name == 'p':
-                    answer += next_element.get_text(strip=True) + "\n"
-                next_element = next_element.find_next_sibling()
-            answer = answer.strip()
-            if not answer:
-                continue
-            # Извлекаем ключевые слова из вопроса
-            keywords = ",".join(set(re.sub(r'[^\w\s]', '', question.lower()).split()) - STOP_WORDS)[:3]
-            entries.append({"question": question, "keywords": keywords, "answer": answer})
-
-        # Добавляем записи в Google Sheets
-        for entry in entries:
-            success = add_to_knowledge_base(entry["question"], entry["keywords"], entry["answer"])
-            if not success:
-                logger.error(f"Не удалось добавить запись: {entry['question']}")
-                return False
-
-        logger.info(f"Успешно добавлено {len(entries)} записей из сайта {url}")
-        return True
-    except Exception as e:
-        logger.error(f"Ошибка при парсинге сайта {url}: {e}")
-        return False
\ No newline at end of file
+    from Crawler import crawl
+    report = await crawl(urls=[url], force=True)
+    return report["failed"] == 0
@@ -6,8 +6,14 @@ from aiogram import Bot, Dispatcher, types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup
 from Utils import process_message, split_message, is_russian_text
 from Config import GROUP_ID, GROUP_INVITE_LINK
+from Membership import is_user_in_group, register_membership_handlers
 from Keyboards import get_reaction_keyboard, get_main_keyboard, get_instruction_keyboard
-from Prompts import load_prompts
+from Prompts import get_prompts, get_matcher
+from Send_queue import send_queue, PRIORITY_FIRST, PRIORITY_FOLLOWUP
+from Admission import admission, ADMITTED, BUSY
+from Dialog_context import dialog_context
+from Tracing import start_request, span
+from Metrics import messages_total
 
 # Настройка логирования
 logging.basicConfig(
@@ -27,25 +33,6 @@ feedback_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %
 feedback_logger.addHandler(feedback_handler)
 feedback_logger.setLevel(logging.INFO)
 
-# Глобальное хранилище контекста диалогов
-dialog_context = {}  # {user_id: [{"role": "user", "content": "вопрос"}, {"role": "assistant", "content": "ответ"}]}
-
-# Загружаем простые диалоги и системные настройки
-prompts_data = load_prompts()
-simple_dialogs = prompts_data["dialogs"]
-system_settings = prompts_data["settings"]
-
-async def is_user_in_group(bot: Bot, user_id: int, group_id: str) -> bool:
-    """
-    Проверяет, состоит ли пользователь в указанной группе.
-    """
-    try:
-        member = await bot.get_chat_member(chat_id=group_id, user_id=user_id)
-        return member.status in ["member", "administrator", "creator"]
-    except Exception as e:
-        logger.error(f"Ошибка проверки членства в группе {group_id} для пользователя {user_id}: {e}")
-        return False
-
 def create_subscription_keyboard() -> InlineKeyboardMarkup:
     """
     Создаёт клавиатуру с кнопкой для подписки на закрытую группу.
@@ -61,8 +48,20 @@ def register_handlers(dp: Dispatcher):
     """
     logger.info("Начало регистрации обработчиков...")
 
+    # Кэш членства в группе обновляется из обновлений chat_member
+    register_membership_handlers(dp)
+
     @dp.message()
     async def handle_message(message: types.Message, bot: Bot):
+        """
+        Обрабатывает входящие текстовые сообщения в рамках трассы запроса (Tracing.py).
+        """
+        messages_total.inc(chat_type=message.chat.type)
+        with start_request("message", chat_type=message.chat.type) as request:
+            logger.info(f"Запрос {request.request_id}: сообщение от {message.from_user.id}")
+            await answer_message(message, bot)
+
+    async def answer_message(message: types.Message, bot: Bot):
         """
         Обрабатывает входящие текстовые сообщения, передавая всю логику в process_message.
         """
@@ -77,115 +76,154 @@ def register_handlers(dp: Dispatcher):
                 logger.info(f"Сообщение в группе не содержит слово 'Зелёный': {message.text}")
                 return
 
-            user_in_group = await is_user_in_group(bot, message.from_user.id, GROUP_ID)
+            with span("membership"):
+                user_in_group = await is_user_in_group(bot, message.from_user.id, GROUP_ID)
             if not user_in_group:
                 logger.info(f"Пользователь {message.from_user.id} не состоит в группе {GROUP_ID}")
                 keyboard = create_subscription_keyboard()
-                await message.reply(
-                    "Чтобы использовать бота в группах, пожалуйста, подпишитесь на нашу закрытую группу.",
-                    reply_markup=keyboard
+                await send_queue.reply(
+                    message, "Чтобы использовать бота в группах, пожалуйста, подпишитесь на нашу закрытую группу.",
+                    reply_markup=keyboard, priority=PRIORITY_FIRST
                 )
                 return
 
-        # Показываем "Зелёный пишет..."
-        typing_message = await message.reply("Зелёный пишет…")
-        await asyncio.sleep(1)
-
+        user_id = message.from_user.id
         query = message.text.strip().lower()
         if not query:
-            await typing_message.edit_text("Пожалуйста, отправьте текстовый запрос.")
+            await send_queue.reply(message, "Пожалуйста, отправьте текстовый запрос.", priority=PRIORITY_FIRST)
             return
 
         # Проверяем, что запрос состоит преимущественно из русских символов
         if not is_russian_text(query):
-            await typing_message.edit_text(
+            await send_queue.reply(
+                message,
                 "Запрос содержит слишком много символов не на русском языке. "
-                "Пожалуйста, переформулируйте запрос, используя только русский язык! 😔"
+                "Пожалуйста, переформулируйте запрос, используя только русский язык! 😔",
+                priority=PRIORITY_FIRST
             )
             return
 
         # Обработка нажатий на кнопки основной клавиатуры
         if query == "новый диалог":
-            user_id = message.from_user.id
-            if user_id in dialog_context:
-                del dialog_context[user_id]
+            await dialog_context.clear(user_id)
             main_keyboard = get_main_keyboard()
-            await typing_message.delete()
-            await message.reply("Контекст диалога очищен. Новый диалог начат! Задавайте вопросы! 😊",
-                               reply_markup=main_keyboard)
+            await send_queue.reply(message, "Контекст диалога очищен. Новый диалог начат! Задавайте вопросы! 😊",
+                                   priority=PRIORITY_FIRST, reply_markup=main_keyboard)
             return
 
         elif query == "о боте":
             main_keyboard = get_main_keyboard()
-            await typing_message.delete()
-            await message.reply(
+            system_settings = get_prompts()["settings"]
+            await send_queue.reply(
+                message,
                 f"Я {system_settings['name']}, {system_settings['role']}! "
                 f"Моя цель: {system_settings['goal']}. Чем могу помочь? 😄",
-                reply_markup=main_keyboard
+                reply_markup=main_keyboard, priority=PRIORITY_FIRST
             )
             return
 
         elif query == "помощь":
             instruction_keyboard = get_instruction_keyboard()
             main_keyboard = get_main_keyboard()
-            await typing_message.edit_text(
-                "Чтобы подробнее разобраться в функционале, откройте инструкцию.",
-                reply_markup=instruction_keyboard
+            await send_queue.reply(
+                message, "Чтобы подробнее разобраться в функционале, откройте инструкцию.",
+                reply_markup=instruction_keyboard, priority=PRIORITY_FIRST
             )
-            await message.reply("Выберите действие:", reply_markup=main_keyboard)
+            await send_queue.reply(message, "Выберите действие:", reply_markup=main_keyboard, priority=PRIORITY_FIRST)
             return
 
-        # Добавляем сообщение в контекст
-        user_id = message.from_user.id
-        if user_id not in dialog_context:
-            dialog_context[user_id] = []
-        dialog_context[user_id].append({"role": "user", "content": query})
-
-        # Проверяем простые диалоги (частичное совпадение)
-        for key, response in simple_dialogs.items():
-            if key in query:  # Проверяем, содержится ли ключ в запросе
-                reaction_keyboard = get_reaction_keyboard(message.message_id)
-                await typing_message.edit_text(response, reply_markup=reaction_keyboard)
-                dialog_context[user_id].append({"role": "assistant", "content": response})
-                return
+        user_entry = {"role": "user", "content": query}
+
+        # Проверяем простые диалоги (частичное совпадение, один проход автомата по запросу)
+        response = get_matcher().match_dialog(query)
+        if response is not None:
+            reaction_keyboard = get_reaction_keyboard(message.message_id)
+            await send_queue.reply(message, response, priority=PRIORITY_FIRST, reply_markup=reaction_keyboard)
+            await dialog_context.append(user_id, user_entry, {"role": "assistant", "content": response})
+            return
+
+        # "Зелёный пишет..." (все отправки идут через очередь с учётом лимитов Telegram).
+        # Показывается только запросам, которые будут обработаны или ждут очереди допуска
+        typing_message = None
+
+        async def show_placeholder():
+            nonlocal typing_message
+            with span("placeholder"):
+                typing_message = await send_queue.reply(message, "Зелёный пишет…", priority=PRIORITY_FIRST)
+
+        async def reply_or_edit(text: str):
+            if typing_message is None:
+                await send_queue.reply(message, text, priority=PRIORITY_FIRST)
+            else:
+                await send_queue.edit_text(typing_message, text)
+
+        # Допуск к обработке: ограничение запросов на пользователя и общее число одновременных.
+        # Проверяется до заглушки, чтобы при переполнении пользователь сразу получил отказ
+        with span("admission"):
+            status = await admission.acquire(user_id, on_wait=show_placeholder)
+        if status != ADMITTED:
+            if status == BUSY:
+                await reply_or_edit("Сейчас я отвечаю слишком многим. Пожалуйста, повторите вопрос через минуту. 🙏")
+            else:
+                # Пользователь прислал новый вопрос, пока этот ждал очереди
+                await reply_or_edit("Отвечаю на ваш следующий вопрос… 😊")
+            return
 
         # Передаём запрос в process_message
         try:
-            response = await process_message(query)
+            # Место освобождается сразу после ответа модели: отправку частей ведёт очередь Send_queue
+            try:
+                if typing_message is None:
+                    await show_placeholder()
+                # Добавляем сообщение в контекст
+                await dialog_context.append(user_id, user_entry)
+                with span("process_message"):
+                    response = await process_message(query)
+            finally:
+                admission.release(user_id)
             reaction_keyboard = get_reaction_keyboard(message.message_id)
             message_parts = split_message(response)
-            for i, part in enumerate(message_parts):
-                if i == 0:
-                    await typing_message.edit_text(part, reply_markup=reaction_keyboard)
-                else:
-                    await message.reply(part)
-            dialog_context[user_id].append({"role": "assistant", "content": response})
-            if len(dialog_context[user_id]) > 10:
-                dialog_context[user_id] = dialog_context[user_id][-10:]
+            # Первая часть заменяет "Зелёный пишет…" и уходит вне очереди продолжений других ответов
+            sends = [send_queue.edit_text(typing_message, message_parts[0], reply_markup=reaction_keyboard,
+                                          priority=PRIORITY_FIRST)]
+            sends.extend(send_queue.reply(message, part, priority=PRIORITY_FOLLOWUP) for part in message_parts[1:])
+            with span("send", parts=len(message_parts)):
+                await asyncio.gather(*sends)
+            await dialog_context.append(user_id, {"role": "assistant", "content": response})
         except Exception as e:
             logger.error(f"Ошибка обработки запроса: {e}")
-            await typing_message.edit_text("Произошла ошибка. Пожалуйста, уточните запрос или переформулируйте вопрос. 😔")
+            await reply_or_edit("Произошла ошибка. Пожалуйста, уточните запрос или переформулируйте вопрос. 😔")
 
     @dp.callback_query(lambda c: c.data.startswith("reaction_"))
     async def handle_reaction(callback: types.CallbackQuery):
-        reaction, message_id = callback.data.split("_")[1], callback.data.split("_")[2]
+        parts = callback.data.split("_")
+        reaction = parts[1]
+        if len(parts) > 2:
+            # Старый формат callback_data: reaction_<up|down>_<message_id>
+            message_id = parts[2]
+        else:
+            # Сообщение пользователя, на которое бот ответил
+            replied = callback.message.reply_to_message
+            message_id = replied.message_id if replied else callback.message.message_id
         user_id = callback.from_user.id
         feedback_logger.info(f"Пользователь {user_id} оценил сообщение {message_id}: {reaction}")
-        await callback.message.edit_text(f"{callback.message.text}\n\nСпасибо за ваш отзыв! 😊")
+        # Ответ на callback не идёт через очередь: Telegram ждёт его, чтобы убрать индикатор на кнопке
         await callback.answer()
+        await send_queue.edit_text(callback.message, f"{callback.message.text}\n\nСпасибо за ваш отзыв! 😊")
 
     @dp.callback_query()
     async def handle_callback(callback: types.CallbackQuery):
         logger.info(f"Получен callback от {callback.from_user.id}: {callback.data}")
+        await callback.answer()
         if callback.data == "instruction":
             main_keyboard = get_main_keyboard()
-            await callback.message.edit_text(
+            await send_queue.edit_text(
+                callback.message,
                 "Инструкция по использованию бота:\n"
                 "1. В личных чатах задавайте любые вопросы.\n"
                 "2. В группах используйте слово 'Зелёный'.\n"
                 "3. Подпишитесь на нашу закрытую группу для полного доступа.",
                 reply_markup=None
             )
-        await callback.answer()
 
     logger.info("Обработчики успешно зарегистрированы")
\ No newline at end of file
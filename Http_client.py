@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import time
+from typing import Optional, Tuple
+from urllib.parse import urlsplit
+import aiohttp
+from Tracing import span
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/http_client.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Параметры пула соединений
+POOL_LIMIT = 100              # Всего одновременных соединений
+POOL_LIMIT_PER_HOST = 10      # Одновременных соединений на один хост
+DNS_CACHE_TTL = 300           # Время жизни DNS-кэша, сек
+KEEPALIVE_TIMEOUT = 30        # Сколько держать простаивающее соединение, сек
+
+# Таймауты по умолчанию (переопределяются полем "timeouts" в search_instructions)
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_TOTAL_TIMEOUT = 15
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+    "Accept-Language": "ru-RU,ru;q=0.9",
+}
+
+
+def make_timeout(timeouts: Optional[dict] = None) -> aiohttp.ClientTimeout:
+    """
+    Создаёт ClientTimeout из настроек вида {"connect": 3, "total": 10}.
+    """
+    timeouts = timeouts or {}
+    return aiohttp.ClientTimeout(
+        total=timeouts.get("total", DEFAULT_TOTAL_TIMEOUT),
+        sock_connect=timeouts.get("connect", DEFAULT_CONNECT_TIMEOUT),
+    )
+
+
+class TimingStat:
+    """Накопительная статистика длительностей одной фазы запроса."""
+
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+        }
+
+
+class HttpMetrics:
+    """
+    Метрики HTTP-клиента по хостам: DNS, установка соединения (TCP + TLS),
+    полное время запроса, число запросов, ошибок и переиспользованных соединений.
+    """
+
+    PHASES = ("dns", "connect", "request")
+
+    def __init__(self):
+        self.hosts = {}
+
+    def _host(self, host: str) -> dict:
+        if host not in self.hosts:
+            self.hosts[host] = {
+                "requests": 0,
+                "errors": 0,
+                "timeouts": 0,
+                "reused_connections": 0,
+                **{phase: TimingStat() for phase in self.PHASES},
+            }
+        return self.hosts[host]
+
+    def observe(self, host: str, phase: str, value: float):
+        self._host(host)[phase].observe(value)
+
+    def incr(self, host: str, counter: str):
+        self._host(host)[counter] += 1
+
+    def snapshot(self) -> dict:
+        return {
+            host: {key: value.as_dict() if isinstance(value, TimingStat) else value for key, value in data.items()}
+            for host, data in self.hosts.items()
+        }
+
+
+def _build_trace_config(metrics: HttpMetrics) -> aiohttp.TraceConfig:
+    """Создаёт TraceConfig, который замеряет фазы каждого запроса."""
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_request_start(session, ctx, params):
+        ctx.host = params.url.host
+        ctx.start = time.perf_counter()
+
+    async def on_dns_resolvehost_start(session, ctx, params):
+        ctx.dns_start = time.perf_counter()
+
+    async def on_dns_resolvehost_end(session, ctx, params):
+        metrics.observe(ctx.host, "dns", time.perf_counter() - ctx.dns_start)
+
+    async def on_connection_create_start(session, ctx, params):
+        ctx.connect_start = time.perf_counter()
+
+    async def on_connection_create_end(session, ctx, params):
+        metrics.observe(ctx.host, "connect", time.perf_counter() - ctx.connect_start)
+
+    async def on_connection_reuseconn(session, ctx, params):
+        metrics.incr(ctx.host, "reused_connections")
+
+    async def on_request_end(session, ctx, params):
+        metrics.incr(ctx.host, "requests")
+        metrics.observe(ctx.host, "request", time.perf_counter() - ctx.start)
+
+    async def on_request_exception(session, ctx, params):
+        metrics.incr(ctx.host, "requests")
+        metrics.incr(ctx.host, "errors")
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+    trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+
+class HttpClient:
+    """
+    Общий HTTP-клиент бота: одна сессия aiohttp с пулом keep-alive соединений,
+    DNS-кэшем и ограничением соединений на хост. Открывается при старте бота
+    и закрывается при остановке.
+    """
+
+    def __init__(self):
+        self.metrics = HttpMetrics()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._lock = asyncio.Lock()
+
+    async def start(self) -> aiohttp.ClientSession:
+        """Создаёт сессию, если она ещё не открыта."""
+        async with self._lock:
+            if self._session is None or self._session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit=POOL_LIMIT,
+                    limit_per_host=POOL_LIMIT_PER_HOST,
+                    ttl_dns_cache=DNS_CACHE_TTL,
+                    keepalive_timeout=KEEPALIVE_TIMEOUT,
+                )
+                self._session = aiohttp.ClientSession(
+                    connector=connector,
+                    headers=DEFAULT_HEADERS,
+                    timeout=make_timeout(),
+                    trace_configs=[_build_trace_config(self.metrics)],
+                )
+                logger.info("HTTP-сессия открыта")
+        return self._session
+
+    async def close(self):
+        """Закрывает сессию и все соединения пула."""
+        async with self._lock:
+            if self._session is not None and not self._session.closed:
+                await self._session.close()
+                logger.info("HTTP-сессия закрыта")
+            self._session = None
+
+    async def get_text(self, url: str, timeouts: Optional[dict] = None) -> Tuple[int, str]:
+        """
+        Выполняет GET-запрос и возвращает (статус, текст ответа).
+        При превышении таймаута выбрасывает asyncio.TimeoutError.
+        """
+        session = await self.start()
+        try:
+            with span("http", host=urlsplit(url).hostname or "") as http_span:
+                async with session.get(url, timeout=make_timeout(timeouts)) as response:
+                    if http_span:
+                        http_span.attrs["status"] = response.status
+                    return response.status, await response.text()
+        except asyncio.TimeoutError:
+            self.metrics.incr(urlsplit(url).hostname or "", "timeouts")
+            logger.warning(f"Превышен таймаут запроса к {url}")
+            raise
+
+    def stats(self) -> dict:
+        return self.metrics.snapshot()
+
+
+http_client = HttpClient()
@@ -1,49 +1,108 @@
+from typing import NamedTuple, Optional
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 
+# Статические клавиатуры создаются один раз и переиспользуются во всех ответах
+_MAIN_KEYBOARD = ReplyKeyboardMarkup(keyboard=[
+    [KeyboardButton(text="Новый диалог")],
+    [KeyboardButton(text="О боте"), KeyboardButton(text="Помощь")]
+], resize_keyboard=True)
+
+# Кнопки основной клавиатуры со своими обработчиками в Handlers.py: их ответ из settings.buttons не используется
+BUILTIN_BUTTONS = frozenset({"новый диалог", "о боте", "помощь"})
+
+_REACTION_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [
+        InlineKeyboardButton(text="👍", callback_data="reaction_up"),
+        InlineKeyboardButton(text="👎", callback_data="reaction_down")
+    ]
+])
+
+_INSTRUCTION_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="Инструкция", callback_data="instruction")]
+])
+
 def get_main_keyboard() -> ReplyKeyboardMarkup:
     """
-    Создаёт основную клавиатуру с кнопками "Новый диалог", "О боте", "Помощь".
-    Возвращает объект ReplyKeyboardMarkup для использования в чате.
+    Возвращает основную клавиатуру с кнопками "Новый диалог", "О боте", "Помощь".
+    Клавиатура статическая и создаётся один раз.
     """
-    # Создаём список кнопок
-    buttons = [
-        [KeyboardButton(text="Новый диалог")],
-        [KeyboardButton(text="О боте"), KeyboardButton(text="Помощь")]
-    ]
-
-    # Передаём список кнопок в параметр keyboard
-    keyboard = ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
-    return keyboard
+    return _MAIN_KEYBOARD
 
-def get_reaction_keyboard(message_id: int) -> InlineKeyboardMarkup:
+def get_reaction_keyboard(message_id: Optional[int] = None) -> InlineKeyboardMarkup:
     """
-    Создаёт клавиатуру с кнопками реакции (палец вверх/вниз).
-    Принимает message_id для привязки реакции к конкретному сообщению.
+    Возвращает клавиатуру с кнопками реакции (палец вверх/вниз).
+    Клавиатура общая для всех ответов: сообщение, к которому относится реакция,
+    определяется по ответу бота (reply_to_message), поэтому message_id не нужен
+    и оставлен для совместимости.
     """
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="👍", callback_data=f"reaction_up_{message_id}"),
-            InlineKeyboardButton(text="👎", callback_data=f"reaction_down_{message_id}")
-        ]
-    ])
-    return keyboard
+    return _REACTION_KEYBOARD
 
 def get_instruction_keyboard() -> InlineKeyboardMarkup:
     """
-    Создаёт клавиатуру с кнопкой "Инструкция" для сообщения "Помощь".
+    Возвращает клавиатуру с кнопкой "Инструкция" для сообщения "Помощь".
     """
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Инструкция", callback_data="instruction")]
-    ])
-    return keyboard
+    return _INSTRUCTION_KEYBOARD
+
+# Число инлайн-кнопок команды в одном ряду
+INLINE_BUTTONS_PER_ROW = 3
+
+class DispatchEntry(NamedTuple):
+    """Готовый ответ на команду или кнопку."""
+    response: str
+    reply_markup: object = None
+    admin_only: bool = False
+    kind: str = "command"  # "command" или "button"
+
+def build_settings_keyboard(settings) -> ReplyKeyboardMarkup:
+    """
+    Строит клавиатуру из кнопок settings.buttons (по полю position, buttons_per_row в ряд).
+    """
+    buttons = settings.get("buttons", [])
+    buttons_per_row = settings.get("buttons_per_row", 2)
+    button_list = [btn["text"] for btn in sorted(buttons, key=lambda x: x["position"])]
+    rows = [
+        [KeyboardButton(text=text) for text in button_list[i:i + buttons_per_row]]
+        for i in range(0, len(button_list), buttons_per_row)
+    ]
+    return ReplyKeyboardMarkup(keyboard=rows, resize_keyboard=True)
+
+def build_dispatch_table(snapshot) -> dict:
+    """
+    Строит таблицу "нормализованный текст -> DispatchEntry" для команд и кнопок из prompts.json.
+    Клавиатуры создаются здесь же, один раз на версию настроек. Приоритет при совпадении текста:
+    команды, затем кнопки. Простые диалоги сюда не входят — их ищет по подстроке сопоставитель (Matcher.py).
+    """
+    settings = snapshot.data["settings"]
+    table = {}
+    settings_keyboard = None
+
+    for cmd in settings.get("commands", []):
+        reply_markup = None
+        if cmd["type"] == "inline_buttons":
+            inline_buttons = [InlineKeyboardButton(text=btn["text"], url=btn["url"]) for btn in cmd["inline_buttons"]]
+            reply_markup = InlineKeyboardMarkup(inline_keyboard=[
+                inline_buttons[i:i + INLINE_BUTTONS_PER_ROW] for i in range(0, len(inline_buttons), INLINE_BUTTONS_PER_ROW)
+            ])
+        elif cmd.get("show_keyboard", False):
+            if settings_keyboard is None:
+                settings_keyboard = build_settings_keyboard(settings)
+            reply_markup = settings_keyboard
+        table.setdefault(cmd["name"].lower(),
+                         DispatchEntry(cmd["response"], reply_markup, cmd["access"] == "admin", "command"))
+
+    for btn in settings.get("buttons", []):
+        table.setdefault(btn["text"].lower(), DispatchEntry(btn["response"], kind="button"))
+
+    return table
 
 # Инструкции:
 # 1. Этот файл содержит клавиатуры для бота.
-# 2. Для добавления новых кнопок в основную клавиатуру добавьте новую строку в список `buttons` в `get_main_keyboard()`.
-#    Пример: buttons.append([KeyboardButton(text="Новая кнопка")])
-# 3. Реакции (палец вверх/вниз) используются для оценки ответов бота и привязаны к message_id.
-# 4. Для добавления новых инлайн-кнопок создайте новую функцию, аналогичную `get_instruction_keyboard()`.
+# 2. Для добавления новых кнопок в основную клавиатуру добавьте новую строку в `_MAIN_KEYBOARD`.
+#    Пример: [KeyboardButton(text="Новая кнопка")]
+# 3. Реакции (палец вверх/вниз) используются для оценки ответов бота; сообщение определяется по reply_to_message.
+# 4. Для добавления новых инлайн-кнопок создайте константу и функцию, аналогичные `get_instruction_keyboard()`.
 #    Пример:
+#    _CUSTOM_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="Новая кнопка", callback_data="custom")]])
 #    def get_custom_keyboard():
-#        keyboard = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="Новая кнопка", callback_data="custom")]])
-#        return keyboard
\ No newline at end of file
+#        return _CUSTOM_KEYBOARD
+# 5. Клавиатуры команд и кнопок из prompts.json строятся в `build_dispatch_table()` один раз на версию настроек.
\ No newline at end of file
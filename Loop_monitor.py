@@ -0,0 +1,197 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from inspect import CO_COROUTINE
+from typing import List, Optional
+from Metrics import loop_lag, loop_lag_histogram, registry
+from Tracing import Span
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/loop_monitor.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+SLOW_CALLBACKS_FILE = "logs/slow_callbacks.jsonl"
+
+# Порог блокировки цикла событий, после которого снимается стек, мс
+BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "200"))
+HEARTBEAT_INTERVAL = 0.05  # Как часто цикл событий отмечается сторожу, сек
+STACK_DEPTH = 30           # Сколько кадров стека сохранять
+MAX_RECENT = 100           # Сколько последних блокировок держать в памяти
+
+slow_callbacks = registry.counter("bot_slow_callbacks_total", "Блокировок цикла событий дольше порога")
+
+# Блокировки: одна строка JSON на случай (его читает админ-панель)
+slow_logger = logging.getLogger("slow_callbacks")
+slow_handler = logging.FileHandler(SLOW_CALLBACKS_FILE, encoding='utf-8')
+slow_handler.setFormatter(logging.Formatter("%(message)s"))
+slow_logger.addHandler(slow_handler)
+slow_logger.setLevel(logging.INFO)
+slow_logger.propagate = False
+
+
+def find_request_id(frame) -> Optional[str]:
+    """Ищет в кадрах стека спан трассы (например, request в handle_message) и берёт его request_id."""
+    while frame is not None:
+        for value in list(frame.f_locals.values()):
+            if isinstance(value, Span):
+                return value.request_id
+        frame = frame.f_back
+    return None
+
+
+def find_coroutine(frame) -> Optional[str]:
+    """Ближайшая к блокирующему вызову корутина на стеке (внешние — это обычно диспетчер aiogram)."""
+    while frame is not None:
+        code = frame.f_code
+        if code.co_flags & CO_COROUTINE:
+            return f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+        frame = frame.f_back
+    return None
+
+
+class LoopMonitor:
+    """
+    Сторож цикла событий. Корутина-пульс отмечается каждые HEARTBEAT_INTERVAL и замеряет задержку
+    планирования (метрики bot_event_loop_lag_*). Отдельный поток проверяет пульс: если цикл не отвечает
+    дольше порога, он снимает стек потока цикла (sys._current_frames) — это стек блокирующего вызова —
+    и находит request_id запроса по спанам в кадрах. Когда цикл оживает, случай записывается
+    в SLOW_CALLBACKS_FILE с полной длительностью блокировки.
+    """
+
+    def __init__(self, threshold_ms: float = BLOCK_THRESHOLD_MS, interval: float = HEARTBEAT_INTERVAL):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.recent = deque(maxlen=MAX_RECENT)
+        self._lock = threading.Lock()
+        self._beat = time.monotonic()
+        self._pending: Optional[dict] = None  # Снятый сторожем стек текущей блокировки
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Запускает пульс в текущем цикле событий и поток-сторож."""
+        if self._task is not None and not self._task.done():
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._thread.start()
+        logger.info(f"Сторож цикла событий запущен, порог {self.threshold * 1000:.0f} мс")
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join, 1)
+            self._thread = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(now - expected, 0.0)
+            with self._lock:
+                self._beat = now
+                pending, self._pending = self._pending, None
+            loop_lag.set(lag)
+            loop_lag_histogram.observe(lag)
+            if lag >= self.threshold:
+                self._record(lag, pending)
+
+    def _watch(self):
+        check_interval = max(self.threshold / 4, 0.01)
+        while not self._stopped.wait(check_interval):
+            with self._lock:
+                stalled = time.monotonic() - self._beat - self.interval
+                if stalled < self.threshold or self._pending is not None:
+                    continue
+                self._pending = self._capture()
+
+    def _capture(self) -> dict:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return {}
+        try:
+            return {
+                "request_id": find_request_id(frame),
+                "coroutine": find_coroutine(frame),
+                "stack": [line.rstrip() for line in traceback.format_stack(frame, limit=STACK_DEPTH)],
+            }
+        except Exception as e:
+            return {"stack": [], "error": f"{type(e).__name__}: {e}"}
+        finally:
+            del frame
+
+    def _record(self, lag: float, captured: Optional[dict]):
+        event = {"ts": round(time.time(), 3), "blocked_ms": round(lag * 1000, 1)}
+        # Короткую блокировку сторож может не застать — тогда стека нет
+        event.update(captured or {"request_id": None, "coroutine": None, "stack": []})
+        self.recent.append(event)
+        slow_callbacks.inc()
+        location = event["stack"][-1].strip().splitlines()[0] if event["stack"] else "стек не снят"
+        logger.warning(
+            f"Цикл событий заблокирован на {event['blocked_ms']} мс "
+            f"(запрос {event['request_id']}, {event['coroutine']}): {location}"
+        )
+        try:
+            slow_logger.info(json.dumps(event, ensure_ascii=False))
+        except Exception as e:
+            logger.error(f"Ошибка записи блокировки цикла событий: {e}")
+
+    def stats(self) -> dict:
+        return {"threshold_ms": self.threshold * 1000, "recent": len(self.recent)}
+
+
+loop_monitor = LoopMonitor()
+
+
+def load_slow_callbacks(path: str = SLOW_CALLBACKS_FILE, limit: int = 50) -> List[dict]:
+    """Последние блокировки цикла событий из файла (новые первыми)."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            lines = deque(f, maxlen=limit)
+    except FileNotFoundError:
+        return []
+    events = []
+    for line in reversed(lines):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            events.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return events
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Последние блокировки цикла событий бота")
+    parser.add_argument("path", nargs="?", default=SLOW_CALLBACKS_FILE)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+    for event in load_slow_callbacks(args.path, args.limit):
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(event["ts"]))
+        print(f"{when}  {event['blocked_ms']} мс  запрос {event.get('request_id')}  {event.get('coroutine')}")
+        for line in event.get("stack", [])[-5:]:
+            print("    " + line.strip().replace("\n", "\n    "))
@@ -0,0 +1,136 @@
+import logging
+from collections import deque
+from typing import Any, Iterable, List, Optional, Tuple
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/matcher.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Ключевые слова шаблонов ответа в порядке приоритета (первый совпавший шаблон побеждает).
+# Переопределяются ключом "template_keywords" в prompts.json.
+DEFAULT_TEMPLATE_KEYWORDS = [
+    ("template_1", ["как ", "шаги", "инструкция", "процесс", "оформить", "сделать", "настройка", "сборка"]),  # Инструкции
+    ("template_2", ["плюсы", "минусы", "характеристики", "особенности", "преимущества", "недостатки"]),  # Характеристики
+    ("template_legal", ["закон", "право", "зозпп", "гк рф", "вернуть деньги", "возврат", "обмен", "гарантия",
+                        "гарантийный", "заменить", "требует замены", "проверка качества"]),  # Юридическая информация
+    ("template_diagnostic", ["диагностика", "неисправность", "ремонт"]),  # Диагностика
+    ("template_comparison", ["сравни", "сравнение"]),  # Сравнение
+    ("template_product", ["dns", "товар"]),  # Информация о товаре
+]
+DEFAULT_TEMPLATE = "template_3"  # Общий запрос
+
+DIALOG = "dialog"
+TEMPLATE = "template"
+
+
+class AhoCorasick:
+    """
+    Автомат Ахо-Корасик: за один проход по тексту находит все вхождения
+    всех шаблонов. Каждому шаблону сопоставлена произвольная полезная нагрузка.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, Any]]):
+        self.goto: List[dict] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[Any]] = [[]]
+        for pattern, payload in patterns:
+            if pattern:
+                self._add(pattern, payload)
+        self._build()
+
+    def _add(self, pattern: str, payload: Any):
+        state = 0
+        for char in pattern:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append(payload)
+
+    def _build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                # Наследуем совпадения суффиксов, чтобы при поиске не ходить по ссылкам отказа
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find_all(self, text: str) -> List[Any]:
+        """Возвращает нагрузки всех шаблонов, встретившихся в тексте (по одному разу)."""
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        found = {}
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                for payload in output[state]:
+                    found[id(payload)] = payload
+        return list(found.values())
+
+
+class IntentMatcher:
+    """
+    Единый автомат для ключей простых диалогов и ключевых слов шаблонов ответа.
+    Приоритет диалога — его порядок в prompts.json, шаблона — порядок в списке шаблонов.
+    """
+
+    def __init__(self, dialogs: dict, template_keywords: Optional[list] = None):
+        self.dialogs = dict(dialogs)
+        template_keywords = template_keywords or DEFAULT_TEMPLATE_KEYWORDS
+        patterns = []
+        for priority, key in enumerate(self.dialogs):
+            patterns.append((key, (DIALOG, priority, key)))
+        for priority, (template, keywords) in enumerate(template_keywords):
+            for keyword in keywords:
+                patterns.append((keyword, (TEMPLATE, priority, template)))
+        self.automaton = AhoCorasick(patterns)
+        logger.info(f"Автомат сопоставления построен: {len(patterns)} шаблонов, {len(self.automaton.goto)} состояний")
+
+    def match(self, query: str) -> List[tuple]:
+        """
+        Возвращает все совпадения (тип, приоритет, значение), отсортированные по приоритету.
+        """
+        return sorted(self.automaton.find_all(query.lower()), key=lambda match: (match[0], match[1]))
+
+    def match_dialog(self, query: str) -> Optional[str]:
+        """Возвращает ответ первого (по порядку в prompts.json) диалога, ключ которого есть в запросе."""
+        best = None
+        for kind, priority, key in self.automaton.find_all(query.lower()):
+            if kind == DIALOG and (best is None or priority < best[0]):
+                best = (priority, key)
+        return self.dialogs[best[1]] if best else None
+
+    def match_template(self, query: str) -> str:
+        """Возвращает шаблон ответа с наивысшим приоритетом среди совпавших."""
+        best = None
+        for kind, priority, template in self.automaton.find_all(query.lower()):
+            if kind == TEMPLATE and (best is None or priority < best[0]):
+                best = (priority, template)
+        return best[1] if best else DEFAULT_TEMPLATE
+
+
+def build_matcher(prompts: dict) -> IntentMatcher:
+    """Строит автомат по настройкам из prompts.json."""
+    template_keywords = prompts.get("template_keywords")
+    if template_keywords:
+        template_keywords = [(item["template"], item["keywords"]) for item in template_keywords]
+    return IntentMatcher(prompts.get("dialogs", {}), template_keywords)
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+from aiogram import Bot, Dispatcher, types
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/membership.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+MEMBER_STATUSES = {"member", "administrator", "creator"}
+ADMIN_STATUSES = {"administrator", "creator"}
+
+MEMBER_TTL = 10 * 60      # Сколько помнить участника группы, сек
+NON_MEMBER_TTL = 60       # Сколько помнить, что пользователь НЕ в группе, сек
+MAX_ENTRIES = 50000       # Максимальное число записей в кэше
+ENTRY_BYTES = 300         # Приблизительный размер записи в памяти (ключ, статус, срок, узел OrderedDict), байт
+
+
+def _status_value(status) -> str:
+    """Приводит ChatMemberStatus (str-Enum aiogram) к строке вида "member"."""
+    return getattr(status, "value", status)
+
+
+class MembershipCache:
+    """
+    Кэш статусов участников группы (member/administrator/creator/left/...).
+    Участники хранятся MEMBER_TTL, не участники — короткое время NON_MEMBER_TTL,
+    чтобы только что вступивший пользователь быстро получил доступ.
+    Записи обновляются из обновлений chat_member, одновременные запросы
+    по одному пользователю объединяются в один вызов get_chat_member.
+    """
+
+    def __init__(self, member_ttl: float = MEMBER_TTL, non_member_ttl: float = NON_MEMBER_TTL,
+                 max_entries: int = MAX_ENTRIES):
+        self.member_ttl = member_ttl
+        self.non_member_ttl = non_member_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # (чат, пользователь) -> (статус, истекает)
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(chat_id, user_id) -> tuple:
+        return str(chat_id), int(user_id)
+
+    def _store(self, key: tuple, status: str):
+        ttl = self.member_ttl if status in MEMBER_STATUSES else self.non_member_ttl
+        self._entries[key] = (status, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_cached(self, chat_id, user_id) -> Optional[str]:
+        key = self._key(chat_id, user_id)
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[0]
+
+    def update(self, chat_id, user_id, status: str):
+        """Обновляет статус пользователя (вызывается из обработчика chat_member)."""
+        self._store(self._key(chat_id, user_id), _status_value(status))
+
+    def invalidate(self, chat_id, user_id):
+        self._entries.pop(self._key(chat_id, user_id), None)
+
+    async def get_status(self, bot: Bot, chat_id, user_id) -> Optional[str]:
+        """
+        Возвращает статус пользователя в чате: из кэша или через get_chat_member.
+        При ошибке API возвращает None и ничего не кэширует.
+        """
+        key = self._key(chat_id, user_id)
+        status = self.get_cached(chat_id, user_id)
+        if status is not None:
+            self.hits += 1
+            return status
+        self.misses += 1
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        async def fetch() -> Optional[str]:
+            try:
+                member = await bot.get_chat_member(chat_id=chat_id, user_id=user_id)
+                status = _status_value(member.status)
+                self._store(key, status)
+                return status
+            except Exception as e:
+                logger.error(f"Ошибка проверки членства в группе {chat_id} для пользователя {user_id}: {e}")
+                return None
+            finally:
+                self._pending.pop(key, None)
+
+        task = asyncio.ensure_future(fetch())
+        self._pending[key] = task
+        return await asyncio.shield(task)
+
+    def approx_bytes(self) -> int:
+        return len(self._entries) * ENTRY_BYTES
+
+    def trim(self, max_bytes: int):
+        """Ограничивает кэш бюджетом памяти: вытесняет самые давно обновлённые записи."""
+        self.max_entries = max(min(MAX_ENTRIES, max_bytes // ENTRY_BYTES), 1)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+membership_cache = MembershipCache()
+
+
+async def is_user_in_group(bot: Bot, user_id: int, group_id: str, check_admin: bool = False) -> bool:
+    """
+    Проверяет, состоит ли пользователь в указанной группе.
+    Если check_admin=True, проверяет, является ли пользователь администратором или создателем группы.
+    """
+    status = await membership_cache.get_status(bot, group_id, user_id)
+    if status is None:
+        return False
+    if check_admin:
+        return status in ADMIN_STATUSES
+    return status in MEMBER_STATUSES
+
+
+def register_membership_handlers(dp: Dispatcher):
+    """
+    Регистрирует обработчик обновлений chat_member, поддерживающий кэш в актуальном состоянии.
+    Для получения этих обновлений бот должен быть администратором группы,
+    а "chat_member" должен входить в allowed_updates.
+    """
+
+    @dp.chat_member()
+    async def handle_chat_member(update: types.ChatMemberUpdated):
+        user_id = update.new_chat_member.user.id
+        status = _status_value(update.new_chat_member.status)
+        membership_cache.update(update.chat.id, user_id, status)
+        logger.info(f"Статус пользователя {user_id} в чате {update.chat.id} обновлён: {status}")
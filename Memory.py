@@ -0,0 +1,290 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/memory.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+CHECK_INTERVAL = 60        # Как часто пересчитывать размеры и соблюдать бюджеты, сек
+TRACEMALLOC_FRAMES = 10    # Глубина стека, запоминаемого tracemalloc для каждого выделения
+TOP_LIMIT = 20
+
+# Бюджеты памяти подсистем по умолчанию, МБ (переопределяются переменными MEMORY_BUDGET_<ИМЯ>_MB).
+# Кэши при превышении бюджета вытесняют записи; для данных без вытеснения (модель, база знаний)
+# бюджет — порог предупреждения. Данные на диске (кэш поиска в SQLite) показываются без бюджета:
+# их размер ограничивают собственные настройки, а не бюджет памяти.
+DEFAULT_BUDGETS_MB = {
+    "model": 512,
+    "knowledge_base": 256,
+    "faiss_index": 256,
+    "dialog_context": 8,
+    "membership": 16,
+}
+
+
+def budget_bytes(name: str) -> int:
+    value = os.getenv(f"MEMORY_BUDGET_{name.upper()}_MB")
+    try:
+        return int(float(value) * MB) if value else DEFAULT_BUDGETS_MB.get(name, 0) * MB
+    except ValueError:
+        logger.error(f"Некорректный бюджет памяти MEMORY_BUDGET_{name.upper()}_MB={value!r}")
+        return DEFAULT_BUDGETS_MB.get(name, 0) * MB
+
+
+def deep_size(obj, seen: Optional[set] = None) -> int:
+    """Приблизительный размер структуры из dict/list/tuple/set/str в куче (sys.getsizeof рекурсивно)."""
+    seen = set() if seen is None else seen
+    stack = [obj]
+    total = 0
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+    return total
+
+
+def process_rss() -> int:
+    """Резидентная память процесса, байт (Linux: /proc/self/status; иначе пиковая из resource)."""
+    try:
+        with open("/proc/self/status", encoding='utf-8') as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except Exception:
+        return 0
+
+
+class Subsystem:
+    """Учитываемая подсистема: как измерить её размер и (для кэшей) как ужать до бюджета."""
+
+    def __init__(self, name: str, title: str, size: Callable[[], int],
+                 trim: Optional[Callable[[int], None]] = None, on_disk: bool = False):
+        self.name = name
+        self.title = title
+        self.size = size
+        self.trim = trim
+        self.on_disk = on_disk
+        self.budget = 0 if on_disk else budget_bytes(name)
+        self.bytes = 0
+        self.trimmed = 0
+
+
+class MemoryAccountant:
+    """
+    Учёт памяти по подсистемам бота: приблизительный размер структур каждой подсистемы,
+    бюджеты с вытеснением для кэшей и top выделений tracemalloc по запросу.
+    Размеры считаются раз в CHECK_INTERVAL; отчёт читает админ-панель через сервер метрик (/memory).
+    """
+
+    def __init__(self):
+        self.subsystems: Dict[str, Subsystem] = {}
+        self.checked_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._sizes: Dict[str, tuple] = {}  # имя -> (id, длина, размер): не пересчитывать неизменные данные
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+
+    def register(self, name: str, title: str, size: Callable[[], int],
+                 trim: Optional[Callable[[int], None]] = None, on_disk: bool = False):
+        subsystem = self.subsystems[name] = Subsystem(name, title, size, trim, on_disk)
+        if trim is not None and subsystem.budget:
+            # Бюджет кэша становится его лимитом: дальше кэш вытесняет записи сам при каждой вставке
+            trim(subsystem.budget)
+
+    def cached_deep_size(self, name: str, obj) -> int:
+        """deep_size с запоминанием: большие списки (база знаний) пересчитываются только при изменении длины."""
+        if obj is None:
+            return 0
+        key = (id(obj), len(obj))
+        cached = self._sizes.get(name)
+        if cached is not None and cached[:2] == key:
+            return cached[2]
+        size = deep_size(obj)
+        self._sizes[name] = key + (size,)
+        return size
+
+    def check(self) -> List[dict]:
+        """Пересчитывает размеры и ужимает кэши, превысившие бюджет."""
+        for subsystem in self.subsystems.values():
+            try:
+                subsystem.bytes = int(subsystem.size())
+                if subsystem.budget and subsystem.bytes > subsystem.budget:
+                    if subsystem.trim is not None:
+                        subsystem.trim(subsystem.budget)
+                        subsystem.trimmed += 1
+                        before, subsystem.bytes = subsystem.bytes, int(subsystem.size())
+                        logger.info(f"{subsystem.title}: {before / MB:.1f} МБ больше бюджета "
+                                    f"{subsystem.budget / MB:.0f} МБ, ужато до {subsystem.bytes / MB:.1f} МБ")
+                    else:
+                        logger.warning(f"{subsystem.title}: {subsystem.bytes / MB:.1f} МБ больше бюджета "
+                                       f"{subsystem.budget / MB:.0f} МБ")
+            except Exception as e:
+                logger.error(f"Ошибка учёта памяти подсистемы {subsystem.name}: {e}")
+        self.checked_at = time.time()
+        return self.subsystems_report()
+
+    def subsystems_report(self) -> List[dict]:
+        return [
+            {
+                "name": subsystem.name,
+                "title": subsystem.title,
+                "bytes": subsystem.bytes,
+                "budget": subsystem.budget,
+                "over_budget": bool(subsystem.budget) and subsystem.bytes > subsystem.budget,
+                "evicts": subsystem.trim is not None,
+                "on_disk": subsystem.on_disk,
+                "trimmed": subsystem.trimmed,
+            }
+            for subsystem in self.subsystems.values()
+        ]
+
+    def report(self, top: int = TOP_LIMIT) -> dict:
+        """Сводка для админ-панели: RSS процесса, подсистемы и (если включён) top tracemalloc."""
+        if self.checked_at is None:
+            self.check()
+        return {
+            "rss": process_rss(),
+            "checked_at": self.checked_at,
+            "subsystems": self.subsystems_report(),
+            "tracemalloc": tracemalloc.is_tracing(),
+            "top": self.tracemalloc_top(top) if tracemalloc.is_tracing() else [],
+        }
+
+    # --- tracemalloc ---
+
+    def start_tracemalloc(self, frames: int = TRACEMALLOC_FRAMES):
+        """Включает трассировку выделений (замедляет выделения памяти — включать на время разбора)."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self._baseline = tracemalloc.take_snapshot()
+            logger.info("tracemalloc включён")
+
+    def stop_tracemalloc(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self._baseline = None
+            logger.info("tracemalloc выключен")
+
+    def tracemalloc_top(self, limit: int = TOP_LIMIT) -> List[dict]:
+        """Места, выделившие больше всего живой памяти, и прирост с момента включения."""
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        growth = {}
+        if self._baseline is not None:
+            for stat in snapshot.compare_to(self._baseline, "lineno"):
+                growth[str(stat.traceback[0])] = stat.size_diff
+        return [
+            {
+                "location": str(stat.traceback[0]),
+                "bytes": stat.size,
+                "count": stat.count,
+                "growth": growth.get(str(stat.traceback[0]), 0),
+            }
+            for stat in snapshot.statistics("lineno")[:limit]
+        ]
+
+    # --- Периодическая проверка ---
+
+    def start(self, interval: float = CHECK_INTERVAL):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self, interval: float):
+        while True:
+            self.check()
+            await asyncio.sleep(interval)
+
+
+memory_accountant = MemoryAccountant()
+
+
+def register_bot_subsystems():
+    """Регистрирует подсистемы процесса бота. Модули берутся из уже загруженных, чтобы не импортировать лишнего."""
+    from Dialog_context import dialog_context
+    from Membership import membership_cache
+    from Search_cache import get_search_cache
+
+    def sheets():
+        return sys.modules.get("Google_sheets")
+
+    def model_size() -> int:
+        model = getattr(sheets(), "model", None)
+        if model is None:
+            return 0
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+    def knowledge_base_size() -> int:
+        module = sheets()
+        if module is None:
+            return 0
+        return (memory_accountant.cached_deep_size("knowledge_base", module.knowledge_base)
+                + memory_accountant.cached_deep_size("questions", module.questions))
+
+    def faiss_size() -> int:
+        index = getattr(sheets(), "vector_index", None)
+        # IndexFlatL2 хранит векторы float32 без сжатия
+        return index.ntotal * index.d * 4 if index is not None else 0
+
+    search_cache = get_search_cache()
+
+    memory_accountant.register("model", "Модель SentenceTransformer", model_size)
+    memory_accountant.register("knowledge_base", "База знаний и вопросы", knowledge_base_size)
+    memory_accountant.register("faiss_index", "Индекс FAISS", faiss_size)
+    memory_accountant.register("dialog_context", "Контекст диалогов", lambda: dialog_context.cache.bytes,
+                               dialog_context.cache.trim)
+    memory_accountant.register("membership", "Кэш членства в группе", membership_cache.approx_bytes,
+                               membership_cache.trim)
+    # Состояния aiogram (BackendStorage) хранятся в State_backend — в SQLite или на сервере, не в памяти бота
+    memory_accountant.register("search_cache", "Кэш поиска (SQLite)", lambda: search_cache.stats()["bytes"],
+                               on_disk=True)
+
+
+async def memory_handler(request):
+    """
+    GET /memory — отчёт о памяти; POST /memory?tracemalloc=start|stop — трассировка выделений.
+    Подключается к локальному серверу метрик бота.
+    """
+    from aiohttp import web
+    if request.method == "POST":
+        action = request.query.get("tracemalloc")
+        if action == "start":
+            memory_accountant.start_tracemalloc()
+        elif action == "stop":
+            memory_accountant.stop_tracemalloc()
+        elif action is None:
+            memory_accountant.check()
+        else:
+            return web.json_response({"error": "tracemalloc: start или stop"}, status=400)
+    return web.json_response(memory_accountant.report())
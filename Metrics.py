@@ -0,0 +1,407 @@
+import bisect
+import logging
+import os
+import re
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/metrics.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Локальный HTTP-адрес метрик процесса бота (его читает админ-панель)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9101"))
+BOT_METRICS_URL = os.getenv("BOT_METRICS_URL", f"http://127.0.0.1:{METRICS_PORT}/metrics")
+BOT_PROFILE_URL = os.getenv("BOT_PROFILE_URL", f"http://127.0.0.1:{METRICS_PORT}/profile")
+BOT_MEMORY_URL = os.getenv("BOT_MEMORY_URL", f"http://127.0.0.1:{METRICS_PORT}/memory")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Базовая метрика: значения по наборам меток."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(self.values.items())
+        ]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def set_total(self, value: float, **labels):
+        """Устанавливает накопленное значение из счётчиков другой подсистемы (для сборщиков)."""
+        self.values[self._key(labels)] = value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self.series: Dict[Tuple[str, ...], list] = {}  # метки -> [счётчики корзин..., сумма, число]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def set_series(self, counts: List[int], total: float, count: int, **labels):
+        """Устанавливает гистограмму целиком (counts — по корзинам, не накопленные)."""
+        self.series[self._key(labels)] = list(counts) + [total, count]
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-2]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    """
+    Реестр метрик процесса. Сборщики (collectors) вызываются перед каждой выдачей
+    и переносят в метрики текущую статистику подсистем (stats()).
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self.collectors: List[Callable[[], None]] = []
+
+    def _register(self, metric: Metric) -> Metric:
+        existing = self.metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], None]):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        """Текст в формате Prometheus (text exposition format 0.0.4)."""
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.error(f"Ошибка сборщика метрик {getattr(collector, '__name__', collector)}: {e}")
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# --- Метрики бота ---
+messages_total = registry.counter("bot_messages_total", "Обработано входящих сообщений", ("chat_type",))
+stage_latency = registry.histogram(
+    "bot_stage_latency_seconds", "Задержка этапов обработки запроса (по трассам Tracing.py)", ("stage",)
+)
+cache_hits = registry.counter("bot_cache_hits_total", "Попадания в кэши", ("cache",))
+cache_misses = registry.counter("bot_cache_misses_total", "Промахи кэшей", ("cache",))
+cache_entries = registry.gauge("bot_cache_entries", "Записей в кэше", ("cache",))
+groq_tokens = registry.counter("bot_groq_tokens_total", "Токены Groq", ("kind",))
+groq_requests = registry.counter("bot_groq_requests_total", "Запросы к Groq", ("outcome",))
+kb_entries = registry.gauge("bot_kb_entries", "Записей в базе знаний")
+kb_generation = registry.gauge("bot_kb_generation", "Номер загрузки базы знаний (растёт при каждом обновлении)")
+loop_lag = registry.gauge("bot_event_loop_lag_seconds", "Последняя задержка цикла событий")
+loop_lag_histogram = registry.histogram(
+    "bot_event_loop_lag_distribution_seconds", "Распределение задержки цикла событий",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+in_flight = registry.gauge("bot_requests_in_flight", "Запросов в обработке")
+queued = registry.gauge("bot_requests_queued", "Запросов в очереди допуска")
+rejected = registry.counter("bot_requests_rejected_total", "Запросов отклонено", ("reason",))
+send_queue_depth = registry.gauge("bot_send_queue_depth", "Исходящих сообщений в очереди")
+flood_waits = registry.counter("bot_flood_waits_total", "Ответов Telegram RetryAfter")
+http_requests = registry.counter("bot_http_requests_total", "HTTP-запросы к внешним сайтам", ("host", "result"))
+memory_bytes = registry.gauge("bot_memory_bytes", "Приблизительный размер структур подсистемы, байт", ("subsystem",))
+memory_budget = registry.gauge("bot_memory_budget_bytes", "Бюджет памяти подсистемы, байт", ("subsystem",))
+process_rss_bytes = registry.gauge("bot_process_rss_bytes", "Резидентная память процесса бота, байт")
+bot_ready = registry.gauge("bot_ready", "Бот принимает обновления (1) или запускается/останавливается (0)")
+startup_stage_seconds = registry.gauge("bot_startup_stage_seconds", "Длительность шага запуска бота, сек", ("stage",))
+
+
+class Readiness:
+    """
+    Готовность процесса бота для проверок /health и /ready: текущий шаг запуска или остановки
+    и длительности пройденных шагов. /ready отвечает 200, только пока бот принимает обновления.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.stage = "starting"
+        self.title = "Запуск"
+        self.started_at = time.time()
+        self.ready_at: Optional[float] = None
+        self.stages: List[dict] = []
+        self.error: Optional[str] = None
+
+    def begin(self, name: str, title: str):
+        self.stage, self.title = name, title
+
+    def done(self, name: str, title: str, duration: float):
+        self.stages.append({"name": name, "title": title, "seconds": round(duration, 3)})
+        startup_stage_seconds.set(duration, stage=name)
+
+    def fail(self, name: str, error: Exception):
+        self.error = f"{name}: {type(error).__name__}: {error}"
+
+    def mark_ready(self):
+        self.ready = True
+        self.stage, self.title = "ready", "Принимает обновления"
+        self.ready_at = time.time()
+        bot_ready.set(1)
+
+    def mark_not_ready(self, stage: str, title: str):
+        self.ready = False
+        self.stage, self.title = stage, title
+        bot_ready.set(0)
+
+    def report(self) -> dict:
+        return {
+            "ready": self.ready,
+            "stage": self.stage,
+            "title": self.title,
+            "startup_seconds": round(self.ready_at - self.started_at, 3) if self.ready_at else None,
+            "stages": self.stages,
+            "error": self.error,
+        }
+
+
+readiness = Readiness()
+
+
+def collect_bot_stats():
+    """Переносит статистику подсистем бота в метрики (вызывается при каждой выдаче)."""
+    from Admission import admission
+    from Dialog_context import dialog_context
+    from Http_client import http_client
+    from Membership import membership_cache
+    from Memory import memory_accountant, process_rss
+    from Search_cache import get_search_cache
+    from Send_queue import send_queue
+    from Tracing import histograms, BUCKETS_MS
+
+    stats = admission.stats()
+    in_flight.set(stats["running"])
+    queued.set(stats["queued"])
+    rejected.set_total(stats["rejected"], reason="busy")
+    rejected.set_total(stats["superseded"], reason="superseded")
+
+    stats = send_queue.stats()
+    send_queue_depth.set(stats["queued"])
+    flood_waits.set_total(stats["flood_waits"])
+
+    for name, stats in (("search", get_search_cache().stats()), ("membership", membership_cache.stats()),
+                        ("dialog_context", dialog_context.stats())):
+        cache_hits.set_total(stats["hits"], cache=name)
+        cache_misses.set_total(stats["misses"], cache=name)
+        cache_entries.set(stats.get("entries", stats.get("users", 0)), cache=name)
+
+    for host, data in http_client.stats().items():
+        http_requests.set_total(data.get("requests", 0), host=host, result="total")
+        http_requests.set_total(data.get("errors", 0), host=host, result="error")
+        http_requests.set_total(data.get("timeouts", 0), host=host, result="timeout")
+
+    # Размеры подсистем — из последней периодической проверки (пересчёт дорогой)
+    for subsystem in memory_accountant.subsystems_report():
+        memory_bytes.set(subsystem["bytes"], subsystem=subsystem["name"])
+        memory_budget.set(subsystem["budget"], subsystem=subsystem["name"])
+    process_rss_bytes.set(process_rss())
+
+    # Гистограммы трасс хранятся в мс с теми же границами — переводим в секунды
+    stage_latency.buckets = tuple(bound / 1000 for bound in BUCKETS_MS)
+    for stage, histogram in list(histograms.items()):
+        stage_latency.set_series(histogram.counts, histogram.total / 1000, histogram.count, stage=stage)
+
+
+async def metrics_handler(request):
+    from aiohttp import web
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+
+async def health_handler(request):
+    """GET /health — процесс жив (отвечает, даже пока бот запускается)."""
+    from aiohttp import web
+    return web.json_response({"status": "ok", "stage": readiness.stage})
+
+
+async def ready_handler(request):
+    """GET /ready — 200, когда бот принимает обновления, иначе 503 с текущим шагом запуска."""
+    from aiohttp import web
+    return web.json_response(readiness.report(), status=200 if readiness.ready else 503)
+
+
+_metrics_runner = None
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """Запускает локальный HTTP-сервер /metrics (а также /health, /ready, /profile и /memory) в процессе бота."""
+    global _metrics_runner
+    from aiohttp import web
+    if not any(collector is collect_bot_stats for collector in registry.collectors):
+        registry.add_collector(collect_bot_stats)
+    if _metrics_runner is not None:
+        return
+    from Memory import memory_handler
+    from Profiler import profile_handler
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    app.router.add_get("/health", health_handler)
+    app.router.add_get("/ready", ready_handler)
+    # Запуск профилирования работающего бота из админ-панели (адрес только локальный)
+    app.router.add_get("/profile", profile_handler)
+    app.router.add_post("/profile", profile_handler)
+    app.router.add_get("/memory", memory_handler)
+    app.router.add_post("/memory", memory_handler)
+    _metrics_runner = web.AppRunner(app)
+    await _metrics_runner.setup()
+    try:
+        await web.TCPSite(_metrics_runner, host, port).start()
+        logger.info(f"Метрики доступны по адресу http://{host}:{port}/metrics")
+    except OSError as e:
+        logger.error(f"Не удалось запустить сервер метрик на {host}:{port}: {e}")
+
+
+async def stop_metrics_server():
+    global _metrics_runner
+    if _metrics_runner is not None:
+        await _metrics_runner.cleanup()
+        _metrics_runner = None
+
+
+SAMPLE_RE = re.compile(r'^([a-zA-Z_:][\w:]*)(\{[^}]*\})?\s+(\S+)')
+LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_metrics(text: str) -> Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float]:
+    """Разбирает текст Prometheus в словарь (имя, метки) -> значение."""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = SAMPLE_RE.match(line)
+        if not match:
+            continue
+        labels = tuple(sorted(LABEL_RE.findall(match.group(2) or "")))
+        try:
+            samples[(match.group(1), labels)] = float(match.group(3))
+        except ValueError:
+            continue
+    return samples
+
+
+def summarize_bot_metrics(text: str) -> dict:
+    """Ключевые показатели бота для дашборда админ-панели."""
+    samples = parse_metrics(text)
+
+    def total(name: str, **labels) -> float:
+        wanted = set(labels.items())
+        return sum(value for (metric, metric_labels), value in samples.items()
+                   if metric == name and wanted <= set(metric_labels))
+
+    def hit_ratio(cache: str) -> Optional[float]:
+        hits, misses = total("bot_cache_hits_total", cache=cache), total("bot_cache_misses_total", cache=cache)
+        return hits / (hits + misses) if hits + misses else None
+
+    message_count = total("bot_stage_latency_seconds_count", stage="message")
+    return {
+        "ready": total("bot_ready"),
+        "messages": total("bot_messages_total"),
+        "in_flight": total("bot_requests_in_flight"),
+        "queued": total("bot_requests_queued"),
+        "rejected": total("bot_requests_rejected_total"),
+        "loop_lag_ms": total("bot_event_loop_lag_seconds") * 1000,
+        "slow_callbacks": total("bot_slow_callbacks_total"),
+        "avg_latency": total("bot_stage_latency_seconds_sum", stage="message") / message_count if message_count else None,
+        "search_hit_ratio": hit_ratio("search"),
+        "membership_hit_ratio": hit_ratio("membership"),
+        "dialog_hit_ratio": hit_ratio("dialog_context"),
+        "groq_tokens": total("bot_groq_tokens_total"),
+        "groq_errors": total("bot_groq_requests_total", outcome="error"),
+        "kb_entries": total("bot_kb_entries"),
+        "kb_generation": total("bot_kb_generation"),
+        "send_queue": total("bot_send_queue_depth"),
+        "rss_mb": total("bot_process_rss_bytes") / (1024 * 1024),
+    }
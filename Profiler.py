@@ -0,0 +1,244 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/profiler.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = "logs"
+PROFILE_PREFIX = "profile-"
+SAMPLE_INTERVAL = 0.01     # Период снятия стеков, сек (100 Гц)
+DEFAULT_DURATION = 30      # Длительность профилирования по умолчанию, сек
+MAX_DURATION = 300         # Дольше профилировать не даём
+MAX_STACK_DEPTH = 128
+
+
+def frame_name(code) -> str:
+    """Имя кадра для свёрнутых стеков: функция и место её определения (без ';' — это разделитель)."""
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+class SamplingProfiler:
+    """
+    Выборочный профилировщик для работающего процесса: отдельный поток каждые interval секунд
+    снимает стеки всех потоков (sys._current_frames) и считает одинаковые стеки.
+    Бота не нужно перезапускать, накладные расходы — доли процента на частоте 100 Гц.
+    Результат — свёрнутые стеки (flamegraph.pl, speedscope) и JSON для speedscope.app.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL, directory: str = PROFILE_DIR):
+        self.interval = interval
+        self.directory = directory
+        self.samples: Counter = Counter()  # (поток, кадры от внешнего к внутреннему) -> число выборок
+        self.started_at: Optional[float] = None
+        self.duration = 0.0
+        self.last_result: Optional[dict] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._done = threading.Event()
+        self._done.set()
+
+    @property
+    def running(self) -> bool:
+        return not self._done.is_set()
+
+    def start(self, duration: float = DEFAULT_DURATION) -> bool:
+        """Запускает профилирование на duration секунд; False, если оно уже идёт."""
+        if self.running:
+            return False
+        duration = min(max(float(duration), 1.0), MAX_DURATION)
+        self.samples = Counter()
+        self.started_at = time.time()
+        self.duration = duration
+        self._stopped.clear()
+        self._done.clear()
+        self._thread = threading.Thread(target=self._run, args=(duration,), name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"Профилирование запущено на {duration:.0f} сек (период {self.interval * 1000:.0f} мс)")
+        return True
+
+    def stop(self):
+        """Досрочно завершает профилирование (результат всё равно сохраняется)."""
+        self._stopped.set()
+
+    async def wait(self) -> Optional[dict]:
+        """Дожидается окончания профилирования, не блокируя цикл событий."""
+        await asyncio.to_thread(self._done.wait)
+        return self.last_result
+
+    def _run(self, duration: float):
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        code_names: Dict[object, str] = {}
+        deadline = time.monotonic() + duration
+        try:
+            while time.monotonic() < deadline and not self._stopped.wait(self.interval):
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    stack = []
+                    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                        code = frame.f_code
+                        name = code_names.get(code)
+                        if name is None:
+                            name = code_names[code] = frame_name(code)
+                        stack.append(name)
+                        frame = frame.f_back
+                    if thread_id not in names:
+                        names = {thread.ident: thread.name for thread in threading.enumerate()}
+                    thread_name = names.get(thread_id, str(thread_id)).replace(";", ",")
+                    self.samples[(thread_name, tuple(reversed(stack)))] += 1
+                frame = None
+            self.last_result = self.save()
+        except Exception as e:
+            logger.error(f"Ошибка профилирования: {e}")
+            self.last_result = None
+        finally:
+            self._done.set()
+
+    # --- Выгрузка ---
+
+    def collapsed(self) -> str:
+        """Свёрнутые стеки: «поток;внешний;...;внутренний число» — одна строка на стек."""
+        lines = [
+            ";".join((thread_name,) + stack) + f" {count}"
+            for (thread_name, stack), count in sorted(self.samples.items())
+        ]
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str) -> dict:
+        """Профиль в формате speedscope (sampled), по профилю на поток."""
+        frames: List[dict] = []
+        frame_index: Dict[str, int] = {}
+        threads: Dict[str, Tuple[list, list]] = {}
+        for (thread_name, stack), count in sorted(self.samples.items()):
+            indexes = []
+            for frame in stack:
+                index = frame_index.get(frame)
+                if index is None:
+                    index = frame_index[frame] = len(frames)
+                    frames.append({"name": frame})
+                indexes.append(index)
+            samples, weights = threads.setdefault(thread_name, ([], []))
+            samples.append(indexes)
+            weights.append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "AIBot Profiler.py",
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": thread_name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": samples,
+                    "weights": weights,
+                }
+                for thread_name, (samples, weights) in threads.items()
+            ],
+        }
+
+    def top(self, limit: int = 10) -> List[Tuple[str, int]]:
+        """Функции, в которых чаще всего оказывался поток (собственное время, без простоя в select)."""
+        own = Counter()
+        for (_, stack), count in self.samples.items():
+            if stack:
+                own[stack[-1]] += count
+        idle = ("select (selectors.py", "wait (threading.py", "_worker (thread.py")
+        return [
+            (frame, count) for frame, count in own.most_common() if not any(marker in frame for marker in idle)
+        ][:limit]
+
+    def save(self) -> dict:
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started_at))
+        base = os.path.join(self.directory, f"{PROFILE_PREFIX}{stamp}")
+        with open(base + ".collapsed.txt", "w", encoding='utf-8') as f:
+            f.write(self.collapsed())
+        with open(base + ".speedscope.json", "w", encoding='utf-8') as f:
+            json.dump(self.speedscope(os.path.basename(base)), f, ensure_ascii=False)
+        result = {
+            "collapsed": base + ".collapsed.txt",
+            "speedscope": base + ".speedscope.json",
+            "samples": sum(self.samples.values()),
+            "duration": round(time.time() - self.started_at, 1),
+            "top": self.top(),
+        }
+        logger.info(f"Профиль сохранён: {result['speedscope']} ({result['samples']} выборок)")
+        return result
+
+    def status(self) -> dict:
+        return {
+            "running": self.running,
+            "started_at": self.started_at,
+            "duration": self.duration,
+            "last_result": self.last_result,
+        }
+
+
+profiler = SamplingProfiler()
+
+
+def list_profiles(directory: str = PROFILE_DIR) -> List[dict]:
+    """Сохранённые профили (новые первыми) для админ-панели."""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for name in sorted(names, reverse=True):
+        if not name.startswith(PROFILE_PREFIX):
+            continue
+        path = os.path.join(directory, name)
+        profiles.append({"name": name, "size": os.path.getsize(path), "mtime": os.path.getmtime(path)})
+    return profiles
+
+
+async def profile_handler(request):
+    """
+    POST /profile?seconds=N на локальном сервере метрик бота — запуск профилирования
+    из админ-панели; GET /profile — состояние.
+    """
+    from aiohttp import web
+    if request.method == "POST":
+        try:
+            seconds = float(request.query.get("seconds", DEFAULT_DURATION))
+        except ValueError:
+            return web.json_response({"error": "seconds должно быть числом"}, status=400)
+        if not profiler.start(seconds):
+            return web.json_response({"error": "Профилирование уже идёт", **profiler.status()}, status=409)
+        return web.json_response(profiler.status(), status=202)
+    return web.json_response(profiler.status())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Свёрнутые стеки профиля: самые частые функции")
+    parser.add_argument("path", help="Файл .collapsed.txt")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+    totals = Counter()
+    with open(args.path, encoding='utf-8') as f:
+        for line in f:
+            stack, _, count = line.rstrip().rpartition(" ")
+            if stack:
+                totals[stack.rsplit(";", 1)[-1]] += int(count)
+    for frame, count in totals.most_common(args.limit):
+        print(f"{count:>8}  {frame}")
@@ -1,6 +1,10 @@
 import json
 import os
 import logging
+import threading
+import time
+from types import MappingProxyType
+from Matcher import build_matcher
 
 # Настройка логирования
 logging.basicConfig(
@@ -76,8 +80,12 @@ def load_prompts():
                 "как тебя зовут": "Меня зовут Зелёный!..."
             },
             "search_instructions": [
-                {"theme": "юридическая информация", "site": "consultant.ru", "instructions": ""},
-                {"theme": "товар dns", "site": "dns-shop.ru", "instructions": ""}
+                {"theme": "юридическая информация", "site": "consultant.ru", "instructions": "",
+                 "cache_ttl": 86400, "negative_cache_ttl": 600,
+                 "timeouts": {"connect": 3, "total": 8}},
+                {"theme": "товар dns", "site": "dns-shop.ru", "instructions": "",
+                 "cache_ttl": 86400, "negative_cache_ttl": 600,
+                 "timeouts": {"connect": 3, "total": 8}}
             ],
             "emojis": {
                 "instruction": "📋",
@@ -105,5 +113,142 @@ def save_prompts(prompts):
         with open(PROMPTS_FILE, "w", encoding='utf-8') as f:
             json.dump(prompts, f, ensure_ascii=False, indent=4)
         logger.info("Настройки успешно сохранены в prompts.json")
+        prompts_service.reload()
     except Exception as e:
-        logger.error(f"Ошибка сохранения prompts.json: {e}")
\ No newline at end of file
+        logger.error(f"Ошибка сохранения prompts.json: {e}")
+
+def _freeze(value):
+    """Рекурсивно превращает словари и списки в неизменяемые MappingProxyType и кортежи."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+class PromptsSnapshot:
+    """
+    Неизменяемый снимок prompts.json с номером версии.
+    Производные структуры (автомат диалогов, системный промпт, таблицы команд, клавиатуры)
+    строятся один раз на версию через derived() и живут вместе со снимком.
+    """
+
+    def __init__(self, data: dict, version: int):
+        self.data = _freeze(data)
+        self.version = version
+        self._derived = {}
+
+    def derived(self, name: str, builder):
+        """Возвращает производную структуру, построив её при первом обращении к этой версии."""
+        if name not in self._derived:
+            self._derived[name] = builder(self)
+        return self._derived[name]
+
+class PromptsService:
+    """
+    Хранит текущий снимок настроек в памяти и перечитывает prompts.json при его изменении
+    (через inotify с помощью watchdog, а если он не установлен — опросом в фоновом потоке).
+    Горячий путь (get_snapshot) никогда не обращается к диску.
+    """
+
+    POLL_INTERVAL = 2  # сек
+
+    def __init__(self, path: str = PROMPTS_FILE):
+        self.path = path
+        self._snapshot = None
+        self._signature = None
+        self._lock = threading.Lock()
+        self._watching = False
+        self._callbacks = []
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def reload(self, force: bool = False) -> PromptsSnapshot:
+        """Перечитывает файл, если он изменился, и публикует новый снимок."""
+        with self._lock:
+            signature = self._file_signature()
+            if not force and self._snapshot is not None and signature == self._signature:
+                return self._snapshot
+            data = load_prompts()
+            if not data and self._snapshot is not None:
+                logger.error("prompts.json не удалось разобрать, остаётся предыдущая версия настроек")
+                return self._snapshot
+            version = self._snapshot.version + 1 if self._snapshot else 1
+            self._snapshot = PromptsSnapshot(data, version)
+            self._signature = signature
+            logger.info(f"Настройки загружены из prompts.json, версия {version}")
+        for callback in list(self._callbacks):
+            try:
+                callback(self._snapshot)
+            except Exception as e:
+                logger.error(f"Ошибка обработчика обновления настроек: {e}")
+        return self._snapshot
+
+    def get_snapshot(self) -> PromptsSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self.reload()
+        return snapshot
+
+    def subscribe(self, callback):
+        """Регистрирует функцию, вызываемую с новым снимком после каждой перезагрузки."""
+        self._callbacks.append(callback)
+
+    def start_watching(self):
+        """Запускает отслеживание изменений prompts.json."""
+        if self._watching:
+            return
+        self._watching = True
+        self.get_snapshot()
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            logger.info("watchdog не установлен, изменения prompts.json отслеживаются опросом")
+            threading.Thread(target=self._poll, name="prompts-poll", daemon=True).start()
+            return
+
+        service = self
+        target = os.path.abspath(self.path)
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                paths = {getattr(event, "src_path", ""), getattr(event, "dest_path", "")}
+                if target in {os.path.abspath(path) for path in paths if path}:
+                    service.reload()
+
+        observer = Observer()
+        observer.daemon = True
+        observer.schedule(Handler(), os.path.dirname(target), recursive=False)
+        observer.start()
+        logger.info("Изменения prompts.json отслеживаются через inotify")
+
+    def _poll(self):
+        while True:
+            time.sleep(self.POLL_INTERVAL)
+            try:
+                if self._file_signature() != self._signature:
+                    self.reload()
+            except Exception as e:
+                logger.error(f"Ошибка проверки изменений prompts.json: {e}")
+
+prompts_service = PromptsService()
+
+def get_snapshot() -> PromptsSnapshot:
+    """Возвращает текущий снимок настроек (без обращения к диску)."""
+    return prompts_service.get_snapshot()
+
+def get_prompts():
+    """Возвращает текущие настройки (неизменяемое отображение) из снимка."""
+    return prompts_service.get_snapshot().data
+
+def get_matcher():
+    """
+    Возвращает автомат сопоставления (IntentMatcher) для текущей версии настроек.
+    Автомат перестраивается только при изменении prompts.json.
+    """
+    return get_snapshot().derived("matcher", lambda snapshot: build_matcher(snapshot.data))
@@ -0,0 +1,405 @@
+import asyncio
+import itertools
+from abc import ABC, abstractmethod
+import json
+import logging
+import os
+import socket
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/retrieval.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Сервис поиска (Retrieval_server.py) включается переменной RETRIEVAL_SOCKET — путём к Unix-сокету.
+# Без неё бот и админ-панель работают с базой знаний в своём процессе, как раньше.
+RETRIEVAL_SOCKET = os.getenv("RETRIEVAL_SOCKET")
+DEFAULT_SOCKET = os.path.join("cache", "retrieval.sock")
+
+SEARCH_TIMEOUT = 10        # Таймаут поиска, сек
+WRITE_TIMEOUT = 120        # Запись в Google Sheets с векторизацией бывает долгой, сек
+BATCH_WINDOW = 0.002       # Сколько клиент копит одновременные запросы поиска в одну пачку, сек
+MAX_BATCH = 64             # Больше запросов в одной пачке не отправляем
+CONNECT_TIMEOUT = 120      # Сколько бот ждёт готовности сервиса при запуске, сек
+
+UNAVAILABLE_MESSAGE = "База знаний недоступна. Попробуй позже! 😔"
+
+# --- Протокол ---
+# Кадр: заголовок (длина тела u32, операция или статус u8, номер запроса u32) и тело.
+# Ответ несёт номер запроса, поэтому по одному соединению идёт несколько запросов сразу.
+# Строка в теле — длина u32 и UTF-8; список строк — число u32 и строки подряд.
+HEADER = struct.Struct("!IBI")
+UINT = struct.Struct("!I")
+MAX_FRAME = 64 * 1024 * 1024
+
+OP_SEARCH = 1      # Список запросов -> список текстов для модели
+OP_ADD = 2         # Записи (вопрос, ключевые слова, ответ подряд) -> u8 успех
+OP_ENTRIES = 3     # -> записи базы знаний (вопрос, ключевые слова, ответ подряд)
+OP_DELETE = 4      # u32 номер записи -> u8 успех
+OP_RELOAD = 5      # -> u8: база перезагружена из Google Sheets
+OP_STATS = 6       # -> JSON со статистикой (для отладки)
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+ENTRY_FIELDS = ("Question", "Keywords", "Answer")
+
+
+class RetrievalError(Exception):
+    """Сервис поиска недоступен или вернул ошибку."""
+
+
+def pack_strings(strings: List[str]) -> bytes:
+    parts = [UINT.pack(len(strings))]
+    for value in strings:
+        data = value.encode("utf-8")
+        parts.append(UINT.pack(len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+
+def unpack_strings(body: bytes, offset: int = 0) -> Tuple[List[str], int]:
+    (count,), offset = UINT.unpack_from(body, offset), offset + UINT.size
+    strings = []
+    for _ in range(count):
+        (length,), offset = UINT.unpack_from(body, offset), offset + UINT.size
+        strings.append(body[offset:offset + length].decode("utf-8"))
+        offset += length
+    return strings, offset
+
+
+def pack_entries(entries: List[Dict[str, Any]]) -> bytes:
+    return pack_strings([str(entry.get(field, "")) for entry in entries for field in ENTRY_FIELDS])
+
+
+def unpack_entries(body: bytes) -> List[Dict[str, str]]:
+    flat, _ = unpack_strings(body)
+    width = len(ENTRY_FIELDS)
+    return [dict(zip(ENTRY_FIELDS, flat[i:i + width])) for i in range(0, len(flat), width)]
+
+
+def pack_frame(code: int, request_id: int, body: bytes = b"") -> bytes:
+    return HEADER.pack(len(body), code, request_id) + body
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[int, int, bytes]:
+    length, code, request_id = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if length > MAX_FRAME:
+        raise RetrievalError(f"Слишком большой кадр: {length} байт")
+    return code, request_id, await reader.readexactly(length)
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise RetrievalError("Сервис поиска закрыл соединение")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+# --- Бот: асинхронный доступ к базе знаний ---
+
+class Retrieval(ABC):
+    """Поиск по базе знаний и её изменение. shared=True — данные в отдельном процессе, общем с админ-панелью."""
+
+    shared = False
+
+    async def start(self, timeout: float = CONNECT_TIMEOUT):
+        pass
+
+    async def search(self, query: str) -> str:
+        return (await self.search_many([query]))[0]
+
+    @abstractmethod
+    async def search_many(self, queries: List[str]) -> List[str]:
+        ...
+
+    @abstractmethod
+    async def add_entries(self, entries: List[Dict[str, str]]) -> bool:
+        ...
+
+    @abstractmethod
+    async def reload(self) -> bool:
+        ...
+
+    @abstractmethod
+    async def stats(self) -> dict:
+        ...
+
+    async def close(self):
+        pass
+
+
+class LocalRetrieval(Retrieval):
+    """Модель, индекс и база знаний в процессе бота (Google_sheets) — режим по умолчанию."""
+
+    async def search(self, query: str) -> str:
+        from Google_sheets import get_relevant_entries
+        return await get_relevant_entries(query)
+
+    async def search_many(self, queries: List[str]) -> List[str]:
+        from Google_sheets import search_many
+        return await search_many(queries)
+
+    async def add_entries(self, entries: List[Dict[str, str]]) -> bool:
+        from Google_sheets import add_many_to_knowledge_base
+        return await asyncio.to_thread(add_many_to_knowledge_base, entries)
+
+    async def reload(self) -> bool:
+        from Google_sheets import refresh_knowledge_base
+        return await asyncio.to_thread(refresh_knowledge_base)
+
+    async def stats(self) -> dict:
+        from Google_sheets import kb_stats
+        return kb_stats()
+
+
+class ServiceRetrieval(Retrieval):
+    """
+    Клиент сервиса поиска по Unix-сокету. Одно соединение на процесс; ответы сопоставляются запросам
+    по номеру. Одновременные вызовы search за BATCH_WINDOW собираются в один кадр OP_SEARCH,
+    и сервис векторизует их одним вызовом модели.
+    Ошибки связи не выходят наружу: поиск возвращает UNAVAILABLE_MESSAGE, изменения — False, stats — {}.
+    """
+
+    shared = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        self._connect_lock = asyncio.Lock()
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._batch: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._send_tasks = set()  # Цикл событий держит задачи только по слабой ссылке
+        self.batches = 0
+        self.batched_queries = 0
+
+    async def start(self, timeout: float = CONNECT_TIMEOUT):
+        """Ждёт, пока сервис начнёт принимать соединения (он слушает сокет только после загрузки модели и базы)."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            try:
+                await self._connect()
+                break
+            except RetrievalError as e:
+                if loop.time() > deadline:
+                    raise RetrievalError(f"Сервис поиска {self.path} не отвечает: {e}") from e
+                await asyncio.sleep(0.5)
+        stats = await self.stats()
+        logger.info(f"Подключено к сервису поиска {self.path}: {stats.get('entries')} записей")
+
+    async def _connect(self) -> asyncio.StreamWriter:
+        """Возвращает открытое соединение (подключается заново, если прежнее закрылось)."""
+        async with self._connect_lock:
+            writer = self._writer
+            if writer is not None and not writer.is_closing():
+                return writer
+            try:
+                self._reader, writer = await asyncio.open_unix_connection(self.path)
+            except OSError as e:
+                raise RetrievalError(f"Сервис поиска {self.path} недоступен: {e}") from e
+            self._writer = writer
+            self._read_task = asyncio.create_task(self._read_loop(self._reader, writer))
+            return writer
+
+    async def _read_loop(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                status, request_id, body = await read_frame(reader)
+                future = self._pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if status == STATUS_OK:
+                    future.set_result(body)
+                else:
+                    future.set_exception(RetrievalError(body.decode("utf-8", "replace")))
+        except (asyncio.IncompleteReadError, ConnectionError, RetrievalError) as e:
+            logger.warning(f"Соединение с сервисом поиска потеряно: {e}")
+        finally:
+            self._fail_pending(RetrievalError("Соединение с сервисом поиска потеряно"))
+            writer.close()
+            if self._writer is writer:
+                self._writer = None
+
+    def _fail_pending(self, error: Exception):
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    async def _call(self, op: int, body: bytes = b"", timeout: float = SEARCH_TIMEOUT) -> bytes:
+        writer = await self._connect()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            writer.write(pack_frame(op, request_id, body))
+            await writer.drain()
+            return await asyncio.wait_for(future, timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise RetrievalError(f"Сервис поиска не ответил: {type(e).__name__}") from e
+        finally:
+            self._pending.pop(request_id, None)
+
+    # --- Поиск с объединением в пачки ---
+
+    async def search(self, query: str) -> str:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._batch.append((query, future))
+        if len(self._batch) >= MAX_BATCH:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(BATCH_WINDOW, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._batch = self._batch, []
+        if batch:
+            task = asyncio.create_task(self._send_batch(batch))
+            self._send_tasks.add(task)
+            task.add_done_callback(self._send_tasks.discard)
+
+    async def _send_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        self.batches += 1
+        self.batched_queries += len(batch)
+        try:
+            results = await self.search_many([query for query, _ in batch])
+        except Exception as e:
+            results = None
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        for (_, future), result in zip(batch, results or []):
+            if not future.done():
+                future.set_result(result)
+
+    async def search_many(self, queries: List[str]) -> List[str]:
+        try:
+            results, _ = unpack_strings(await self._call(OP_SEARCH, pack_strings(queries)))
+            return results
+        except RetrievalError as e:
+            logger.error(f"Ошибка поиска в сервисе: {e}")
+            return [UNAVAILABLE_MESSAGE] * len(queries)
+
+    # --- Изменение базы ---
+
+    async def add_entries(self, entries: List[Dict[str, str]]) -> bool:
+        rows = [{"Question": entry["question"], "Keywords": entry["keywords"], "Answer": entry["answer"]}
+                for entry in entries]
+        try:
+            return (await self._call(OP_ADD, pack_entries(rows), WRITE_TIMEOUT)) == b"\x01"
+        except RetrievalError as e:
+            logger.error(f"Ошибка добавления записей через сервис поиска: {e}")
+            return False
+
+    async def reload(self) -> bool:
+        try:
+            return (await self._call(OP_RELOAD, timeout=WRITE_TIMEOUT)) == b"\x01"
+        except RetrievalError as e:
+            logger.error(f"Ошибка перезагрузки базы знаний через сервис поиска: {e}")
+            return False
+
+    async def stats(self) -> dict:
+        try:
+            stats = json.loads(await self._call(OP_STATS))
+        except RetrievalError as e:
+            logger.error(f"Ошибка получения статистики сервиса поиска: {e}")
+            return {}
+        stats["client_batches"] = self.batches
+        stats["client_batched_queries"] = self.batched_queries
+        return stats
+
+    async def close(self):
+        if self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+_retrieval: Optional[Retrieval] = None
+
+
+def get_retrieval() -> Retrieval:
+    """
+    Возвращает доступ к базе знаний: ServiceRetrieval, если задан RETRIEVAL_SOCKET,
+    иначе LocalRetrieval (модель и индекс в этом процессе).
+    """
+    global _retrieval
+    if _retrieval is None:
+        if RETRIEVAL_SOCKET:
+            _retrieval = ServiceRetrieval(RETRIEVAL_SOCKET)
+            logger.info(f"Поиск по базе знаний — в сервисе {RETRIEVAL_SOCKET}")
+        else:
+            _retrieval = LocalRetrieval()
+            logger.info("Поиск по базе знаний — в процессе бота")
+    return _retrieval
+
+
+# --- Админ-панель: синхронный доступ ---
+
+class SyncRetrievalClient:
+    """Блокирующий клиент сервиса поиска для Flask: соединение на вызов, один запрос — один ответ."""
+
+    def __init__(self, path: str, timeout: float = WRITE_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+
+    def call(self, op: int, body: bytes = b"") -> bytes:
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.connect(self.path)
+                sock.sendall(pack_frame(op, 1, body))
+                length, status, _ = HEADER.unpack(_recv_exactly(sock, HEADER.size))
+                body = _recv_exactly(sock, length)
+        except OSError as e:
+            raise RetrievalError(f"Сервис поиска {self.path} недоступен: {e}") from e
+        if status != STATUS_OK:
+            raise RetrievalError(body.decode("utf-8", "replace"))
+        return body
+
+
+def list_entries() -> List[Dict[str, Any]]:
+    """Записи базы знаний: из памяти сервиса поиска или, без сервиса, из Google Sheets без векторизации."""
+    if RETRIEVAL_SOCKET:
+        return unpack_entries(SyncRetrievalClient(RETRIEVAL_SOCKET).call(OP_ENTRIES))
+    from Google_sheets import fetch_entries
+    return fetch_entries()
+
+
+def add_entry(question: str, keywords: str, answer: str) -> bool:
+    """Добавляет запись; через сервис она сразу попадает в индекс, по которому отвечает бот."""
+    if RETRIEVAL_SOCKET:
+        body = pack_entries([{"Question": question, "Keywords": keywords, "Answer": answer}])
+        return SyncRetrievalClient(RETRIEVAL_SOCKET).call(OP_ADD, body) == b"\x01"
+    from Google_sheets import add_to_knowledge_base
+    return add_to_knowledge_base(question, keywords, answer)
+
+
+def delete_entry(index: int) -> bool:
+    if RETRIEVAL_SOCKET:
+        return SyncRetrievalClient(RETRIEVAL_SOCKET).call(OP_DELETE, UINT.pack(index)) == b"\x01"
+    from Google_sheets import delete_from_knowledge_base
+    return delete_from_knowledge_base(index)
@@ -0,0 +1,151 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+from typing import Dict, Optional
+import Google_sheets as sheets
+from Retrieval import (
+    DEFAULT_SOCKET, UINT, OP_ADD, OP_DELETE, OP_ENTRIES, OP_RELOAD, OP_SEARCH, OP_STATS,
+    STATUS_ERROR, STATUS_OK, RetrievalError, pack_entries, pack_frame, pack_strings, read_frame,
+    unpack_entries, unpack_strings
+)
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/retrieval_server.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+
+class RetrievalServer:
+    """
+    Сервис поиска по базе знаний: единственный процесс, который держит модель SentenceTransformer,
+    индекс FAISS и записи базы. Бот (ServiceRetrieval) и админ-панель (SyncRetrievalClient)
+    обращаются к нему по Unix-сокету, поэтому запись из админ-панели сразу видна в ответах бота,
+    а модель загружается в память один раз, а не в каждом процессе.
+    Поиск выполняется параллельно, изменения базы — по одному (asyncio.Lock) в отдельном потоке.
+    Изменение не трогает индекс, по которому идёт поиск: новая версия базы строится рядом
+    и подменяет прежнюю целиком (Google_sheets._publish), а поиск работает со взятым в начале снимком.
+    """
+
+    def __init__(self, path: str = DEFAULT_SOCKET):
+        self.path = path
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.kb_source: Optional[str] = None
+        self._write_lock = asyncio.Lock()
+        self._refresh: Optional[asyncio.Task] = None
+        self._connections: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self.requests = 0
+        self.searches = 0
+
+    async def start(self):
+        # Сокет открывается только после загрузки: подключение клиента означает готовность сервиса
+        await asyncio.to_thread(sheets.get_model)
+        self.kb_source = await sheets.initialize_knowledge_base()
+        await asyncio.to_thread(sheets.warm_up_encoder)
+        if self.kb_source == "cache":
+            self._refresh = asyncio.create_task(self._write(sheets.refresh_knowledge_base))
+        if os.path.exists(self.path):
+            os.remove(self.path)  # Сокет от прошлого запуска
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.server = await asyncio.start_unix_server(self.handle_connection, path=self.path)
+        os.chmod(self.path, 0o600)
+        logger.info(f"Сервис поиска слушает {self.path}: {len(sheets.knowledge_base)} записей ({self.kb_source})")
+
+    async def stop(self):
+        if self._refresh is not None and not self._refresh.done():
+            self._refresh.cancel()
+        if self.server is not None:
+            self.server.close()
+            # Закрытие сервера не разрывает открытые соединения: закрываем их сами, дав доработать начатым запросам
+            for writer in self._connections.values():
+                writer.transport.close()
+            if self._connections:
+                await asyncio.wait(list(self._connections))
+            await self.server.wait_closed()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        logger.info("Сервис поиска остановлен")
+
+    async def _write(self, func, *args):
+        async with self._write_lock:
+            return await asyncio.to_thread(func, *args)
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Запросы одного клиента обрабатываются параллельно, ответы уходят по мере готовности."""
+        tasks = set()
+        self._connections[asyncio.current_task()] = writer
+        try:
+            while True:
+                op, request_id, body = await read_frame(reader)
+                task = asyncio.create_task(self._respond(writer, op, request_id, body))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError, RetrievalError):
+            pass  # Клиент отключился
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            self._connections.pop(asyncio.current_task(), None)
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter, op: int, request_id: int, body: bytes):
+        self.requests += 1
+        try:
+            status, result = STATUS_OK, await self.dispatch(op, body)
+        except Exception as e:
+            logger.exception(f"Ошибка обработки операции {op}")
+            status, result = STATUS_ERROR, str(e).encode("utf-8")
+        if writer.is_closing():
+            return
+        writer.write(pack_frame(status, request_id, result))
+        await writer.drain()
+
+    async def dispatch(self, op: int, body: bytes) -> bytes:
+        if op == OP_SEARCH:
+            queries, _ = unpack_strings(body)
+            self.searches += len(queries)
+            return pack_strings(await sheets.search_many(queries))
+        if op == OP_ADD:
+            entries = [{"question": entry["Question"], "keywords": entry["Keywords"], "answer": entry["Answer"]}
+                       for entry in unpack_entries(body)]
+            return bytes([await self._write(sheets.add_many_to_knowledge_base, entries)])
+        if op == OP_ENTRIES:
+            return pack_entries(sheets.knowledge_base)
+        if op == OP_DELETE:
+            (index,) = UINT.unpack(body[:UINT.size])
+            return bytes([await self._write(sheets.delete_from_knowledge_base, index)])
+        if op == OP_RELOAD:
+            return bytes([await self._write(sheets.refresh_knowledge_base)])
+        if op == OP_STATS:
+            stats = dict(sheets.kb_stats(), source=self.kb_source, requests=self.requests, searches=self.searches)
+            return json.dumps(stats, ensure_ascii=False).encode("utf-8")
+        raise ValueError(f"Неизвестная операция: {op}")
+
+
+async def _main(path: str):
+    server = RetrievalServer(path)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await server.start()
+    try:
+        await stop.wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сервис поиска по базе знаний, общий для бота и админ-панели")
+    parser.add_argument("--socket", default=os.getenv("RETRIEVAL_SOCKET") or DEFAULT_SOCKET,
+                        help="путь к Unix-сокету (тот же, что в RETRIEVAL_SOCKET у бота и админ-панели)")
+    args = parser.parse_args()
+    asyncio.run(_main(args.socket))
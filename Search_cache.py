@@ -0,0 +1,217 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/search_cache.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Путь к базе кэша поиска (общая для бота и админ-панели)
+SEARCH_CACHE_DIR = "search_cache"
+SEARCH_CACHE_DB = os.path.join(SEARCH_CACHE_DIR, "search_cache.db")
+# Старый JSON-кэш, переносится в SQLite при первом запуске
+LEGACY_SEARCH_CACHE_FILE = os.path.join(SEARCH_CACHE_DIR, "search_results.json")
+
+# Значения по умолчанию (переопределяются в search_instructions для каждого сайта)
+DEFAULT_TTL = 24 * 60 * 60          # Время жизни найденных результатов, сек
+DEFAULT_NEGATIVE_TTL = 10 * 60      # Время жизни результата "не найдено", сек
+DEFAULT_MAX_ENTRIES = 5000          # Максимальное число записей в кэше
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024  # Максимальный суммарный размер значений, байт
+
+# Как часто обновлять время последнего обращения (чтобы чтение не превращалось в запись)
+TOUCH_INTERVAL = 60
+# Как часто (в числе вставок) проверять лимиты кэша
+EVICT_EVERY = 50
+
+
+class SearchCache:
+    """
+    Персистентный кэш результатов поиска на сайтах на базе SQLite (режим WAL).
+    Поддерживает TTL для каждой записи, отрицательное кэширование ("не найдено")
+    и вытеснение самых давно использованных записей при превышении лимитов.
+    Безопасен при одновременной работе бота и админ-панели.
+    """
+
+    def __init__(self, path: str = SEARCH_CACHE_DB, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._inserts = 0
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._init_db()
+        self._migrate_legacy_cache()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Возвращает соединение для текущего потока (sqlite3 не разделяет соединения между потоками)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.execute('''CREATE TABLE IF NOT EXISTS search_cache (
+            key TEXT PRIMARY KEY,
+            site TEXT NOT NULL,
+            value TEXT NOT NULL,
+            negative INTEGER NOT NULL DEFAULT 0,
+            size INTEGER NOT NULL,
+            created REAL NOT NULL,
+            expires REAL NOT NULL,
+            last_access REAL NOT NULL
+        )''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_expires ON search_cache (expires)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_last_access ON search_cache (last_access)")
+
+    def _migrate_legacy_cache(self):
+        """Переносит записи из старого search_results.json и переименовывает файл."""
+        legacy_file = os.path.join(os.path.dirname(self.path), os.path.basename(LEGACY_SEARCH_CACHE_FILE))
+        if not os.path.exists(legacy_file):
+            return
+        try:
+            with open(legacy_file, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+            now = time.time()
+            rows = []
+            for cache_key, value in legacy.items():
+                site = cache_key.split(":", 1)[0]
+                rows.append((cache_key, site, value, 0, len(value.encode('utf-8')), now, now + DEFAULT_TTL, now))
+            self._connect().executemany(
+                "INSERT OR IGNORE INTO search_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            os.replace(legacy_file, legacy_file + ".migrated")
+            logger.info(f"Перенесено {len(rows)} записей из {legacy_file} в {self.path}")
+        except Exception as e:
+            logger.error(f"Ошибка переноса старого кэша поиска: {e}")
+
+    @staticmethod
+    def make_key(site: str, query: str) -> str:
+        return f"{site}:{query}"
+
+    def get(self, site: str, query: str) -> Optional[Tuple[str, bool]]:
+        """
+        Возвращает (значение, negative) или None, если записи нет или она устарела.
+        """
+        key = self.make_key(site, query)
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, negative, expires, last_access FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+            now = time.time()
+            if row is None or row[2] <= now:
+                self.misses += 1
+                return None
+            if now - row[3] > TOUCH_INTERVAL:
+                conn.execute("UPDATE search_cache SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0], bool(row[1])
+        except Exception as e:
+            logger.error(f"Ошибка чтения кэша поиска для {key}: {e}")
+            self.misses += 1
+            return None
+
+    def set(self, site: str, query: str, value: str, ttl: float = DEFAULT_TTL, negative: bool = False):
+        """Сохраняет результат поиска с указанным временем жизни."""
+        key = self.make_key(site, query)
+        now = time.time()
+        try:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, site, value, int(negative), len(value.encode('utf-8')), now, now + ttl, now)
+            )
+            self._inserts += 1
+            if self._inserts % EVICT_EVERY == 0:
+                self.evict()
+        except Exception as e:
+            logger.error(f"Ошибка записи в кэш поиска для {key}: {e}")
+
+    def delete(self, site: str, query: str):
+        try:
+            self._connect().execute("DELETE FROM search_cache WHERE key = ?", (self.make_key(site, query),))
+        except Exception as e:
+            logger.error(f"Ошибка удаления из кэша поиска: {e}")
+
+    def evict(self):
+        """Удаляет устаревшие записи, затем самые давно использованные — до соблюдения лимитов."""
+        try:
+            conn = self._connect()
+            expired = conn.execute("DELETE FROM search_cache WHERE expires <= ?", (time.time(),)).rowcount
+            count, total_bytes = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM search_cache"
+            ).fetchone()
+            evicted = 0
+            if count > self.max_entries:
+                evicted += conn.execute(
+                    "DELETE FROM search_cache WHERE key IN "
+                    "(SELECT key FROM search_cache ORDER BY last_access LIMIT ?)",
+                    (count - self.max_entries,)
+                ).rowcount
+                total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM search_cache").fetchone()[0]
+            while total_bytes > self.max_bytes:
+                rows = conn.execute(
+                    "SELECT key, size FROM search_cache ORDER BY last_access LIMIT 100"
+                ).fetchall()
+                if not rows:
+                    break
+                victims = []
+                for key, size in rows:
+                    victims.append((key,))
+                    total_bytes -= size
+                    if total_bytes <= self.max_bytes:
+                        break
+                conn.executemany("DELETE FROM search_cache WHERE key = ?", victims)
+                evicted += len(victims)
+            if expired or evicted:
+                logger.info(f"Кэш поиска очищен: устаревших {expired}, вытеснено {evicted}")
+        except Exception as e:
+            logger.error(f"Ошибка очистки кэша поиска: {e}")
+
+    def stats(self) -> dict:
+        """Возвращает статистику кэша для мониторинга."""
+        try:
+            count, total_bytes, negative = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(negative), 0) FROM search_cache"
+            ).fetchone()
+        except Exception as e:
+            logger.error(f"Ошибка получения статистики кэша поиска: {e}")
+            count, total_bytes, negative = 0, 0, 0
+        return {
+            "entries": count,
+            "bytes": total_bytes,
+            "negative_entries": negative,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+_search_cache: Optional[SearchCache] = None
+
+
+def get_search_cache() -> SearchCache:
+    """Возвращает общий экземпляр кэша поиска (создаётся при первом обращении)."""
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = SearchCache()
+    return _search_cache
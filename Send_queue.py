@@ -0,0 +1,263 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Dict, Optional
+from aiogram import types
+from aiogram.exceptions import TelegramRetryAfter
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/send_queue.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram Bot API
+GLOBAL_RATE = 30            # Сообщений в секунду на бота
+GLOBAL_BURST = 30
+PRIVATE_CHAT_RATE = 1       # Сообщений в секунду в личный чат
+PRIVATE_CHAT_BURST = 3
+GROUP_CHAT_RATE = 20 / 60   # Сообщений в секунду в группу (20 в минуту)
+GROUP_CHAT_BURST = 3
+MAX_RETRIES = 3             # Повторов после flood wait
+
+# Приоритеты (меньше — важнее)
+PRIORITY_FIRST = 0          # Первое сообщение/правка ответа: пользователь ждёт именно его
+PRIORITY_FOLLOWUP = 1       # Продолжение длинного ответа
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity накопленных."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд будет доступен токен (0 — прямо сейчас)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class OutgoingItem:
+    """Исходящее сообщение, документ или правка, ожидающие отправки."""
+
+    __slots__ = ("kind", "chat_id", "target", "kwargs", "priority", "seq", "future", "merged", "attempts")
+
+    def __init__(self, kind: str, chat_id: int, target: types.Message, kwargs: dict, priority: int, seq: int):
+        self.kind = kind
+        self.chat_id = chat_id
+        self.target = target
+        self.kwargs = kwargs
+        self.priority = priority
+        self.seq = seq
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.merged = []  # Futures вытесненных правок того же сообщения
+        self.attempts = 0
+
+    async def send(self) -> Any:
+        if self.kind == "edit":
+            return await self.target.edit_text(**self.kwargs)
+        if self.kind == "reply":
+            return await self.target.reply(**self.kwargs)
+        if self.kind == "document":
+            return await self.target.reply_document(**self.kwargs)
+        return await self.target.answer(**self.kwargs)
+
+    def resolve(self, result: Any = None, error: Optional[BaseException] = None):
+        for future in [self.future] + self.merged:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+class ChatQueue:
+    """
+    Очередь одного чата: приоритетная куча, ведро токенов и пауза после flood wait.
+    В чат одновременно отправляется не больше одного сообщения, чтобы части ответа не перемешались.
+    """
+
+    def __init__(self, chat_id: int):
+        self.heap = []
+        self.bucket = TokenBucket(PRIVATE_CHAT_RATE, PRIVATE_CHAT_BURST) if chat_id > 0 \
+            else TokenBucket(GROUP_CHAT_RATE, GROUP_CHAT_BURST)
+        self.blocked_until = 0.0
+        self.sending = False
+
+    def ready_in(self, now: float) -> float:
+        return max(self.blocked_until - now, self.bucket.wait_time(now), 0.0)
+
+
+class SendQueue:
+    """
+    Планировщик исходящих сообщений Telegram.
+    Соблюдает лимиты на чат и на бота (ведра токенов), выдерживает паузу RetryAfter
+    и повторяет отправку, отправляет первые части ответов раньше продолжений,
+    а несколько правок одного сообщения, ещё не отправленных, сливает в одну (последнюю).
+    """
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        self.chats: Dict[int, ChatQueue] = {}
+        self.pending_edits: Dict[tuple, OutgoingItem] = {}
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._in_flight = set()
+        self.sent = 0
+        self.merged = 0
+        self.flood_waits = 0
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+
+    def _enqueue(self, item: OutgoingItem) -> asyncio.Future:
+        self._ensure_worker()
+        if item.kind == "edit":
+            key = (item.chat_id, item.target.message_id)
+            previous = self.pending_edits.get(key)
+            if previous is not None:
+                # Ещё не отправленная правка того же сообщения: заменяем текст, сохраняя место в очереди
+                previous.kwargs = item.kwargs
+                previous.merged.append(item.future)
+                previous.priority = min(previous.priority, item.priority)
+                self.merged += 1
+                return item.future
+            self.pending_edits[key] = item
+        chat = self.chats.get(item.chat_id)
+        if chat is None:
+            chat = self.chats[item.chat_id] = ChatQueue(item.chat_id)
+        heapq.heappush(chat.heap, (item.priority, item.seq, item))
+        self._wakeup.set()
+        return item.future
+
+    def _new_item(self, kind: str, target: types.Message, kwargs: dict, priority: int) -> OutgoingItem:
+        return OutgoingItem(kind, target.chat.id, target, kwargs, priority, next(self._seq))
+
+    async def edit_text(self, message: types.Message, text: str, priority: int = PRIORITY_FIRST, **kwargs) -> Any:
+        """Ставит в очередь правку текста сообщения и ждёт её отправки."""
+        return await self._enqueue(self._new_item("edit", message, dict(text=text, **kwargs), priority))
+
+    async def reply(self, message: types.Message, text: str, priority: int = PRIORITY_FOLLOWUP, **kwargs) -> Any:
+        """Ставит в очередь ответ на сообщение и ждёт его отправки."""
+        return await self._enqueue(self._new_item("reply", message, dict(text=text, **kwargs), priority))
+
+    async def answer(self, message: types.Message, text: str, priority: int = PRIORITY_FOLLOWUP, **kwargs) -> Any:
+        """Ставит в очередь сообщение в чат и ждёт его отправки."""
+        return await self._enqueue(self._new_item("answer", message, dict(text=text, **kwargs), priority))
+
+    async def reply_document(self, message: types.Message, document: types.InputFile,
+                             priority: int = PRIORITY_FOLLOWUP, **kwargs) -> Any:
+        """Ставит в очередь ответ файлом и ждёт его отправки."""
+        return await self._enqueue(self._new_item("document", message, dict(document=document, **kwargs), priority))
+
+    def _pick(self, now: float):
+        """Выбирает самое приоритетное сообщение среди готовых чатов или время до ближайшей готовности."""
+        best, best_chat, next_ready = None, None, None
+        for chat_id, chat in list(self.chats.items()):
+            if chat.sending:
+                continue
+            if not chat.heap:
+                if chat.bucket.wait_time(now) == 0 and chat.blocked_until <= now:
+                    del self.chats[chat_id]  # Пустой и "остывший" чат больше не нужен
+                continue
+            ready_in = chat.ready_in(now)
+            if ready_in > 0:
+                next_ready = ready_in if next_ready is None else min(next_ready, ready_in)
+                continue
+            head = chat.heap[0]
+            if best is None or head[:2] < best[:2]:
+                best, best_chat = head, chat
+        return best, best_chat, next_ready
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            global_wait = self.global_bucket.wait_time(now)
+            if global_wait > 0:
+                await asyncio.sleep(global_wait)
+                continue
+            best, chat, next_ready = self._pick(now)
+            if best is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=next_ready)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(chat.heap)
+            item = best[2]
+            if item.kind == "edit":
+                self.pending_edits.pop((item.chat_id, item.target.message_id), None)
+            self.global_bucket.take(now)
+            chat.bucket.take(now)
+            chat.sending = True
+            task = asyncio.create_task(self._send(item, chat))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _send(self, item: OutgoingItem, chat: ChatQueue):
+        try:
+            await self._deliver(item, chat)
+        finally:
+            chat.sending = False
+            self._wakeup.set()
+
+    async def _deliver(self, item: OutgoingItem, chat: ChatQueue):
+        try:
+            result = await item.send()
+            self.sent += 1
+            item.resolve(result)
+        except TelegramRetryAfter as e:
+            self.flood_waits += 1
+            item.attempts += 1
+            logger.warning(f"Flood wait {e.retry_after} сек для чата {item.chat_id} (попытка {item.attempts})")
+            chat.blocked_until = time.monotonic() + e.retry_after
+            if item.attempts > MAX_RETRIES:
+                item.resolve(error=e)
+                return
+            # Возвращаем в очередь (без слияния: сообщение уже вышло из pending_edits)
+            current = self.chats.setdefault(item.chat_id, chat)
+            heapq.heappush(current.heap, (item.priority, item.seq, item))
+        except Exception as e:
+            item.resolve(error=e)
+
+    def stats(self) -> dict:
+        return {
+            "queued": sum(len(chat.heap) for chat in self.chats.values()),
+            "in_flight": len(self._in_flight),
+            "chats": len(self.chats),
+            "sent": self.sent,
+            "merged_edits": self.merged,
+            "flood_waits": self.flood_waits,
+        }
+
+    async def drain(self, timeout: float = 10):
+        """Ждёт отправки всех сообщений из очереди (при остановке бота)."""
+        deadline = time.monotonic() + timeout
+        while (any(chat.heap for chat in self.chats.values()) or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+
+send_queue = SendQueue()
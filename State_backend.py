@@ -0,0 +1,233 @@
+import asyncio
+import json
+from abc import ABC, abstractmethod
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+import aiohttp
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/state_backend.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+STATE_DB = os.path.join("cache", "state.db")
+
+# Пространства имён и время жизни ключей по умолчанию
+FSM_NAMESPACE = "fsm"
+DIALOG_NAMESPACE = "dialog"
+SEARCH_NAMESPACE = "search"
+FSM_TTL = 24 * 60 * 60          # Незавершённый сценарий (например, /add_qa) хранится сутки
+DIALOG_TTL = 24 * 60 * 60       # Контекст диалога живёт сутки с последнего сообщения
+
+PURGE_INTERVAL = 10 * 60        # Как часто удалять просроченные ключи, сек
+NETWORK_TIMEOUT = 2             # Таймаут запроса к серверу состояния, сек
+STATE_TOKEN_ENV = "STATE_BACKEND_TOKEN"  # Общий токен копий бота и сервера состояния (State_server.py)
+
+
+class StateBackend(ABC):
+    """
+    Общее хранилище состояния бота: ключ -> JSON-значение с необязательным TTL,
+    разложенное по пространствам имён. Реализации: SQLiteStateBackend (один хост,
+    несколько процессов) и NetworkStateBackend (сервер State_server.py для нескольких хостов).
+    """
+
+    # Видно ли состояние другим копиям бота на других хостах
+    shared = False
+
+    @abstractmethod
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        ...
+
+    @abstractmethod
+    async def delete(self, namespace: str, key: str):
+        ...
+
+    async def close(self):
+        pass
+
+
+class SQLiteStateBackend(StateBackend):
+    """
+    Хранилище состояния в SQLite (режим WAL). Переживает перезапуск и доступно
+    всем процессам бота на одном хосте. Запросы выполняются в потоках, чтобы не блокировать цикл событий.
+    """
+
+    def __init__(self, path: str = STATE_DB):
+        self.path = path
+        self._local = threading.local()
+        self._last_purge = 0.0
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._connect().execute('''CREATE TABLE IF NOT EXISTS state (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            expires REAL,
+            PRIMARY KEY (namespace, key)
+        )''')
+
+    def _connect(self) -> sqlite3.Connection:
+        """Возвращает соединение для текущего потока (sqlite3 не разделяет соединения между потоками)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def get_sync(self, namespace: str, key: str) -> Optional[Any]:
+        row = self._connect().execute(
+            "SELECT value, expires FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return json.loads(row[0])
+
+    def set_sync(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        now = time.time()
+        self._connect().execute(
+            "INSERT OR REPLACE INTO state VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value, ensure_ascii=False), now + ttl if ttl else None)
+        )
+        if now - self._last_purge > PURGE_INTERVAL:
+            self._last_purge = now
+            self.purge_sync()
+
+    def delete_sync(self, namespace: str, key: str):
+        self._connect().execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def purge_sync(self) -> int:
+        """Удаляет просроченные ключи."""
+        deleted = self._connect().execute(
+            "DELETE FROM state WHERE expires IS NOT NULL AND expires <= ?", (time.time(),)
+        ).rowcount
+        if deleted:
+            logger.info(f"Удалено просроченных ключей состояния: {deleted}")
+        return deleted
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self.get_sync, namespace, key)
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        await asyncio.to_thread(self.set_sync, namespace, key, value, ttl)
+
+    async def delete(self, namespace: str, key: str):
+        await asyncio.to_thread(self.delete_sync, namespace, key)
+
+
+class NetworkStateBackend(StateBackend):
+    """
+    Клиент сервера состояния (State_server.py) по HTTP/JSON.
+    Все копии бота, указывающие на один сервер, видят общее состояние.
+    Токен передаётся в заголовке Authorization: Bearer <token>.
+    """
+
+    shared = True
+
+    def __init__(self, url: str, token: Optional[str] = None, timeout: float = NETWORK_TIMEOUT):
+        self.url = url.rstrip("/")
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def _call(self, operation: str, payload: Dict[str, Any]) -> Any:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout, headers=self.headers)
+        async with self._session.post(f"{self.url}/{operation}", json=payload) as response:
+            response.raise_for_status()
+            return (await response.json()).get("value")
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        return await self._call("get", {"namespace": namespace, "key": key})
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        await self._call("set", {"namespace": namespace, "key": key, "value": value, "ttl": ttl})
+
+    async def delete(self, namespace: str, key: str):
+        await self._call("delete", {"namespace": namespace, "key": key})
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class BackendStorage(BaseStorage):
+    """
+    Хранилище FSM aiogram поверх StateBackend: незавершённые сценарии
+    переживают перезапуск и видны всем копиям бота.
+    """
+
+    def __init__(self, backend: StateBackend, ttl: Optional[float] = FSM_TTL):
+        self.backend = backend
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(key: StorageKey, part: str) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}:{part}"
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        if state is None:
+            await self.backend.delete(FSM_NAMESPACE, self._key(key, "state"))
+            return
+        value = state.state if isinstance(state, State) else state
+        await self.backend.set(FSM_NAMESPACE, self._key(key, "state"), value, ttl=self.ttl)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self.backend.get(FSM_NAMESPACE, self._key(key, "state"))
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        if not data:
+            await self.backend.delete(FSM_NAMESPACE, self._key(key, "data"))
+            return
+        await self.backend.set(FSM_NAMESPACE, self._key(key, "data"), data, ttl=self.ttl)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return await self.backend.get(FSM_NAMESPACE, self._key(key, "data")) or {}
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+_state_backend: Optional[StateBackend] = None
+
+
+def get_state_backend() -> StateBackend:
+    """
+    Возвращает хранилище состояния, выбранное переменными окружения:
+    STATE_BACKEND=sqlite (по умолчанию, файл STATE_DB) или network (адрес в STATE_BACKEND_URL,
+    токен сервера в STATE_BACKEND_TOKEN).
+    """
+    global _state_backend
+    if _state_backend is None:
+        kind = os.getenv("STATE_BACKEND", "sqlite")
+        if kind == "network":
+            url = os.getenv("STATE_BACKEND_URL", "http://127.0.0.1:8090")
+            token = os.getenv(STATE_TOKEN_ENV)
+            if not token:
+                logger.warning(f"{STATE_TOKEN_ENV} не задан: запросы к серверу состояния идут без токена")
+            _state_backend = NetworkStateBackend(url, token)
+            logger.info(f"Состояние бота хранится на сервере {url}")
+        else:
+            _state_backend = SQLiteStateBackend()
+            logger.info(f"Состояние бота хранится в {STATE_DB}")
+    return _state_backend
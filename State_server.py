@@ -0,0 +1,81 @@
+import argparse
+import hmac
+import logging
+import os
+from typing import Optional
+from aiohttp import web
+from State_backend import SQLiteStateBackend, STATE_DB, STATE_TOKEN_ENV
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/state_server.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+STATE_BACKEND = web.AppKey("state_backend", SQLiteStateBackend)
+
+
+def create_state_app(path: str = STATE_DB, token: Optional[str] = None) -> web.Application:
+    """
+    HTTP-сервер общего состояния для NetworkStateBackend: POST /get, /set, /delete с JSON
+    {"namespace", "key", "value", "ttl"}. Данные хранятся в SQLite, поэтому сервер
+    можно перезапускать без потери сессий. Подходит и как локальная замена в проверках.
+    С token каждый запрос должен нести заголовок Authorization: Bearer <token> (общий токен
+    копий бота, STATE_BACKEND_TOKEN), иначе 401: через сервер можно переписать состояние FSM
+    и историю диалогов, поэтому без токена его нельзя открывать наружу.
+    """
+    backend = SQLiteStateBackend(path)
+
+    @web.middleware
+    async def check_token(request: web.Request, handler):
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            logger.warning(f"Запрос к серверу состояния без верного токена от {request.remote}")
+            return web.json_response({"error": "unauthorized"}, status=401)
+        return await handler(request)
+
+    app = web.Application(middlewares=[check_token] if token else [])
+
+    async def get(request: web.Request) -> web.Response:
+        payload = await request.json()
+        value = await backend.get(payload["namespace"], payload["key"])
+        return web.json_response({"value": value})
+
+    async def set_value(request: web.Request) -> web.Response:
+        payload = await request.json()
+        await backend.set(payload["namespace"], payload["key"], payload["value"], payload.get("ttl"))
+        return web.json_response({"value": True})
+
+    async def delete(request: web.Request) -> web.Response:
+        payload = await request.json()
+        await backend.delete(payload["namespace"], payload["key"])
+        return web.json_response({"value": True})
+
+    app.router.add_post("/get", get)
+    app.router.add_post("/set", set_value)
+    app.router.add_post("/delete", delete)
+    app[STATE_BACKEND] = backend
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сервер общего состояния для нескольких копий бота")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--db", default=STATE_DB, help="файл SQLite с состоянием")
+    parser.add_argument("--token", default=os.getenv(STATE_TOKEN_ENV),
+                        help=f"общий токен копий бота (по умолчанию из {STATE_TOKEN_ENV})")
+    args = parser.parse_args()
+    if not args.token:
+        if args.host not in LOCAL_HOSTS:
+            # Без токена любой, кто достучится до порта, перепишет состояние бота
+            parser.error(f"для адреса {args.host} нужен токен: задайте {STATE_TOKEN_ENV} или --token")
+        logger.warning("Токен не задан: сервер состояния принимает запросы без проверки (только локально)")
+    logger.info(f"Сервер состояния слушает http://{args.host}:{args.port}, база {args.db}")
+    web.run_app(create_state_app(args.db, args.token), host=args.host, port=args.port)
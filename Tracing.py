@@ -0,0 +1,208 @@
+import argparse
+import bisect
+import contextvars
+import json
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/tracing.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+TRACE_FILE = "logs/traces.jsonl"
+
+# Трассы запросов: одна строка JSON на запрос (корневой спан с вложенными)
+trace_logger = logging.getLogger("traces")
+trace_handler = logging.FileHandler(TRACE_FILE, encoding='utf-8')
+trace_handler.setFormatter(logging.Formatter("%(message)s"))
+trace_logger.addHandler(trace_handler)
+trace_logger.setLevel(logging.INFO)
+trace_logger.propagate = False
+
+# Границы корзин гистограмм задержек, мс
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+
+
+class Span:
+    """Отрезок времени одного этапа обработки запроса."""
+
+    __slots__ = ("name", "request_id", "attrs", "started", "duration", "children", "error")
+
+    def __init__(self, name: str, request_id: str, attrs: dict):
+        self.name = name
+        self.request_id = request_id
+        self.attrs = attrs
+        self.started = time.perf_counter()
+        self.duration = None
+        self.children: List["Span"] = []
+        self.error = None
+
+    def to_dict(self, origin: float) -> dict:
+        data = {
+            "name": self.name,
+            "start_ms": round((self.started - origin) * 1000, 2),
+            "duration_ms": round((self.duration or 0) * 1000, 2),
+        }
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if self.error:
+            data["error"] = self.error
+        if self.children:
+            data["children"] = [child.to_dict(origin) for child in self.children]
+        return data
+
+
+class Histogram:
+    """Гистограмма задержек с фиксированными корзинами (мс)."""
+
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value_ms: float):
+        self.counts[bisect.bisect_left(BUCKETS_MS, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+
+    def percentile(self, q: float) -> float:
+        """Верхняя граница корзины, в которую попадает q-й перцентиль."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return float(BUCKETS_MS[index]) if index < len(BUCKETS_MS) else float("inf")
+        return float("inf")
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count, 2) if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+        }
+
+
+histograms: Dict[str, Histogram] = {}
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+
+def current_request_id() -> Optional[str]:
+    """Идентификатор обрабатываемого запроса (или None вне запроса)."""
+    current = _current_span.get()
+    return current.request_id if current else None
+
+
+def _finish(finished: Span, token):
+    finished.duration = time.perf_counter() - finished.started
+    _current_span.reset(token)
+    histogram = histograms.get(finished.name)
+    if histogram is None:
+        histogram = histograms[finished.name] = Histogram()
+    histogram.observe(finished.duration * 1000)
+
+
+@contextmanager
+def start_request(name: str = "request", **attrs):
+    """
+    Начинает трассу запроса с новым request_id. Вложенные span() (в том числе в задачах
+    и потоках asyncio.to_thread — контекст копируется) попадают в неё.
+    По завершении трасса записывается одной строкой в TRACE_FILE.
+    """
+    root = Span(name, uuid.uuid4().hex[:12], attrs)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.error = type(e).__name__
+        raise
+    finally:
+        _finish(root, token)
+        record = root.to_dict(root.started)
+        record["request_id"] = root.request_id
+        record["ts"] = round(time.time(), 3)
+        try:
+            trace_logger.info(json.dumps(record, ensure_ascii=False))
+        except Exception as e:
+            logger.error(f"Ошибка записи трассы {root.request_id}: {e}")
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Замеряет этап обработки. Вне запроса (нет start_request) ничего не делает,
+    поэтому инструментированный код можно вызывать и из админ-панели, и из скриптов.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, parent.request_id, attrs)
+    parent.children.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = type(e).__name__
+        raise
+    finally:
+        _finish(child, token)
+
+
+async def traced(name: str, awaitable, **attrs):
+    """
+    Выполняет корутину внутри спана (удобно для asyncio.create_task).
+    Спан хранится в локальной переменной: у задачи это внешний кадр стека, и сторож цикла
+    (Loop_monitor.find_request_id) находит по нему request_id блокирующего вызова внутри задачи.
+    """
+    with span(name, **attrs) as current:  # noqa: F841 — нужна ссылка в кадре
+        return await awaitable
+
+
+def histogram_summary() -> Dict[str, dict]:
+    """Сводка задержек по этапам (из памяти процесса)."""
+    return {name: histogram.summary() for name, histogram in sorted(histograms.items())}
+
+
+def summarize_trace_file(path: str = TRACE_FILE) -> Dict[str, dict]:
+    """Строит гистограммы этапов по файлу трасс."""
+    file_histograms: Dict[str, Histogram] = {}
+
+    def walk(node: dict):
+        file_histograms.setdefault(node["name"], Histogram()).observe(node["duration_ms"])
+        for child in node.get("children", []):
+            walk(child)
+
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                walk(json.loads(line))
+    return {name: histogram.summary() for name, histogram in sorted(file_histograms.items())}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сводка задержек этапов по файлу трасс")
+    parser.add_argument("path", nargs="?", default=TRACE_FILE)
+    args = parser.parse_args()
+    print(f"{'этап':40} {'число':>7} {'сред.':>9} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for stage, stats in summarize_trace_file(args.path).items():
+        print(f"{stage:40} {stats['count']:>7} {stats['avg_ms']:>9} {stats['p50_ms']:>8} "
+              f"{stats['p95_ms']:>8} {stats['p99_ms']:>8}")
@@ -1,13 +1,21 @@
-from groq import AsyncGroq
+import asyncio
 import logging
 import re
-import aiohttp
-from bs4 import BeautifulSoup
+import time
+from urllib.parse import quote_plus
 import json
 import os
 from Config import GROQ_API_KEY
-from Google_sheets import get_relevant_entries, parse_and_add_to_sheet
-from Prompts import load_prompts
+from Google_sheets import parse_and_add_to_sheet
+from Retrieval import get_retrieval
+from Circuit_breaker import breakers
+from Extractors import get_extractor_config, extract_results, is_blocked_page
+from Http_client import http_client
+from Search_cache import get_search_cache, DEFAULT_TTL, DEFAULT_NEGATIVE_TTL
+from Prompts import get_prompts, get_snapshot, get_matcher
+from State_backend import get_state_backend, SEARCH_NAMESPACE
+from Chunker import split_html
+from Tracing import span, traced
 from ai_models import AIModel
 
 ai_model = AIModel()
@@ -23,29 +31,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Путь к кэшу для результатов поиска
-SEARCH_CACHE_DIR = "search_cache"
-SEARCH_CACHE_FILE = os.path.join(SEARCH_CACHE_DIR, "search_results.json")
+search_cache = get_search_cache()
+state_backend = get_state_backend()
 
-if not os.path.exists(SEARCH_CACHE_DIR):
-    os.makedirs(SEARCH_CACHE_DIR)
+# Бюджет времени на сбор контекста (база знаний + сайты), сек
+DEFAULT_CONTEXT_BUDGET = 4.0
 
-def load_search_cache() -> dict:
-    try:
-        if os.path.exists(SEARCH_CACHE_FILE):
-            with open(SEARCH_CACHE_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {}
-    except Exception as e:
-        logger.error(f"Ошибка загрузки кэша поиска: {e}")
-        return {}
+def get_search_instruction(site: str) -> dict:
+    """
+    Возвращает настройки сайта из search_instructions (или пустой словарь).
+    Таблица сайт -> настройки строится один раз на версию prompts.json.
+    """
+    instructions = get_snapshot().derived(
+        "search_instructions_by_site",
+        lambda snapshot: {item.get("site"): item for item in snapshot.data.get("search_instructions", ())}
+    )
+    return instructions.get(site, {})
 
-def save_search_cache(cache: dict):
-    try:
-        with open(SEARCH_CACHE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(cache, f, ensure_ascii=False, indent=4)
-    except Exception as e:
-        logger.error(f"Ошибка сохранения кэша поиска: {e}")
+def get_site_cache_ttls(site: str) -> tuple:
+    """
+    Возвращает (ttl, negative_ttl) для сайта из search_instructions.
+    """
+    instruction = get_search_instruction(site)
+    return (
+        instruction.get("cache_ttl", DEFAULT_TTL),
+        instruction.get("negative_cache_ttl", DEFAULT_NEGATIVE_TTL)
+    )
 
 def is_russian_text(text: str) -> bool:
     """
@@ -63,23 +74,9 @@ def determine_response_template(query: str) -> str:
     """
     Определяет, какой шаблон использовать для ответа на основе запроса.
     Используется только для выбора смайлика.
+    Ключевые слова всех шаблонов скомпилированы в один автомат (Matcher.py).
     """
-    query_lower = query.lower()
-    
-    if any(keyword in query_lower for keyword in ["как ", "шаги", "инструкция", "процесс", "оформить", "сделать", "настройка", "сборка"]):
-        return "template_1"  # Инструкции
-    elif any(keyword in query_lower for keyword in ["плюсы", "минусы", "характеристики", "особенности", "преимущества", "недостатки"]):
-        return "template_2"  # Характеристики
-    elif any(keyword in query_lower for keyword in ["закон", "право", "зозпп", "гк рф", "вернуть деньги", "возврат", "обмен", "гарантия", "гарантийный", "заменить", "требует замены", "проверка качества"]):
-        return "template_legal"  # Юридическая информация
-    elif any(keyword in query_lower for keyword in ["диагностика", "неисправность", "ремонт"]):
-        return "template_diagnostic"  # Диагностика
-    elif any(keyword in query_lower for keyword in ["сравни", "сравнение"]):
-        return "template_comparison"  # Сравнение
-    elif any(keyword in query_lower for keyword in ["dns", "товар"]):
-        return "template_product"  # Информация о товаре
-    else:
-        return "template_3"  # Общий запрос
+    return get_matcher().match_template(query)
 
 def clean_response(response: str, query: str) -> str:
     """
@@ -105,9 +102,8 @@ async def format_response(response: str, template: str, query: str) -> str:
     Модель должна формировать ответ в формате: <b>Заголовок</b>\n\nТекст\n\n<i>Примечание</i>
     Если отступы отсутствуют, добавляем их сами.
     """
-    # Загружаем смайлики из Prompts.py
-    prompts_data = load_prompts()
-    emojis = prompts_data["emojis"]
+    # Берём смайлики из текущего снимка настроек
+    emojis = get_prompts()["emojis"]
 
     # Определяем смайлик в зависимости от шаблона
     emoji = emojis.get({
@@ -170,122 +166,181 @@ async def format_response(response: str, template: str, query: str) -> str:
     final_response = f"{emoji} {formatted_response}"
     return final_response
 
+async def get_shared_search_result(cache_key: str):
+    """
+    Второй уровень кэша поиска: результаты, найденные другими копиями бота
+    (только для общего сетевого хранилища состояния). Возвращает (значение, negative) или None.
+    """
+    if not state_backend.shared:
+        return None
+    try:
+        cached = await state_backend.get(SEARCH_NAMESPACE, cache_key)
+        return tuple(cached) if cached else None
+    except Exception as e:
+        logger.warning(f"Хранилище состояния недоступно, общий кэш поиска пропущен: {e}")
+        return None
+
+async def set_shared_search_result(cache_key: str, value: str, ttl: float, negative: bool = False):
+    """Сохраняет результат поиска в общем хранилище, если оно сетевое."""
+    if not state_backend.shared:
+        return
+    try:
+        await state_backend.set(SEARCH_NAMESPACE, cache_key, [value, negative], ttl=ttl)
+    except Exception as e:
+        logger.warning(f"Не удалось сохранить результат поиска в общем хранилище: {e}")
+
 async def search_on_site(query: str, site: str) -> str:
     """
     Выполняет поиск на указанном сайте и возвращает результаты.
+    URL поиска и селекторы берутся из search_instructions (поле "extractor")
+    или из настроек по умолчанию в Extractors.py.
     """
-    search_cache = load_search_cache()
-    cache_key = f"{site}:{query}"
-    if cache_key in search_cache:
-        logger.info(f"Результаты поиска для {cache_key} найдены в кэше")
-        return search_cache[cache_key]
+    with span(f"search:{site}"):
+        return await _search_on_site(query, site)
 
-    try:
-        if site == "consultant.ru":
-            search_url = f"https://www.consultant.ru/search/?q={query}"
-            async with aiohttp.ClientSession() as session:
-                async with session.get(search_url) as response:
-                    if response.status != 200:
-                        logger.error(f"Ошибка при запросе к {site}: статус {response.status}")
-                        return f"Не удалось выполнить поиск на сайте {site}."
-                    html = await response.text()
-            soup = BeautifulSoup(html, 'html.parser')
-            results = soup.find_all('div', class_='search-result-item', limit=3)
-            if not results:
-                logger.info(f"Не найдено информации по запросу '{query}' на сайте {site}")
-                return f"Не найдено информации по запросу '{query}' на сайте {site}."
-            result_text = f"Результаты поиска на {site}:\n\n"
-            for i, result in enumerate(results, 1):
-                title = result.find('a', class_='search-result-item__title')
-                description = result.find('div', class_='search-result-item__description')
-                title_text = title.get_text(strip=True) if title else "Без заголовка"
-                desc_text = description.get_text(strip=True) if description else "Без описания"
-                result_text += f"{title_text}\n{desc_text}\n\n"
-            search_cache[cache_key] = result_text
-            save_search_cache(search_cache)
-            logger.info(f"Сохранены результаты поиска для {cache_key}")
-            return result_text
+async def _search_on_site(query: str, site: str) -> str:
+    cache_key = search_cache.make_key(site, query)
+    with span("search_cache.local") as cache_span:
+        cached = search_cache.get(site, query)
+        if cache_span:
+            cache_span.attrs["hit"] = cached is not None
+    if cached is not None:
+        logger.info(f"Результаты поиска для {cache_key} найдены в кэше")
+        return cached[0]
+    instruction = get_search_instruction(site)
+    extractor_config = get_extractor_config(site, instruction)
+    if extractor_config is None:
+        logger.warning(f"Поиск на сайте {site} не поддерживается")
+        return f"Поиск на сайте {site} не поддерживается."
+    ttl, negative_ttl = get_site_cache_ttls(site)
+    with span("search_cache.shared"):
+        shared = await get_shared_search_result(cache_key)
+    if shared is not None:
+        logger.info(f"Результаты поиска для {cache_key} найдены в общем хранилище")
+        search_cache.set(site, query, shared[0], ttl=negative_ttl if shared[1] else ttl, negative=shared[1])
+        return shared[0]
 
-        elif site == "dns-shop.ru":
-            search_url = f"https://www.google.com/search?q=site:dns-shop.ru+{query}"
-            async with aiohttp.ClientSession() as session:
-                async with session.get(search_url) as response:
-                    if response.status != 200:
-                        logger.error(f"Ошибка при запросе к Google для {site}: статус {response.status}")
-                        return f"Не удалось выполнить поиск для {site}."
-                    html = await response.text()
-            soup = BeautifulSoup(html, 'html.parser')
-            results = soup.find_all('div', class_='g', limit=3)
-            if not results:
-                logger.info(f"Не найдено информации по запросу '{query}' для {site}")
-                return f"Не найдено информации по запросу '{query}' для {site}."
-            result_text = f"Результаты поиска для {site}:\n\n"
-            for i, result in enumerate(results, 1):
-                title = result.find('h3')
-                description = result.find('div', class_='VwiC3b')
-                title_text = title.get_text(strip=True) if title else "Без заголовка"
-                desc_text = description.get_text(strip=True) if description else "Без описания"
-                result_text += f"{title_text}\n{desc_text}\n\n"
-            search_cache[cache_key] = result_text
-            save_search_cache(search_cache)
-            logger.info(f"Сохранены результаты поиска для {cache_key}")
-            return result_text
+    breaker = breakers.get(site, instruction.get("circuit_breaker"))
+    if not breaker.allow():
+        logger.info(f"Источник {site} временно отключён предохранителем, поиск пропущен")
+        return f"Произошла ошибка при поиске на сайте {site}: источник временно отключён."
 
-        else:
-            logger.warning(f"Поиск на сайте {site} не поддерживается")
-            return f"Поиск на сайте {site} не поддерживается."
+    started = time.perf_counter()
+    success, error = False, ""
+    try:
+        search_url = extractor_config["search_url"].format(query=quote_plus(query))
+        status, html = await http_client.get_text(search_url, instruction.get("timeouts"))
+        if status != 200:
+            error = f"статус {status}"
+            logger.error(f"Ошибка при запросе к {site}: статус {status}")
+            return f"Не удалось выполнить поиск на сайте {site}."
+        if is_blocked_page(html, extractor_config):
+            error = "капча или блокировка"
+            logger.error(f"Сайт {site} вернул капчу или страницу блокировки")
+            return f"Не удалось выполнить поиск на сайте {site}."
+        with span("extract"):
+            results = await extract_results(html, extractor_config)
+        success = True
+        if not results:
+            logger.info(f"Не найдено информации по запросу '{query}' на сайте {site}")
+            not_found_text = f"Не найдено информации по запросу '{query}' на сайте {site}."
+            search_cache.set(site, query, not_found_text, ttl=negative_ttl, negative=True)
+            await set_shared_search_result(cache_key, not_found_text, negative_ttl, negative=True)
+            return not_found_text
+        result_text = f"Результаты поиска на {site}:\n\n"
+        for title_text, desc_text in results:
+            result_text += f"{title_text}\n{desc_text}\n\n"
+        search_cache.set(site, query, result_text, ttl=ttl)
+        await set_shared_search_result(cache_key, result_text, ttl)
+        logger.info(f"Сохранены результаты поиска для {cache_key}")
+        return result_text
+    except asyncio.TimeoutError:
+        error = "таймаут"
+        logger.error(f"Превышено время ожидания ответа от сайта {site}")
+        return f"Произошла ошибка при поиске на сайте {site}: сайт не ответил вовремя."
+    except asyncio.CancelledError:
+        error = "отменён по дедлайну"
+        raise
     except Exception as e:
+        error = str(e)
         logger.error(f"Ошибка при поиске на сайте {site}: {e}")
         return f"Произошла ошибка при поиске на сайте {site}."
+    finally:
+        previous_state = breaker.state
+        breaker.record(success, time.perf_counter() - started, error)
+        breakers.persist(force=breaker.state != previous_state)
+
+async def gather_context(user_input: str, prompts: dict) -> tuple:
+    """
+    Параллельно собирает контекст для модели: поиск по базе знаний и поиск на сайтах,
+    темы которых совпали с запросом. На весь этап отводится бюджет времени
+    (settings.context_budget, сек); источники, не успевшие ответить, отменяются,
+    а в промпт попадает только то, что готово к дедлайну.
+    Возвращает (текст из базы знаний или None, список пар (сайт, результат)).
+    """
+    user_input_lower = user_input.lower().strip()
+    budget = prompts.get("settings", {}).get("context_budget", DEFAULT_CONTEXT_BUDGET)
+
+    tasks = {"knowledge_base": asyncio.create_task(traced("knowledge_base", get_retrieval().search(user_input)))}
+    for instruction in prompts.get("search_instructions", []):
+        site = instruction["site"]
+        if instruction["theme"] in user_input_lower and site not in tasks:
+            tasks[site] = asyncio.create_task(search_on_site(user_input, site))
+
+    done, pending = await asyncio.wait(tasks.values(), timeout=budget)
+    for task in pending:
+        task.cancel()
+
+    results = {}
+    for source, task in tasks.items():
+        if task not in done:
+            logger.warning(f"Источник {source} не уложился в бюджет {budget} сек и отменён")
+            continue
+        if task.exception() is not None:
+            logger.error(f"Ошибка источника {source}: {task.exception()}")
+            continue
+        results[source] = task.result()
+
+    knowledge_text = results.pop("knowledge_base", None)
+    if knowledge_text and ("Не нашёл" in knowledge_text or "ошибка" in knowledge_text):
+        knowledge_text = None
+    site_responses = [
+        (site, response) for site, response in results.items()
+        if response and "Не найдено" not in response and "ошибка" not in response
+    ]
+    return knowledge_text, site_responses
 
 async def process_message(user_input: str) -> str:
     """Обрабатывает сообщение пользователя и возвращает ответ."""
-    prompts = load_prompts()
+    prompts = get_prompts()
     dialogs = prompts.get("dialogs", {})
     user_input_lower = user_input.lower().strip()
     if user_input_lower in dialogs:
         return dialogs[user_input_lower]
 
-    # Получаем релевантные записи из базы знаний
-    knowledge_text = await get_relevant_entries(user_input)
-    if knowledge_text and "Не нашёл" not in knowledge_text and "ошибка" not in knowledge_text:
+    # Собираем контекст из базы знаний и с сайтов параллельно
+    with span("gather_context"):
+        knowledge_text, site_responses = await gather_context(user_input, prompts)
+    if knowledge_text:
         user_input = f"{user_input}\n\nРелевантные записи из базы знаний:\n{knowledge_text}"
-
-    # Проверяем, нужно ли искать информацию на сайте
-    search_instructions = prompts.get("search_instructions", [])
-    for instruction in search_instructions:
-        theme = instruction["theme"]
-        site = instruction["site"]
-        if theme in user_input_lower:
-            site_response = await search_on_site(user_input, site)
-            if site_response and "Не найдено" not in site_response and "ошибка" not in site_response:
-                user_input = f"{user_input}\n\nИнформация с сайта {site}:\n{site_response}"
-            break
+    for site, site_response in site_responses:
+        user_input = f"{user_input}\n\nИнформация с сайта {site}:\n{site_response}"
 
     # Используем AI-модель
-    response = await ai_model.generate_response(user_input)
+    with span("llm"):
+        response = await ai_model.generate_response(user_input)
     
     # Форматируем ответ
-    template = determine_response_template(user_input)
-    formatted_response = await format_response(response, template, user_input)
+    with span("format"):
+        template = determine_response_template(user_input)
+        formatted_response = await format_response(response, template, user_input)
     return formatted_response
 
 def split_message(message: str, max_length: int = 4096) -> list:
     """
     Разбивает длинное сообщение на части, чтобы уложиться в лимит Telegram.
+    Теги HTML (<b>, <i> и др.) закрываются в конце части и открываются в начале следующей.
     """
     if len(message) <= max_length:
         return [message]
-
-    parts = []
-    current_part = ""
-    for line in message.split("\n"):
-        if len(current_part) + len(line) + 1 <= max_length:
-            current_part += line + "\n"
-        else:
-            if current_part:
-                parts.append(current_part.strip())
-            current_part = line + "\n"
-    if current_part:
-        parts.append(current_part.strip())
-    return parts
\ No newline at end of file
+    return split_html(message, max_length)
\ No newline at end of file
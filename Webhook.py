@@ -0,0 +1,172 @@
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.enums import ParseMode
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from Config import (TELEGRAM_TOKEN, TELEGRAM_API_URL, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET,
+                    WEBHOOK_MAX_CONCURRENT, WEBHOOK_MAX_BACKLOG)
+from Commands import register_commands
+from Handlers import register_handlers
+from Send_queue import send_queue
+from State_backend import BackendStorage, get_state_backend
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/webhook.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+SHUTDOWN_TIMEOUT = 30  # Сколько ждать завершения начатых обновлений при остановке, сек
+BACKLOG_RETRY_AFTER = 5  # Через сколько секунд Telegram стоит повторить обновление, не принятое из-за очереди
+
+
+class LimitedRequestHandler(SimpleRequestHandler):
+    """
+    Обработчик webhook: сразу отвечает Telegram 200 и обрабатывает обновление в фоне,
+    одновременно — не больше max_concurrent обновлений (остальные ждут семафора).
+    Если принятых, но не обработанных обновлений уже max_backlog, новое не принимается (503):
+    Telegram повторит его позже, а память бота при всплеске не растёт без предела.
+    При остановке дожидается начатых обновлений.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: Optional[str] = None,
+                 max_concurrent: int = WEBHOOK_MAX_CONCURRENT, max_backlog: int = WEBHOOK_MAX_BACKLOG,
+                 **data: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True,
+                         secret_token=secret_token, **data)
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.max_concurrent = max_concurrent
+        self.max_backlog = max_backlog
+        self.rejected = 0
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.unauthorized = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            self.unauthorized += 1
+            logger.warning(f"Запрос к webhook с неверным секретом от {request.remote}")
+            return web.Response(body="Unauthorized", status=401)
+        if len(self._background_feed_update_tasks) >= self.max_backlog:
+            self.rejected += 1
+            if self.rejected == 1 or self.rejected % 100 == 0:
+                logger.warning(f"Очередь обновлений webhook заполнена ({self.max_backlog}), "
+                               f"отклонено обновлений: {self.rejected}")
+            return web.Response(body="Busy", status=503, headers={"Retry-After": str(BACKLOG_RETRY_AFTER)})
+        self.received += 1
+        return await self._handle_request_background(bot=bot, request=request)
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        async with self.semaphore:
+            try:
+                await super()._background_feed_update(bot, update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Ошибка обработки обновления {update.get('update_id')}: {e}")
+
+    async def close(self) -> None:
+        pending = list(self._background_feed_update_tasks)
+        if pending:
+            logger.info(f"Ожидание завершения {len(pending)} обновлений...")
+            await asyncio.wait(pending, timeout=SHUTDOWN_TIMEOUT)
+        await send_queue.drain()
+        await super().close()
+
+    def stats(self) -> dict:
+        return {
+            "received": self.received,
+            "processed": self.processed,
+            "failed": self.failed,
+            "unauthorized": self.unauthorized,
+            "rejected": self.rejected,
+            "in_background": len(self._background_feed_update_tasks),
+            "max_concurrent": self.max_concurrent,
+            "max_backlog": self.max_backlog,
+        }
+
+
+# Обработчик webhook в aiohttp-приложении (статистика, тесты)
+WEBHOOK_HANDLER = web.AppKey("webhook_handler", LimitedRequestHandler)
+
+
+def create_bot(api_url: Optional[str] = TELEGRAM_API_URL) -> Bot:
+    """Создаёт бота; api_url позволяет направить запросы на другой сервер Bot API (например, тестовый)."""
+    # Ответы модели размечены HTML (<b>, <i>), как и в bot.py
+    default = DefaultBotProperties(parse_mode=ParseMode.HTML)
+    if api_url:
+        return Bot(token=TELEGRAM_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api_url)),
+                   default=default)
+    return Bot(token=TELEGRAM_TOKEN, default=default)
+
+
+def build_dispatcher() -> Dispatcher:
+    """
+    Создаёт диспетчер aiogram 3 со всеми командами и обработчиками.
+    Состояния FSM хранятся в общем хранилище, поэтому переживают перезапуск и видны всем копиям бота.
+    """
+    dp = Dispatcher(storage=BackendStorage(get_state_backend()))
+    register_commands(dp)
+    register_handlers(dp)  # Общий обработчик сообщений регистрируется последним
+    return dp
+
+
+def create_app(bot: Bot, dp: Dispatcher, webhook_url: Optional[str] = WEBHOOK_URL,
+               path: str = WEBHOOK_PATH, secret_token: Optional[str] = WEBHOOK_SECRET,
+               max_concurrent: int = WEBHOOK_MAX_CONCURRENT,
+               max_backlog: int = WEBHOOK_MAX_BACKLOG) -> web.Application:
+    """
+    Собирает aiohttp-приложение с webhook по адресу path.
+    Если задан webhook_url, при старте регистрирует webhook в Telegram с секретом secret_token.
+    Секрет общий для всех копий бота за балансировщиком (WEBHOOK_SECRET): сгенерированный в каждом процессе
+    секрет оставил бы в силе только последнюю зарегистрировавшуюся копию, остальные отвечали бы Telegram 401.
+    Общие службы (клиенты, база знаний, метрики) запускает и останавливает App.
+    """
+    if webhook_url and not secret_token:
+        raise ValueError("Для регистрации webhook нужен WEBHOOK_SECRET")
+    if not secret_token:
+        logger.warning("WEBHOOK_SECRET не задан: webhook принимает запросы без проверки секрета")
+    app = web.Application()
+    handler = LimitedRequestHandler(dispatcher=dp, bot=bot, secret_token=secret_token,
+                                    max_concurrent=max_concurrent, max_backlog=max_backlog)
+    handler.register(app, path=path)
+    app[WEBHOOK_HANDLER] = handler
+
+    async def on_startup(bot: Bot):
+        if webhook_url:
+            await bot.set_webhook(
+                webhook_url,
+                secret_token=secret_token,
+                allowed_updates=dp.resolve_used_update_types(),
+                max_connections=max_concurrent,
+                drop_pending_updates=True
+            )
+            logger.info(f"Webhook установлен: {webhook_url}")
+        else:
+            logger.warning("WEBHOOK_URL не задан, webhook в Telegram не регистрируется")
+
+    dp.startup.register(on_startup)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+def main():
+    """Запуск бота в режиме webhook (то же, что python bot.py --webhook)."""
+    from App import App
+    App(mode="webhook").run()
+
+
+if __name__ == "__main__":
+    main()
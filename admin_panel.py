@@ -1,14 +1,23 @@
 import asyncio
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
-from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, send_from_directory, abort
+from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
+import hmac
 import sqlite3
 import json
 import os
 from google.oauth2.service_account import Credentials
 from gspread_asyncio import AsyncioGspreadClientManager
 import logging
-from Google_sheets import add_to_knowledge_base, load_knowledge_base, init_google_sheets
+import time
+import urllib.error
+import urllib.request
+from Retrieval import list_entries, add_entry, delete_entry
 from Prompts import load_prompts
+from Circuit_breaker import breakers
+from Metrics import Registry, BOT_METRICS_URL, BOT_PROFILE_URL, BOT_MEMORY_URL, summarize_bot_metrics
+from Loop_monitor import load_slow_callbacks, BLOCK_THRESHOLD_MS
+from Profiler import list_profiles, PROFILE_DIR, PROFILE_PREFIX, DEFAULT_DURATION, MAX_DURATION
+from Search_cache import get_search_cache
 from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
 
@@ -100,10 +109,127 @@ def logout():
     logout_user()
     return redirect(url_for("login"))
 
+# Метрики процесса админ-панели (метрики бота читаются с его локального адреса BOT_METRICS_URL)
+admin_metrics = Registry()
+site_breaker_open = admin_metrics.gauge("admin_site_breaker_open", "Источник поиска отключён предохранителем", ("site",))
+site_error_rate = admin_metrics.gauge("admin_site_error_rate", "Доля ошибок источника поиска в окне", ("site",))
+search_cache_size = admin_metrics.gauge("admin_search_cache_entries", "Записей в кэше поиска")
+search_cache_bytes = admin_metrics.gauge("admin_search_cache_bytes", "Размер значений кэша поиска, байт")
+
+def collect_admin_stats():
+    for site in breakers.load_snapshots():
+        site_breaker_open.set(1 if site["state"] == "open" else 0, site=site["site"])
+        site_error_rate.set(site["error_rate"], site=site["site"])
+    cache_stats = get_search_cache().stats()
+    search_cache_size.set(cache_stats["entries"])
+    search_cache_bytes.set(cache_stats["bytes"])
+
+admin_metrics.add_collector(collect_admin_stats)
+
+def fetch_bot_metrics() -> str:
+    """Читает метрики процесса бота; пустая строка, если бот недоступен."""
+    try:
+        with urllib.request.urlopen(BOT_METRICS_URL, timeout=1) as response:
+            return response.read().decode("utf-8")
+    except Exception as e:
+        logger.warning(f"Метрики бота недоступны ({BOT_METRICS_URL}): {e}")
+        return ""
+
+# Токен для сборщика метрик (Prometheus): заголовок Authorization: Bearer <METRICS_TOKEN>.
+# Без токена /metrics доступен только после входа в админ-панель
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+def metrics_token_valid() -> bool:
+    header = request.headers.get("Authorization", "")
+    return bool(METRICS_TOKEN) and hmac.compare_digest(header, f"Bearer {METRICS_TOKEN}")
+
+@app.route("/metrics")
+def metrics():
+    """Метрики в формате Prometheus: бот и админ-панель в одном ответе."""
+    if not current_user.is_authenticated and not metrics_token_valid():
+        return login_manager.unauthorized()
+    return Response(fetch_bot_metrics() + admin_metrics.render(), mimetype="text/plain")
+
 @app.route("/")
 @login_required
 def dashboard():
-    return render_template("dashboard.html")
+    site_health = breakers.load_snapshots()
+    bot_metrics_text = fetch_bot_metrics()
+    bot_metrics = summarize_bot_metrics(bot_metrics_text) if bot_metrics_text else None
+    latest_profiles = [item for item in list_profiles() if item["name"].endswith(".speedscope.json")][:3]
+    return render_template("dashboard.html", site_health=site_health, bot_metrics=bot_metrics,
+                           latest_profiles=latest_profiles)
+
+def request_bot(url: str, method: str = "GET", timeout: float = 2) -> dict:
+    """Обращается к локальному серверу метрик процесса бота (профилировщик, учёт памяти)."""
+    req = urllib.request.Request(url, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return json.loads(response.read().decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        return json.loads(e.read().decode("utf-8") or "{}")
+    except Exception as e:
+        logger.warning(f"Процесс бота недоступен ({url}): {e}")
+        return {"error": "Бот не запущен или сервер метрик не отвечает"}
+
+def request_bot_profile(method: str = "GET", seconds: float = None) -> dict:
+    """Запускает профилирование в процессе бота или читает его состояние."""
+    url = BOT_PROFILE_URL if seconds is None else f"{BOT_PROFILE_URL}?seconds={seconds:g}"
+    return request_bot(url, method)
+
+@app.route("/profiles", methods=["GET", "POST"])
+@login_required
+def profiles():
+    """Профилирование работающего бота без перезапуска и скачивание сохранённых профилей."""
+    if request.method == "POST":
+        try:
+            seconds = min(max(float(request.form.get("seconds", DEFAULT_DURATION)), 1), MAX_DURATION)
+        except ValueError:
+            seconds = DEFAULT_DURATION
+        result = request_bot_profile("POST", seconds)
+        if result.get("error"):
+            flash(f"Профилирование не запущено: {result['error']}", "error")
+        else:
+            flash(f"Профилирование запущено на {seconds:g} сек. Обновите страницу после окончания.")
+        return redirect(url_for("profiles"))
+    saved = list_profiles()
+    for item in saved:
+        item["time"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(item["mtime"]))
+    return render_template("profiles.html", profiles=saved, status=request_bot_profile(),
+                           default_duration=DEFAULT_DURATION, max_duration=MAX_DURATION)
+
+@app.route("/profiles/<name>")
+@login_required
+def download_profile(name):
+    if not name.startswith(PROFILE_PREFIX) or name != os.path.basename(name):
+        abort(404)
+    return send_from_directory(os.path.abspath(PROFILE_DIR), name, as_attachment=True)
+
+@app.route("/memory", methods=["GET", "POST"])
+@login_required
+def memory():
+    """Память процесса бота по подсистемам и top выделений tracemalloc."""
+    if request.method == "POST":
+        action = request.form.get("action")
+        query = f"?tracemalloc={action}" if action in ("start", "stop") else ""
+        result = request_bot(BOT_MEMORY_URL + query, "POST", timeout=10)
+        if result.get("error"):
+            flash(f"Не удалось выполнить действие: {result['error']}", "error")
+        return redirect(url_for("memory"))
+    # Снимок tracemalloc при большой куче собирается несколько секунд
+    report = request_bot(BOT_MEMORY_URL, timeout=10)
+    if report.get("checked_at"):
+        report["checked"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(report["checked_at"]))
+    return render_template("memory.html", report=report)
+
+@app.route("/loop-report")
+@login_required
+def loop_report():
+    """Последние блокировки цикла событий бота со стеком и request_id."""
+    events = load_slow_callbacks(limit=50)
+    for event in events:
+        event["time"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(event["ts"]))
+    return render_template("loop_report.html", events=events, threshold_ms=BLOCK_THRESHOLD_MS)
 
 @app.route("/api-keys", methods=["GET", "POST"])
 @login_required
@@ -149,15 +275,17 @@ def knowledge_base():
                 question = request.form.get("question")
                 keywords = request.form.get("keywords")
                 answer = request.form.get("answer")
-                add_to_knowledge_base(question, keywords, answer)
-                flash("Запись добавлена в базу знаний.")
+                if add_entry(question, keywords, answer):
+                    flash("Запись добавлена в базу знаний.")
+                else:
+                    flash("Не удалось добавить запись в базу знаний.")
         
-        knowledge = load_knowledge_base()
-        logger.info(f"Данные из load_knowledge_base: {knowledge[0]}")
+        knowledge = list_entries()
+        logger.info(f"Записей в базе знаний: {len(knowledge)}")
         sheets = [os.getenv("SPREADSHEET_ID")]
-        if not knowledge[0]:
+        if not knowledge:
             flash("База знаний пуста. Добавьте записи.")
-        return render_template("knowledge_base.html", sheets=sheets, knowledge=knowledge[0])
+        return render_template("knowledge_base.html", sheets=sheets, knowledge=knowledge)
     except Exception as e:
         logger.error(f"Ошибка в маршруте /knowledge-base: {str(e)}")
         flash(f"Произошла ошибка: {str(e)}")
@@ -167,11 +295,11 @@ def knowledge_base():
 @login_required
 def delete_knowledge(index):
     try:
-        knowledge = load_knowledge_base()
-        if 0 <= index < len(knowledge[0]):
-            sheet = init_google_sheets()
-            sheet.sheet1.delete_rows(index + 2)  # +2 учитывает заголовок
-            flash("Запись удалена.")
+        if 0 <= index < len(list_entries()):
+            if delete_entry(index):
+                flash("Запись удалена.")
+            else:
+                flash("Не удалось удалить запись.")
         return redirect(url_for("knowledge_base"))
     except Exception as e:
         flash(f"Произошла ошибка: {str(e)}")
@@ -1,6 +1,8 @@
 import logging
-from groq import Groq
-from Prompts import load_prompts
+import os
+from groq import AsyncGroq
+from Prompts import get_snapshot
+from Metrics import groq_requests, groq_tokens
 
 logging.basicConfig(
     level=logging.INFO,
@@ -11,25 +13,66 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def build_system_prompt(snapshot) -> str:
+    """Собирает системный промпт из настроек (один раз на версию prompts.json)."""
+    settings = snapshot.data["settings"]
+    return (
+        f"Ты {settings['name']}, {settings['role']}. "
+        f"Твоя цель: {settings['goal']}. "
+        "Поведение:\n" + "\n".join([f"- {rule}" for rule in settings['behavior']]) + "\n"
+        "Ограничения:\n" + "\n".join([f"- {rule}" for rule in settings['restrictions']]) + "\n"
+        "Дополнительные инструкции:\n"
+        "- Всегда отвечай только на русском языке.\n"
+        "- Используй кодировку UTF-8.\n"
+        "- Исключай любую информацию о погоде.\n"
+        "- Не используй смайлики в ответе, они будут добавлены позже.\n"
+        "- Формируй ответ в следующем формате:\n"
+        "  <b>Заголовок</b>\n\n"
+        "  Основной текст ответа\n\n"
+        "  <i>Примечание</i>\n"
+        "- Заголовок должен быть кратким (до 5 слов) и отражать суть запроса.\n"
+        "- Между заголовком и основным текстом, а также между основным текстом и примечанием должно быть ровно два переноса строки (\\n\\n).\n"
+        "- Основной текст ответа должен быть в одном из следующих форматов, в зависимости от типа запроса:\n"
+        "  - Для инструкций или диагностики: пошаговый список (1. Текст, 2. Текст, ...).\n"
+        "  - Для характеристик: маркированный список (- Текст, - Текст, ...).\n"
+        "  - Для юридической информации, сравнений, информации о товаре или общих запросов: простой текст.\n"
+        "- Примечание должно быть кратким (1-2 предложения) и содержать дополнительную информацию или совет.\n"
+    )
+
 class AIModel:
     def __init__(self):
-        self.load_settings()
+        self.settings_version = None
+        self.api_key = None
         self.client = None
-        if self.use_ai:
-            self._initialize_client()
+        self.load_settings()
 
     def load_settings(self):
-        """Загружает настройки из prompts.json."""
-        self.prompts = load_prompts()
+        """Берёт настройки из текущего снимка prompts.json (без чтения файла)."""
+        snapshot = get_snapshot()
+        if snapshot.version == self.settings_version:
+            return
+        self.settings_version = snapshot.version
+        self.prompts = snapshot.data
         self.use_ai = self.prompts["settings"].get("use_ai", True)
         self.current_model = self.prompts["settings"].get("model", "llama3-8b-8192")  # Модель по умолчанию
         self.model_config = self.prompts["settings"].get("model_config", {})
+        self.system_prompt = snapshot.derived("system_prompt", build_system_prompt)
+        if self.use_ai:
+            self._initialize_client()
 
     def _initialize_client(self):
-        """Инициализирует клиент для Groq."""
-        api_key = self.model_config["grok"]["api_key"]
+        """
+        Инициализирует асинхронный клиент для Groq (заново — только если изменился ключ): ожидание ответа модели
+        и паузы повторов SDK после 429 не блокируют цикл событий.
+        Ключ из админ-панели (prompts.json) приоритетнее GROQ_API_KEY из .env;
+        адрес API можно переопределить переменной GROQ_BASE_URL (например, для нагрузочного теста).
+        """
+        api_key = self.model_config["grok"]["api_key"] or os.getenv("GROQ_API_KEY")
+        if self.client is not None and api_key == self.api_key:
+            return
+        self.api_key = api_key
         if api_key:
-            self.client = Groq(api_key=api_key)
+            self.client = AsyncGroq(api_key=api_key)
         else:
             logger.warning("API-ключ для Groq не указан.")
             self.client = None
@@ -57,41 +100,24 @@ class AIModel:
             self.current_model = "llama3-8b-8192"
 
         try:
-            system_prompt = (
-                f"Ты {self.prompts['settings']['name']}, {self.prompts['settings']['role']}. "
-                f"Твоя цель: {self.prompts['settings']['goal']}. "
-                "Поведение:\n" + "\n".join([f"- {rule}" for rule in self.prompts['settings']['behavior']]) + "\n"
-                "Ограничения:\n" + "\n".join([f"- {rule}" for rule in self.prompts['settings']['restrictions']]) + "\n"
-                "Дополнительные инструкции:\n"
-                "- Всегда отвечай только на русском языке.\n"
-                "- Используй кодировку UTF-8.\n"
-                "- Исключай любую информацию о погоде.\n"
-                "- Не используй смайлики в ответе, они будут добавлены позже.\n"
-                "- Формируй ответ в следующем формате:\n"
-                "  <b>Заголовок</b>\n\n"
-                "  Основной текст ответа\n\n"
-                "  <i>Примечание</i>\n"
-                "- Заголовок должен быть кратким (до 5 слов) и отражать суть запроса.\n"
-                "- Между заголовком и основным текстом, а также между основным текстом и примечанием должно быть ровно два переноса строки (\\n\\n).\n"
-                "- Основной текст ответа должен быть в одном из следующих форматов, в зависимости от типа запроса:\n"
-                "  - Для инструкций или диагностики: пошаговый список (1. Текст, 2. Текст, ...).\n"
-                "  - Для характеристик: маркированный список (- Текст, - Текст, ...).\n"
-                "  - Для юридической информации, сравнений, информации о товаре или общих запросов: простой текст.\n"
-                "- Примечание должно быть кратким (1-2 предложения) и содержать дополнительную информацию или совет.\n"
-            )
-
             messages = [
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": self.system_prompt},
                 {"role": "user", "content": user_input}
             ]
 
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.current_model,
                 messages=messages,
                 max_tokens=1000,
                 temperature=0.7
             )
+            groq_requests.inc(outcome="ok")
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                groq_tokens.inc(usage.prompt_tokens or 0, kind="prompt")
+                groq_tokens.inc(usage.completion_tokens or 0, kind="completion")
             return response.choices[0].message.content
         except Exception as e:
+            groq_requests.inc(outcome="error")
             logger.error(f"Ошибка генерации ответа от {self.current_model}: {e}")
             return "Произошла ошибка при обращении к модели Groq. Проверьте API-ключ или повторите позже."
\ No newline at end of file
@@ -0,0 +1,81 @@
+"""
+Микробенчмарк разбора страниц результатов поиска.
+
+Сравнивает прежний способ (полный DOM через BeautifulSoup + html.parser и find_all)
+с экстрактором из Extractors.py (lxml + SoupStrainer) на сохранённых страницах
+из benchmarks/fixtures.
+
+Запуск из корня проекта:
+    python benchmarks/bench_extractors.py [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.makedirs("logs", exist_ok=True)
+
+from bs4 import BeautifulSoup  # noqa: E402
+from Extractors import DEFAULT_EXTRACTORS, HTML_PARSER, SiteExtractor  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+FIXTURES = {
+    "consultant.ru": "consultant_search.html",
+    "dns-shop.ru": "google_dns_search.html",
+}
+
+
+def baseline_extract(html: str, config: dict) -> list:
+    """Прежняя реализация из Utils.search_on_site."""
+    item_tag, item_class = config["item"].split(".", 1)
+    title_tag, _, title_class = config["title"].partition(".")
+    desc_tag, _, desc_class = config["description"].partition(".")
+    soup = BeautifulSoup(html, 'html.parser')
+    results = []
+    for result in soup.find_all(item_tag, class_=item_class, limit=config["limit"]):
+        title = result.find(title_tag, class_=title_class or None)
+        description = result.find(desc_tag, class_=desc_class or None)
+        title_text = title.get_text(strip=True) if title else "Без заголовка"
+        desc_text = description.get_text(strip=True) if description else "Без описания"
+        results.append((title_text, desc_text))
+    return results
+
+
+def measure(func, repeat: int) -> float:
+    """Возвращает медианное время вызова в миллисекундах."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20, help="число повторов на страницу")
+    args = parser.parse_args()
+
+    print(f"Парсер экстрактора: {HTML_PARSER}")
+    print(f"{'сайт':<16}{'размер, КБ':>12}{'html.parser, мс':>18}{'экстрактор, мс':>18}{'ускорение':>12}")
+    for site, filename in FIXTURES.items():
+        with open(os.path.join(FIXTURES_DIR, filename), encoding='utf-8') as f:
+            html = f.read()
+        config = DEFAULT_EXTRACTORS[site]
+        extractor = SiteExtractor(**config)
+
+        expected = baseline_extract(html, config)
+        actual = extractor.extract(html)
+        if expected != actual:
+            print(f"ВНИМАНИЕ: результаты для {site} различаются:\n{expected}\n{actual}")
+
+        baseline_ms = measure(lambda: baseline_extract(html, config), args.repeat)
+        extractor_ms = measure(lambda: extractor.extract(html), args.repeat)
+        print(f"{site:<16}{len(html.encode('utf-8')) / 1024:>12.0f}{baseline_ms:>18.1f}"
+              f"{extractor_ms:>18.1f}{baseline_ms / extractor_ms:>11.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import asyncio
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Admission import AdmissionController, ADMITTED, BUSY, SUPERSEDED  # noqa: E402
+
+
+def test_admits_queues_and_rejects():
+    async def scenario():
+        admission = AdmissionController(max_per_user=1, max_concurrent=1, max_queue=1)
+        waits = []
+
+        async def on_wait():
+            waits.append(True)
+
+        assert await admission.acquire(1, on_wait=on_wait) == ADMITTED
+        waiting = asyncio.create_task(admission.acquire(2, on_wait=on_wait))
+        await asyncio.sleep(0)
+        # Отказ при переполненной очереди приходит сразу, без on_wait
+        assert await admission.acquire(3, on_wait=on_wait) == BUSY
+        assert waits == [True]
+        admission.release(1)
+        assert await waiting == ADMITTED
+        admission.release(2)
+        assert admission.stats()["running"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_new_request_supersedes_waiting_one():
+    async def scenario():
+        admission = AdmissionController(max_per_user=1, max_concurrent=1, max_queue=10)
+        assert await admission.acquire(1) == ADMITTED
+        first = asyncio.create_task(admission.acquire(2))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(admission.acquire(2))
+        await asyncio.sleep(0)
+        assert await first == SUPERSEDED
+        admission.release(1)
+        assert await second == ADMITTED
+        admission.release(2)
+        assert admission.stats()["running"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_release_skips_cancelled_waiter():
+    """Отмена ожидающего и release до того, как отменённый убрал себя из очереди, не теряют место."""
+    async def scenario():
+        admission = AdmissionController(max_per_user=1, max_concurrent=1, max_queue=10)
+        assert await admission.acquire(1) == ADMITTED
+        waiting = asyncio.create_task(admission.acquire(2))
+        await asyncio.sleep(0)
+        waiting.cancel()  # Future ожидающего отменена, но его except ещё не выполнился
+        admission.release(1)
+        try:
+            await waiting
+        except asyncio.CancelledError:
+            pass
+        assert admission.stats()["running"] == 0
+        assert admission.stats()["queued"] == 0
+        # Место свободно для следующего запроса
+        assert await admission.acquire(3) == ADMITTED
+        admission.release(3)
+
+    asyncio.run(scenario())
+
@@ -0,0 +1,137 @@
+import os
+import random
+import re
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Chunker import HtmlChunker, TELEGRAM_MAX_LENGTH, split_html  # noqa: E402
+
+ENTITY_RE = re.compile(r"&#?\w+;")
+TAG_RE = re.compile(r"<(/?)([a-zA-Z][\w-]*)[^<>]*>")
+
+
+def open_tags(chunk: str) -> list:
+    """Открытые в конце части теги; падает, если закрывающий тег не совпадает с открытым."""
+    stack = []
+    for match in TAG_RE.finditer(chunk):
+        closing, name = match.group(1), match.group(2).lower()
+        if closing:
+            assert stack and stack[-1] == name, f"несбалансированный </{name}> в {chunk!r}"
+            stack.pop()
+        else:
+            stack.append(name)
+    return stack
+
+
+def assert_entities_whole(chunk: str):
+    for position in [match.start() for match in re.finditer("&", chunk)]:
+        assert ENTITY_RE.match(chunk, position), f"разрезанная сущность в {chunk[position:position + 10]!r}"
+
+
+def plain(text: str) -> str:
+    """Текст без разметки и пробельных различий (для сравнения содержимого)."""
+    return "".join(TAG_RE.sub("", text).split())
+
+
+def random_html(rng: random.Random, lines: int = 60) -> str:
+    words = ["гарантия", "ремонт", "&amp;", "&lt;", "&#39;", "сервис", "x" * 40, "Wi-Fi", "а", "товар"]
+    result = []
+    for _ in range(lines):
+        line, stack = [], []
+        for _ in range(rng.randint(1, 40)):
+            roll = rng.random()
+            # Как в ответах модели: вложенность неглубокая, ссылки не вкладываются друг в друга
+            free = [tag for tag in ("b", "i", "u", "code") if tag not in stack]
+            if roll < 0.1 and len(stack) < 3 and free:
+                tag = rng.choice(free)
+                line.append(f"<{tag}>")
+                stack.append(tag)
+            elif roll < 0.15 and "a" not in stack:
+                line.append('<a href="https://example.com/?a=1&amp;b=2">')
+                stack.append("a")
+            elif roll < 0.25 and stack:
+                line.append(f"</{stack.pop()}>")
+            else:
+                line.append(rng.choice(words))
+        line.extend(f"</{tag}>" for tag in reversed(stack))
+        result.append(" ".join(line))
+    return "\n".join(result)
+
+
+@pytest.mark.parametrize("max_length", [200, 1000, TELEGRAM_MAX_LENGTH])
+@pytest.mark.parametrize("seed", range(5))
+def test_chunks_fit_balanced_and_complete(seed, max_length):
+    text = random_html(random.Random(seed), lines=300 if max_length == TELEGRAM_MAX_LENGTH else 60)
+    chunks = split_html(text, max_length)
+    assert chunks
+    for chunk in chunks:
+        assert 0 < len(chunk) <= max_length
+        assert open_tags(chunk) == []
+        assert_entities_whole(chunk)
+    # Повторно открытые теги добавляют разметку, но не текст
+    assert "".join(plain(chunk) for chunk in chunks) == plain(text)
+
+
+def test_open_tags_reopened_in_next_chunk():
+    text = "<b>" + "\n".join(f"строка {i} жирным шрифтом" for i in range(20)) + "</b>"
+    chunks = split_html(text, 80)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.startswith("<b>") and chunk.endswith("</b>")
+
+
+def test_nested_tags_reopened_with_attributes():
+    opening = '<a href="https://example.com/">'
+    text = f"<i>{opening}" + " ".join(["ссылка"] * 60) + "</a></i>"
+    chunks = split_html(text, 100)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.startswith(f"<i>{opening}") and chunk.endswith("</a></i>")
+
+
+def test_long_line_hard_split():
+    text = "я" * 10000
+    chunks = split_html(text)
+    assert [len(chunk) for chunk in chunks] == [TELEGRAM_MAX_LENGTH, TELEGRAM_MAX_LENGTH, 10000 - 2 * TELEGRAM_MAX_LENGTH]
+    assert "".join(chunks) == text
+
+
+def test_long_line_split_on_space():
+    words = ["слово"] * 50
+    chunks = split_html(" ".join(words), 64)
+    for chunk in chunks:
+        assert len(chunk) <= 64
+        assert all(word == "слово" for word in chunk.split())
+    assert sum(len(chunk.split()) for chunk in chunks) == 50
+
+
+def test_entities_not_cut():
+    text = "&amp;" * 3000
+    chunks = split_html(text, 101)
+    for chunk in chunks:
+        assert len(chunk) <= 101
+        assert_entities_whole(chunk)
+    assert "".join(chunks) == text
+
+
+def test_short_text_single_chunk():
+    assert split_html("<b>Заголовок</b>\n\nТекст ответа") == ["<b>Заголовок</b>\n\nТекст ответа"]
+    assert split_html("") == []
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_feed_flush_equals_split_html(seed):
+    rng = random.Random(seed)
+    text = random_html(rng)
+    chunker = HtmlChunker(150)
+    chunks, position = [], 0
+    while position < len(text):
+        size = rng.randint(1, 300)
+        chunks.extend(chunker.feed(text[position:position + size]))
+        position += size
+    chunks.extend(chunker.flush())
+    assert chunks == split_html(text, 150)
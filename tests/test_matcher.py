@@ -0,0 +1,82 @@
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Matcher import (AhoCorasick, DEFAULT_TEMPLATE, DEFAULT_TEMPLATE_KEYWORDS, DIALOG, TEMPLATE,  # noqa: E402
+                     IntentMatcher, build_matcher)
+
+
+def naive_dialog(dialogs: dict, query: str):
+    """Прежний линейный поиск: первый по порядку ключ, входящий в запрос."""
+    query = query.lower()
+    for key, answer in dialogs.items():
+        if key in query:
+            return answer
+    return None
+
+
+def naive_template(template_keywords: list, query: str) -> str:
+    query = query.lower()
+    for template, keywords in template_keywords:
+        if any(keyword in query for keyword in keywords):
+            return template
+    return DEFAULT_TEMPLATE
+
+
+def test_overlapping_patterns_found_once():
+    automaton = AhoCorasick([("he", "he"), ("she", "she"), ("his", "his"), ("hers", "hers"), ("", "пустой")])
+    assert sorted(automaton.find_all("ushers")) == ["he", "hers", "she"]
+    assert sorted(automaton.find_all("hishehe")) == ["he", "his", "she"]
+    assert automaton.find_all("xyz") == []
+
+
+def test_automaton_matches_naive_search():
+    rng = random.Random(0)
+    alphabet = "абвг "
+    for _ in range(200):
+        patterns = {"".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 8))}
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        automaton = AhoCorasick((pattern, pattern) for pattern in patterns)
+        assert sorted(automaton.find_all(text)) == sorted(pattern for pattern in patterns if pattern in text)
+
+
+def test_dialog_priority_follows_prompts_order():
+    dialogs = {"привет": "Здравствуйте!", "как дела": "Отлично.", "привет, как дела": "Сразу оба."}
+    matcher = IntentMatcher(dialogs)
+    assert matcher.match_dialog("Привет, как дела?") == "Здравствуйте!"
+    assert matcher.match_dialog("ну как дела") == "Отлично."
+    assert matcher.match_dialog("вопрос про гарантию") is None
+    for query in ["ПРИВЕТ", "как делаа", "при вет", "привет, как дела", ""]:
+        assert matcher.match_dialog(query) == naive_dialog(dialogs, query)
+
+
+def test_template_priority_and_default():
+    matcher = IntentMatcher({})
+    queries = ["Как оформить возврат товара?", "Гарантия на ремонт", "сравни плюсы и минусы",
+               "Что такое DNS?", "расскажи анекдот", "ДИАГНОСТИКА ноутбука", ""]
+    for query in queries:
+        assert matcher.match_template(query) == naive_template(DEFAULT_TEMPLATE_KEYWORDS, query)
+    assert matcher.match_template("расскажи анекдот") == DEFAULT_TEMPLATE
+
+
+def test_match_returns_dialogs_and_templates_sorted():
+    matcher = IntentMatcher({"товар": "Про товары спросите в группе."})
+    assert matcher.match("Ремонт товара") == [(DIALOG, 0, "товар"), (TEMPLATE, 3, "template_diagnostic"),
+                                              (TEMPLATE, 5, "template_product")]
+
+
+def test_build_matcher_uses_prompts_keywords():
+    prompts = {
+        "dialogs": {"спасибо": "Пожалуйста!"},
+        "template_keywords": [{"template": "template_legal", "keywords": ["возврат"]},
+                              {"template": "template_1", "keywords": ["как "]}],
+    }
+    matcher = build_matcher(prompts)
+    assert matcher.match_dialog("Спасибо большое") == "Пожалуйста!"
+    assert matcher.match_template("как оформить возврат") == "template_legal"
+    # Ключевые слова по умолчанию заменены целиком
+    assert matcher.match_template("ремонт") == DEFAULT_TEMPLATE
+    assert build_matcher({}).match_template("ремонт") == "template_diagnostic"
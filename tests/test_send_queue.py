@@ -0,0 +1,107 @@
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from aiogram.exceptions import TelegramRetryAfter  # noqa: E402
+from aiogram.methods import SendMessage            # noqa: E402
+import Send_queue                                  # noqa: E402
+from Send_queue import SendQueue, PRIORITY_FIRST, PRIORITY_FOLLOWUP  # noqa: E402
+
+
+class FakeMessage:
+    """Сообщение с методами отправки aiogram, записывающее вызовы в общий журнал."""
+
+    def __init__(self, log: list, chat_id: int = 1, message_id: int = 1, flood_waits: int = 0):
+        self.log = log
+        self.chat = SimpleNamespace(id=chat_id)
+        self.message_id = message_id
+        self.flood_waits = flood_waits
+
+    async def _record(self, kind: str, kwargs: dict):
+        if self.flood_waits:
+            self.flood_waits -= 1
+            raise TelegramRetryAfter(method=SendMessage(chat_id=self.chat.id, text=""), message="flood", retry_after=0)
+        self.log.append((kind, self.chat.id, kwargs.get("text") or kwargs.get("document"), time.monotonic()))
+        return kind
+
+    async def reply(self, **kwargs):
+        return await self._record("reply", kwargs)
+
+    async def answer(self, **kwargs):
+        return await self._record("answer", kwargs)
+
+    async def edit_text(self, **kwargs):
+        return await self._record("edit", kwargs)
+
+    async def reply_document(self, **kwargs):
+        return await self._record("document", kwargs)
+
+
+def test_first_parts_sent_before_followups():
+    async def scenario():
+        queue, log = SendQueue(), []
+        message = FakeMessage(log)
+        sends = [queue.reply(message, f"продолжение {i}", priority=PRIORITY_FOLLOWUP) for i in range(2)]
+        sends.append(queue.reply(message, "первая часть", priority=PRIORITY_FIRST))
+        await asyncio.gather(*sends)
+        assert [entry[2] for entry in log] == ["первая часть", "продолжение 0", "продолжение 1"]
+
+    asyncio.run(scenario())
+
+
+def test_pending_edits_of_one_message_merged():
+    async def scenario():
+        queue, log = SendQueue(), []
+        message = FakeMessage(log)
+        results = await asyncio.gather(queue.edit_text(message, "черновик"), queue.edit_text(message, "ответ"))
+        # Отправлена одна правка с последним текстом, оба вызова получили её результат
+        assert [(entry[0], entry[2]) for entry in log] == [("edit", "ответ")]
+        assert results == ["edit", "edit"]
+        assert queue.merged == 1
+
+    asyncio.run(scenario())
+
+
+def test_private_chat_rate_limit(monkeypatch):
+    monkeypatch.setattr(Send_queue, "PRIVATE_CHAT_RATE", 10)
+    monkeypatch.setattr(Send_queue, "PRIVATE_CHAT_BURST", 1)
+
+    async def scenario():
+        queue, log = SendQueue(), []
+        busy, other = FakeMessage(log, chat_id=1), FakeMessage(log, chat_id=2)
+        await asyncio.gather(*(queue.answer(busy, f"{i}") for i in range(3)), queue.answer(other, "другой чат"))
+        times = [entry[3] for entry in log if entry[1] == 1]
+        # Не чаще 10 сообщений в секунду в один чат; другой чат своей очереди не ждёт
+        assert times[2] - times[0] >= 0.18
+        assert [entry[2] for entry in log].index("другой чат") < 2
+
+    asyncio.run(scenario())
+
+
+def test_flood_wait_retried():
+    async def scenario():
+        queue, log = SendQueue(), []
+        message = FakeMessage(log, flood_waits=1)
+        assert await queue.reply(message, "ответ") == "reply"
+        assert queue.flood_waits == 1
+        assert queue.sent == 1
+
+    asyncio.run(scenario())
+
+
+def test_document_sent_through_queue():
+    async def scenario():
+        queue, log = SendQueue(), []
+        message = FakeMessage(log)
+        await asyncio.gather(queue.reply(message, "подпись", priority=PRIORITY_FOLLOWUP),
+                             queue.reply_document(message, "profile.json", priority=PRIORITY_FIRST))
+        assert [(entry[0], entry[2]) for entry in log] == [("document", "profile.json"), ("reply", "подпись")]
+        await queue.drain(timeout=1)
+        assert queue.stats()["sent"] == 2
+
+    asyncio.run(scenario())
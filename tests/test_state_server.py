@@ -0,0 +1,61 @@
+import asyncio
+import os
+import sys
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+
+from State_backend import NetworkStateBackend  # noqa: E402
+from State_server import create_state_app      # noqa: E402
+from test_webhook import free_port             # noqa: E402
+
+TOKEN = "state-token"
+
+
+async def run_server(path: str, scenario, token=TOKEN):
+    port = free_port()
+    runner = web.AppRunner(create_state_app(path, token))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    try:
+        await scenario(f"http://127.0.0.1:{port}")
+    finally:
+        await runner.cleanup()
+
+
+def test_backend_with_token_reads_and_writes(tmp_path):
+    async def scenario(url):
+        backend = NetworkStateBackend(url, TOKEN)
+        try:
+            await backend.set("dialog", "1", [{"role": "user", "content": "привет"}])
+            assert await backend.get("dialog", "1") == [{"role": "user", "content": "привет"}]
+            await backend.delete("dialog", "1")
+            assert await backend.get("dialog", "1") is None
+        finally:
+            await backend.close()
+
+    asyncio.run(run_server(str(tmp_path / "state.db"), scenario))
+
+
+def test_requests_without_token_rejected(tmp_path):
+    async def scenario(url):
+        for token in (None, "wrong"):
+            backend = NetworkStateBackend(url, token)
+            try:
+                with pytest.raises(aiohttp.ClientResponseError) as error:
+                    await backend.set("fsm", "1:1:1::default:state", "AddQAStates:waiting_for_data")
+                assert error.value.status == 401
+            finally:
+                await backend.close()
+        backend = NetworkStateBackend(url, TOKEN)
+        try:
+            assert await backend.get("fsm", "1:1:1::default:state") is None
+        finally:
+            await backend.close()
+
+    asyncio.run(run_server(str(tmp_path / "state.db"), scenario))
@@ -0,0 +1,119 @@
+import asyncio
+import os
+import socket
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+
+# Config читает окружение при импорте; для проверки webhook достаточно фиктивных значений
+os.environ.setdefault("TELEGRAM_TOKEN", "123456:TEST-TOKEN")
+os.environ.setdefault("GROQ_API_KEY", "test")
+os.environ.setdefault("GROUP_ID", "-100")
+os.environ.setdefault("GROUP_INVITE_LINK", "https://t.me/+test")
+
+from aiohttp import web                                      # noqa: E402
+from aiogram import Dispatcher, types                        # noqa: E402
+from fake_telegram import FakeTelegram                       # noqa: E402
+import Config                                                # noqa: E402
+from Webhook import WEBHOOK_HANDLER, create_app, create_bot  # noqa: E402
+
+SECRET = "test-secret"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_webhook(scenario, delay: float = 0.2, max_concurrent: int = 2, max_backlog: int = 100) -> dict:
+    """
+    Поднимает фейковый Bot API и webhook бота с медленным обработчиком сообщений,
+    выполняет scenario(fake, handler) и останавливает webhook (с дожиданием начатых обновлений).
+    Возвращает счётчики обработчика: обработано, пик одновременных.
+    """
+    fake = FakeTelegram()
+    telegram_port, webhook_port = free_port(), free_port()
+    await fake.start(port=telegram_port)
+    bot = create_bot(f"http://127.0.0.1:{telegram_port}")
+    dp = Dispatcher()
+    counters = {"active": 0, "peak": 0, "done": 0}
+
+    @dp.message()
+    async def slow_handler(message: types.Message):
+        counters["active"] += 1
+        counters["peak"] = max(counters["peak"], counters["active"])
+        await asyncio.sleep(delay)
+        counters["active"] -= 1
+        counters["done"] += 1
+
+    app = create_app(bot, dp, webhook_url=f"http://127.0.0.1:{webhook_port}/webhook", path="/webhook",
+                     secret_token=SECRET, max_concurrent=max_concurrent, max_backlog=max_backlog)
+    runner = web.AppRunner(app)
+    await runner.setup()  # setWebhook уходит в фейковый Bot API
+    await web.TCPSite(runner, "127.0.0.1", webhook_port).start()
+    try:
+        await scenario(fake, app[WEBHOOK_HANDLER], counters)
+    finally:
+        await runner.cleanup()
+        await fake.stop()
+    return counters
+
+
+def test_webhook_registered_with_secret():
+    async def scenario(fake, handler, counters):
+        assert fake.webhook_url.endswith("/webhook")
+        assert fake.webhook_secret == SECRET
+
+    asyncio.run(run_webhook(scenario))
+
+
+def test_wrong_secret_rejected():
+    async def scenario(fake, handler, counters):
+        assert await fake.push_update(fake.message_update("привет"), secret="wrong") == 401
+        assert await fake.push_update(fake.message_update("привет"), secret="") == 401
+        assert handler.unauthorized == 2
+        assert handler.received == 0
+
+    counters = asyncio.run(run_webhook(scenario))
+    assert counters["done"] == 0
+
+
+def test_concurrency_limit_and_drain_on_shutdown():
+    async def scenario(fake, handler, counters):
+        statuses = [await fake.push_update(fake.message_update(f"вопрос {i}", user_id=i + 1)) for i in range(6)]
+        # Telegram получает 200 сразу, обработка идёт в фоне
+        assert statuses == [200] * 6
+        assert counters["done"] < 6
+
+    counters = asyncio.run(run_webhook(scenario, delay=0.2, max_concurrent=2))
+    # Остановка дождалась всех принятых обновлений, одновременно обрабатывалось не больше двух
+    assert counters["done"] == 6
+    assert counters["peak"] == 2
+
+
+def test_backlog_bound_returns_503():
+    async def scenario(fake, handler, counters):
+        statuses = [await fake.push_update(fake.message_update(f"вопрос {i}", user_id=i + 1)) for i in range(5)]
+        assert statuses == [200, 200, 200, 503, 503]
+        assert handler.rejected == 2
+
+    counters = asyncio.run(run_webhook(scenario, delay=0.5, max_concurrent=1, max_backlog=3))
+    assert counters["done"] == 3
+
+
+def test_webhook_url_requires_shared_secret(monkeypatch):
+    # Секрет не генерируется в каждом процессе: без WEBHOOK_SECRET копии бота отвечали бы друг за друга 401
+    with pytest.raises(ValueError):
+        create_app(create_bot("http://127.0.0.1:1"), Dispatcher(), webhook_url="https://bot.example.com/webhook",
+                   secret_token=None)
+    monkeypatch.setattr(Config, "WEBHOOK_URL", "https://bot.example.com/webhook")
+    monkeypatch.setattr(Config, "WEBHOOK_SECRET", None)
+    with pytest.raises(ValueError, match="WEBHOOK_SECRET"):
+        Config.validate(required=())
+    monkeypatch.setattr(Config, "WEBHOOK_SECRET", SECRET)
+    Config.validate(required=())
@@ -0,0 +1,182 @@
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from collections import deque
+from typing import Optional
+from aiohttp import web
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/fake_groq.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+ANSWER_TEMPLATE = (
+    "<b>Ответ на вопрос</b>\n\n"
+    "{body}\n\n"
+    "<i>Это ответ тестовой модели для нагрузочного тестирования.</i>"
+)
+
+
+class FakeGroq:
+    """
+    Локальная замена OpenAI-совместимого API Groq (POST /openai/v1/chat/completions).
+    Задержка ответа, потоковая выдача (stream=true, SSE) и ответы 429 настраиваются,
+    чтобы нагрузочный тест воспроизводил поведение настоящего API. Клиент groq направляется сюда
+    переменной GROQ_BASE_URL=http://<host>:<port>.
+    """
+
+    def __init__(self, latency: float = 0.8, jitter: float = 0.3, tokens_per_second: float = 200,
+                 answer_chars: int = 800, rate_limit: int = 0, error_429_rate: float = 0.0,
+                 retry_after: int = 2):
+        self.latency = latency                    # Задержка до первого токена, сек
+        self.jitter = jitter                      # Разброс задержки, сек
+        self.tokens_per_second = tokens_per_second
+        self.answer_chars = answer_chars
+        self.rate_limit = rate_limit              # Запросов в минуту до 429 (0 — без ограничения)
+        self.error_429_rate = error_429_rate      # Доля случайных 429
+        self.retry_after = retry_after
+        self.requests = 0
+        self.rate_limited = 0
+        self.streamed = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._recent = deque()
+        self._ids = itertools.count(1)
+        self.app = web.Application()
+        for path in ("/openai/v1/chat/completions", "/v1/chat/completions"):
+            self.app.router.add_post(path, self.handle_completion)
+        self.app.router.add_get("/openai/v1/models", self.handle_models)
+        self.runner: Optional[web.AppRunner] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8082):
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        logger.info(f"Фейковый Groq слушает http://{host}:{port}")
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+    def _limited(self) -> bool:
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > 60:
+            self._recent.popleft()
+        if self.rate_limit and len(self._recent) >= self.rate_limit:
+            return True
+        if self.error_429_rate and random.random() < self.error_429_rate:
+            return True
+        self._recent.append(now)
+        return False
+
+    def _answer(self, messages: list) -> str:
+        question = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        sentence = f"Пункт ответа на запрос «{question[:60]}». "
+        body = (sentence * (self.answer_chars // len(sentence) + 1))[:self.answer_chars]
+        return ANSWER_TEMPLATE.format(body=body)
+
+    async def handle_models(self, request: web.Request) -> web.Response:
+        return web.json_response({"object": "list", "data": [{"id": "llama3-8b-8192", "object": "model"}]})
+
+    async def handle_completion(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        if self._limited():
+            self.rate_limited += 1
+            return web.json_response(
+                {"error": {"message": "Rate limit reached", "type": "tokens", "code": "rate_limit_exceeded"}},
+                status=429, headers={"retry-after": str(self.retry_after)}
+            )
+        body = await request.json()
+        messages = body.get("messages", [])
+        model = body.get("model", "llama3-8b-8192")
+        answer = self._answer(messages)
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+        completion_tokens = len(answer) // 4
+        completion_id = f"chatcmpl-fake-{next(self._ids)}"
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(max(self.latency + random.uniform(-self.jitter, self.jitter), 0))
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "total_tokens": prompt_tokens + completion_tokens}
+            if body.get("stream"):
+                self.streamed += 1
+                return await self._stream(request, completion_id, model, answer, usage)
+            await asyncio.sleep(completion_tokens / self.tokens_per_second)
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer},
+                             "finish_reason": "stop"}],
+                "usage": usage,
+            })
+        finally:
+            self.in_flight -= 1
+
+    async def _stream(self, request: web.Request, completion_id: str, model: str, answer: str,
+                      usage: dict) -> web.StreamResponse:
+        """Потоковый ответ (Server-Sent Events) кусками по ~4 символа на токен."""
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        chunk_tokens = 8
+        step = chunk_tokens * 4
+        for position in range(0, len(answer), step):
+            chunk = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {"content": answer[position:position + step]}, "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            await asyncio.sleep(chunk_tokens / self.tokens_per_second)
+        final = {
+            "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "x_groq": {"usage": usage},
+        }
+        await response.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        await response.write_eof()
+        return response
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "rate_limited": self.rate_limited,
+            "streamed": self.streamed,
+            "max_in_flight": self.max_in_flight,
+        }
+
+
+async def _main(args):
+    fake = FakeGroq(latency=args.latency, jitter=args.jitter, tokens_per_second=args.tokens_per_second,
+                    answer_chars=args.answer_chars, rate_limit=args.rate_limit, error_429_rate=args.error_429_rate)
+    await fake.start(args.host, args.port)
+    try:
+        while True:
+            await asyncio.sleep(60)
+            logger.info(f"Статистика: {fake.stats()}")
+    finally:
+        await fake.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Фейковый OpenAI-совместимый API Groq")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency", type=float, default=0.8, help="задержка до первого токена, сек")
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--tokens-per-second", type=float, default=200)
+    parser.add_argument("--answer-chars", type=int, default=800)
+    parser.add_argument("--rate-limit", type=int, default=0, help="запросов в минуту до ответа 429 (0 — без лимита)")
+    parser.add_argument("--error-429-rate", type=float, default=0.0, help="доля случайных ответов 429")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,318 @@
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional
+from aiohttp import ClientSession, web
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/fake_telegram.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+BOT_USER = {"id": 100000, "is_bot": True, "first_name": "Зелёный", "username": "fake_green_bot"}
+PLACEHOLDER_TEXT = "Зелёный пишет…"  # Временное сообщение бота, которое потом заменяется ответом
+
+
+class FakeTelegram:
+    """
+    Локальная замена сервера Bot API для проверки бота без Telegram.
+    Отвечает на методы, которыми пользуется бот, запоминает все вызовы
+    и доставляет обновления на зарегистрированный webhook (с секретом) или через getUpdates (long polling).
+    Бот направляется сюда переменной TELEGRAM_API_URL=http://<host>:<port>.
+    Для нагрузочного теста можно дождаться ответа бота на конкретное сообщение (wait_reply)
+    или нажатие кнопки (wait_callback_answer).
+    """
+
+    def __init__(self, member_status: str = "member", keep_calls: bool = True):
+        self.member_status = member_status
+        self.keep_calls = keep_calls
+        self.calls: List[tuple] = []          # (время, метод, параметры)
+        self.call_counts: Dict[str, int] = {}
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self.updates: List[dict] = []         # Очередь getUpdates
+        self._updates_added = asyncio.Event()
+        self.delivered: List[dict] = []       # Ответы webhook: update_id, статус, время
+        self._reply_waiters: Dict[tuple, dict] = {}     # (чат, сообщение пользователя) -> ожидание ответа
+        self._placeholders: Dict[tuple, dict] = {}      # (чат, «Зелёный пишет…») -> то же ожидание
+        self._callback_waiters: Dict[str, asyncio.Future] = {}
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self.app = web.Application()
+        self.app.router.add_route("*", "/bot{token}/{method}", self.handle_method)
+        self.runner: Optional[web.AppRunner] = None
+        self.session: Optional[ClientSession] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8081):
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        self.session = ClientSession()
+        logger.info(f"Фейковый Bot API слушает http://{host}:{port}")
+
+    async def stop(self):
+        if self.session:
+            await self.session.close()
+        if self.runner:
+            await self.runner.cleanup()
+
+    # --- Методы Bot API ---
+
+    def _message(self, chat_id, text: str, reply_to: Optional[int] = None, message_id: Optional[int] = None) -> dict:
+        chat_id = int(chat_id)
+        message = {
+            "message_id": message_id or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "from": BOT_USER,
+            "text": text,
+        }
+        if reply_to:
+            message["reply_to_message"] = {
+                "message_id": int(reply_to), "date": int(time.time()),
+                "chat": message["chat"], "text": ""
+            }
+        return message
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+        if self.keep_calls:
+            self.calls.append((time.monotonic(), method, params))
+        self.call_counts[method] = self.call_counts.get(method, 0) + 1
+        if method.lower() == "getupdates":
+            result = await self.get_updates(int(params.get("offset") or 0), float(params.get("timeout") or 0))
+        else:
+            result = self.call(method, params)
+        if isinstance(result, web.Response):
+            return result
+        self._notify(method, params, result)
+        return web.json_response({"ok": True, "result": result})
+
+    def call(self, method: str, params: Dict[str, Any]) -> Any:
+        lower = method.lower()
+        if lower == "getme":
+            return BOT_USER
+        if lower == "setwebhook":
+            self.webhook_url = params.get("url")
+            self.webhook_secret = params.get("secret_token")
+            logger.info(f"Зарегистрирован webhook {self.webhook_url}")
+            return True
+        if lower == "deletewebhook":
+            self.webhook_url = None
+            return True
+        if lower in ("sendmessage", "senddocument"):
+            return self._message(params["chat_id"], params.get("text", params.get("caption", "")),
+                                 self._reply_to(params))
+        if lower == "editmessagetext":
+            return self._message(params["chat_id"], params.get("text", ""), message_id=int(params["message_id"]))
+        if lower == "getchatmember":
+            user = {"id": int(params["user_id"]), "is_bot": False, "first_name": "user"}
+            return {"status": self.member_status, "user": user}
+        # deleteMessage, answerCallbackQuery, sendChatAction и прочие
+        return True
+
+    @staticmethod
+    def _reply_to(params: Dict[str, Any]) -> Optional[int]:
+        reply = params.get("reply_parameters")
+        if isinstance(reply, str):
+            reply = json.loads(reply)
+        reply_to = reply.get("message_id") if isinstance(reply, dict) else params.get("reply_to_message_id")
+        return int(reply_to) if reply_to else None
+
+    async def get_updates(self, offset: int, timeout: float) -> List[dict]:
+        """getUpdates с long polling: подтверждает обновления до offset и ждёт новые до timeout секунд."""
+        if offset:
+            self.updates = [update for update in self.updates if update["update_id"] >= offset]
+        if not self.updates and timeout:
+            self._updates_added.clear()
+            try:
+                await asyncio.wait_for(self._updates_added.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:100]
+
+    # --- Ожидание ответов бота ---
+
+    def _notify(self, method: str, params: Dict[str, Any], result: Any):
+        lower = method.lower()
+        if lower == "answercallbackquery":
+            future = self._callback_waiters.pop(str(params.get("callback_query_id")), None)
+            if future is not None and not future.done():
+                future.set_result("ok")
+            return
+        if lower not in ("sendmessage", "senddocument", "editmessagetext"):
+            return
+        chat_id = int(params.get("chat_id", 0))
+        text = params.get("text", params.get("caption", ""))
+        if lower == "editmessagetext":
+            # Правка временного сообщения — это ответ на вопрос, на который оно было отправлено
+            waiter = self._placeholders.get((chat_id, int(params["message_id"])))
+            if waiter is not None:
+                self._resolve(waiter, text)
+            return
+        waiter = self._reply_waiters.get((chat_id, self._reply_to(params)))
+        if waiter is None:
+            return
+        if text == PLACEHOLDER_TEXT:
+            waiter["placeholders"].add(result["message_id"])
+            self._placeholders[(chat_id, result["message_id"])] = waiter
+        else:
+            self._resolve(waiter, text)
+
+    def _resolve(self, waiter: dict, text: str):
+        if text == PLACEHOLDER_TEXT or waiter["future"].done():
+            return
+        waiter["future"].set_result(text)
+        self._forget(waiter)
+
+    def _forget(self, waiter: dict):
+        self._reply_waiters.pop((waiter["chat_id"], waiter["message_id"]), None)
+        for placeholder_id in waiter["placeholders"]:
+            self._placeholders.pop((waiter["chat_id"], placeholder_id), None)
+
+    async def wait_reply(self, chat_id: int, message_id: int, timeout: float = 60) -> Optional[str]:
+        """
+        Ждёт ответ бота на сообщение пользователя: ответ-сообщение или правку «Зелёный пишет…».
+        Возвращает текст ответа или None по таймауту. Ожидание нужно зарегистрировать до отправки
+        обновления — см. expect_reply.
+        """
+        waiter = self._reply_waiters.get((chat_id, message_id))
+        if waiter is None:
+            waiter = self.expect_reply(chat_id, message_id)
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter["future"]), timeout)
+        except asyncio.TimeoutError:
+            self._forget(waiter)
+            return None
+
+    def expect_reply(self, chat_id: int, message_id: int) -> dict:
+        waiter = {
+            "chat_id": chat_id, "message_id": message_id, "placeholders": set(),
+            "future": asyncio.get_running_loop().create_future(),
+        }
+        self._reply_waiters[(chat_id, message_id)] = waiter
+        return waiter
+
+    def expect_callback_answer(self, callback_id: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._callback_waiters[callback_id] = future
+        return future
+
+    async def wait_callback_answer(self, callback_id: str, timeout: float = 60) -> bool:
+        future = self._callback_waiters.get(callback_id) or self.expect_callback_answer(callback_id)
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            self._callback_waiters.pop(callback_id, None)
+            return False
+
+    # --- Обновления ---
+
+    def message_update(self, text: str, user_id: int = 1, chat_id: Optional[int] = None,
+                       chat_type: str = "private") -> dict:
+        chat_id = chat_id if chat_id is not None else user_id
+        return {
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": chat_type},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+                "text": text,
+            }
+        }
+
+    def callback_update(self, data: str, user_id: int = 1, chat_id: Optional[int] = None,
+                        message_id: Optional[int] = None, text: str = "") -> dict:
+        """Нажатие inline-кнопки под сообщением бота."""
+        chat_id = chat_id if chat_id is not None else user_id
+        update_id = next(self._update_ids)
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": f"cb{update_id}",
+                "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+                "chat_instance": str(chat_id),
+                "data": data,
+                "message": {
+                    "message_id": message_id or next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+                    "from": BOT_USER,
+                    "text": text or "Сообщение бота",
+                },
+            }
+        }
+
+    async def push_update(self, update: dict, secret: Optional[str] = None) -> Optional[int]:
+        """
+        Доставляет обновление: POST на webhook (возвращает HTTP-статус) или в очередь getUpdates.
+        secret переопределяет секрет, полученный в setWebhook (для проверки отказа).
+        """
+        if not self.webhook_url:
+            self.updates.append(update)
+            self._updates_added.set()
+            return None
+        headers = {}
+        token = secret if secret is not None else self.webhook_secret
+        if token:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = token
+        started = time.monotonic()
+        async with self.session.post(self.webhook_url, json=update, headers=headers) as response:
+            await response.read()
+        self.delivered.append({
+            "update_id": update["update_id"], "status": response.status,
+            "ack_ms": round((time.monotonic() - started) * 1000, 2)
+        })
+        return response.status
+
+    def sent_messages(self, chat_id: Optional[int] = None) -> List[dict]:
+        """Сообщения и правки, отправленные ботом (при необходимости — в один чат)."""
+        return [
+            params for _, method, params in self.calls
+            if method.lower() in ("sendmessage", "editmessagetext")
+            and (chat_id is None or int(params.get("chat_id", 0)) == chat_id)
+        ]
+
+
+async def _main(args):
+    fake = FakeTelegram()
+    await fake.start(args.host, args.port)
+    try:
+        if args.updates:
+            while fake.webhook_url is None:
+                logger.info("Ожидание setWebhook от бота...")
+                await asyncio.sleep(1)
+            for i in range(args.updates):
+                await fake.push_update(fake.message_update(args.text, user_id=i % args.users + 1))
+            acks = [item["ack_ms"] for item in fake.delivered]
+            logger.info(f"Доставлено обновлений: {len(acks)}, подтверждение webhook: "
+                        f"в среднем {sum(acks) / len(acks):.1f} мс, максимум {max(acks):.1f} мс")
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await fake.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Фейковый сервер Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--updates", type=int, default=0, help="сколько сообщений отправить боту после setWebhook")
+    parser.add_argument("--users", type=int, default=5, help="число разных пользователей")
+    parser.add_argument("--text", default="привет")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,391 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import secrets
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_telegram import FakeTelegram            # noqa: E402
+from fake_groq import FakeGroq                    # noqa: E402
+from Metrics import summarize_bot_metrics         # noqa: E402
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/load_test.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+REPORT_DIR = "logs"
+REPORT_PREFIX = "load_test-"
+GROUP_CHAT_ID = -1001000000001
+FIRST_USER_ID = 10001
+
+DEFAULT_MIX = "private=70,group=15,button=5,callback=5,add_qa=5"
+QUESTIONS = [
+    "как оформить гарантийный ремонт ноутбука",
+    "сколько длится диагностика телефона",
+    "что делать если не включается телевизор",
+    "какие документы нужны для возврата товара",
+    "как проверить статус ремонта",
+    "можно ли вернуть товар без коробки",
+    "как перезагрузить роутер",
+    "что входит в гарантию на холодильник",
+]
+BUTTONS = ["помощь", "о боте"]
+
+# Ответы бота, которые означают отказ или ошибку, а не ответ на вопрос
+OUTCOME_MARKERS = (
+    ("busy", "слишком многим"),
+    ("superseded", "следующий вопрос"),
+    ("error", "Произошла ошибка"),
+    ("error", "Не удалось"),
+)
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)], 1)
+
+
+def classify(text: Optional[str]) -> str:
+    if text is None:
+        return "timeout"
+    for outcome, marker in OUTCOME_MARKERS:
+        if marker in text:
+            return outcome
+    return "ok"
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def process_rss(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/status", encoding='utf-8') as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def fetch_bot_metrics(url: str) -> Optional[dict]:
+    try:
+        with urllib.request.urlopen(url, timeout=2) as response:
+            return summarize_bot_metrics(response.read().decode("utf-8"))
+    except Exception:
+        return None
+
+
+def version_label() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or "unknown"
+    except Exception:
+        return "unknown"
+
+
+class BotProcess:
+    """Бот в отдельном процессе, направленный на фейковые Bot API и Groq."""
+
+    def __init__(self, mode: str, telegram_url: str, groq_url: str, webapp_port: int, metrics_port: int):
+        self.mode = mode
+        self.secret = secrets.token_urlsafe(16)
+        self.env = dict(os.environ)
+        self.env.update({
+            "TELEGRAM_TOKEN": "123456:LOADTEST",
+            "TELEGRAM_API_URL": telegram_url,
+            "GROQ_API_KEY": "fake-groq-key",
+            "GROQ_BASE_URL": groq_url,
+            "GROUP_ID": str(GROUP_CHAT_ID),
+            "METRICS_PORT": str(metrics_port),
+        })
+        self.env.setdefault("GROUP_INVITE_LINK", "https://t.me/+loadtest")
+        if mode == "webhook":
+            self.env.update({
+                "WEBHOOK_URL": f"http://127.0.0.1:{webapp_port}/webhook",
+                "WEBHOOK_PATH": "/webhook",
+                "WEBHOOK_SECRET": self.secret,
+                "WEBAPP_HOST": "127.0.0.1",
+                "WEBAPP_PORT": str(webapp_port),
+            })
+        self.process: Optional[subprocess.Popen] = None
+        self.log = None
+
+    def start(self):
+        script = "Webhook.py" if self.mode == "webhook" else "bot.py"
+        self.log = open(os.path.join(REPORT_DIR, "load_test_bot.log"), "w", encoding='utf-8')
+        self.process = subprocess.Popen([sys.executable, script], cwd=ROOT, env=self.env,
+                                        stdout=self.log, stderr=subprocess.STDOUT)
+        logger.info(f"Бот запущен ({script}, pid {self.process.pid})")
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid if self.process else None
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    async def stop(self, timeout: float = 40):
+        if not self.alive():
+            return
+        # SIGINT — штатная остановка: бот дожидается обработки и отправки ответов
+        self.process.send_signal(signal.SIGINT)
+        try:
+            await asyncio.to_thread(self.process.wait, timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        if self.log:
+            self.log.close()
+
+
+class LoadTest:
+    """
+    Нагрузочный тест по ступеням: на каждой ступени работает заданное число виртуальных пользователей.
+    Каждый пользователь отправляет сообщение, ждёт ответа бота (закрытый цикл), делает паузу и повторяет.
+    Замеряются пропускная способность, задержка ответа (p50/p95/p99) и память процесса бота.
+    """
+
+    def __init__(self, telegram: FakeTelegram, mix: Dict[str, float], think_time: float = 1.0,
+                 reply_timeout: float = 60, bot_pid: Optional[int] = None, metrics_url: Optional[str] = None):
+        self.telegram = telegram
+        self.scenarios = list(mix)
+        self.weights = [mix[name] for name in self.scenarios]
+        self.think_time = think_time
+        self.reply_timeout = reply_timeout
+        self.bot_pid = bot_pid
+        self.metrics_url = metrics_url
+        self.stage = 0
+        self.samples: List[tuple] = []   # (ступень, сценарий, задержка мс, исход)
+        self.stages: List[dict] = []
+
+    async def _message(self, user_id: int, text: str, chat_id: Optional[int] = None,
+                       chat_type: str = "private") -> tuple:
+        update = self.telegram.message_update(text, user_id=user_id, chat_id=chat_id, chat_type=chat_type)
+        message = update["message"]
+        self.telegram.expect_reply(message["chat"]["id"], message["message_id"])
+        started = time.monotonic()
+        await self.telegram.push_update(update)
+        reply = await self.telegram.wait_reply(message["chat"]["id"], message["message_id"], self.reply_timeout)
+        return (time.monotonic() - started) * 1000, classify(reply)
+
+    def _record(self, scenario: str, latency_ms: float, outcome: str):
+        self.samples.append((self.stage, scenario, latency_ms, outcome))
+
+    async def run_scenario(self, scenario: str, user_id: int):
+        question = random.choice(QUESTIONS)
+        if scenario == "private":
+            self._record(scenario, *await self._message(user_id, question))
+        elif scenario == "group":
+            self._record(scenario, *await self._message(user_id, f"Зелёный, {question}", GROUP_CHAT_ID, "supergroup"))
+        elif scenario == "button":
+            self._record(scenario, *await self._message(user_id, random.choice(BUTTONS)))
+        elif scenario == "callback":
+            update = self.telegram.callback_update("instruction", user_id=user_id)
+            callback_id = update["callback_query"]["id"]
+            self.telegram.expect_callback_answer(callback_id)
+            started = time.monotonic()
+            await self.telegram.push_update(update)
+            answered = await self.telegram.wait_callback_answer(callback_id, self.reply_timeout)
+            self._record(scenario, (time.monotonic() - started) * 1000, "ok" if answered else "timeout")
+        elif scenario == "add_qa":
+            latency, outcome = await self._message(user_id, "/add_qa")
+            self._record("add_qa_start", latency, outcome)
+            if outcome == "ok":
+                self._record("add_qa_submit", *await self._message(
+                    user_id, f"Вопрос: {question}?\nКлючевые слова: нагрузка\nИнформация: тестовый ответ {user_id}"
+                ))
+
+    async def run_user(self, user_id: int, stopped: asyncio.Event):
+        while not stopped.is_set():
+            scenario = random.choices(self.scenarios, self.weights)[0]
+            try:
+                await self.run_scenario(scenario, user_id)
+            except Exception as e:
+                logger.error(f"Ошибка сценария {scenario} пользователя {user_id}: {e}")
+                self._record(scenario, 0.0, "harness_error")
+            try:
+                await asyncio.wait_for(stopped.wait(), random.uniform(0, 2 * self.think_time))
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self, ramp: List[int], stage_seconds: float):
+        stopped = asyncio.Event()
+        users: List[asyncio.Task] = []
+        for index, target in enumerate(ramp):
+            self.stage = index
+            while len(users) < target:
+                users.append(asyncio.create_task(self.run_user(FIRST_USER_ID + len(users), stopped)))
+            logger.info(f"Ступень {index + 1}/{len(ramp)}: {target} пользователей на {stage_seconds:.0f} сек")
+            started = time.monotonic()
+            rss_max = 0
+            while time.monotonic() - started < stage_seconds:
+                await asyncio.sleep(1)
+                rss_max = max(rss_max, process_rss(self.bot_pid) or 0) if self.bot_pid else 0
+            self.stages.append(self._stage_report(index, target, time.monotonic() - started, rss_max))
+            logger.info(f"Итог ступени: {json.dumps(self.stages[-1]['summary'], ensure_ascii=False)}")
+        stopped.set()
+        # Дожидаемся ответов на уже отправленные сообщения, чтобы не оставлять ожиданий
+        await asyncio.wait(users, timeout=self.reply_timeout + 5)
+
+    def _stage_report(self, index: int, users: int, duration: float, rss_max: int) -> dict:
+        samples = [sample for sample in self.samples if sample[0] == index]
+        by_scenario = {}
+        for scenario in sorted({sample[1] for sample in samples}):
+            by_scenario[scenario] = self._summarize([s for s in samples if s[1] == scenario], duration)
+        return {
+            "stage": index + 1,
+            "users": users,
+            "duration_s": round(duration, 1),
+            "summary": self._summarize(samples, duration),
+            "scenarios": by_scenario,
+            "rss_max_mb": round(rss_max / (1024 * 1024), 1) if rss_max else None,
+            "bot_metrics": fetch_bot_metrics(self.metrics_url) if self.metrics_url else None,
+        }
+
+    @staticmethod
+    def _summarize(samples: List[tuple], duration: float) -> dict:
+        outcomes = {}
+        for sample in samples:
+            outcomes[sample[3]] = outcomes.get(sample[3], 0) + 1
+        answered = [sample[2] for sample in samples if sample[3] != "timeout"]
+        return {
+            "requests": len(samples),
+            "throughput_rps": round(len(answered) / duration, 2) if duration else 0.0,
+            "p50_ms": percentile(answered, 0.5),
+            "p95_ms": percentile(answered, 0.95),
+            "p99_ms": percentile(answered, 0.99),
+            "outcomes": outcomes,
+        }
+
+
+def save_report(report: dict, label: str) -> str:
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(REPORT_DIR, f"{REPORT_PREFIX}{label}-{stamp}.json")
+    with open(path, "w", encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def compare_reports(paths: List[str]):
+    """Печатает ступени нескольких отчётов рядом: пропускная способность, p99 и память."""
+    reports = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            reports.append(json.load(f))
+    print(f"{'ступень':>8} {'польз.':>7}  " + "  ".join(f"{report['label']:>26}" for report in reports))
+    stage_count = max(len(report["stages"]) for report in reports)
+    for index in range(stage_count):
+        cells = []
+        users = "-"
+        for report in reports:
+            if index >= len(report["stages"]):
+                cells.append(f"{'—':>26}")
+                continue
+            stage = report["stages"][index]
+            users = stage["users"]
+            summary = stage["summary"]
+            cells.append(f"{summary['throughput_rps']:>6} rps {summary['p99_ms'] or 0:>7.0f} мс "
+                         f"{stage['rss_max_mb'] or 0:>5.0f} МБ")
+        print(f"{index + 1:>8} {users:>7}  " + "  ".join(cells))
+
+
+async def _run(args):
+    telegram = FakeTelegram(member_status="administrator", keep_calls=False)
+    groq = FakeGroq(latency=args.groq_latency, jitter=args.groq_jitter, tokens_per_second=args.groq_tps,
+                    rate_limit=args.groq_rate_limit, error_429_rate=args.groq_429_rate)
+    await telegram.start(port=args.telegram_port)
+    await groq.start(port=args.groq_port)
+    bot = None
+    try:
+        if not args.no_spawn:
+            bot = BotProcess(args.mode, f"http://127.0.0.1:{args.telegram_port}",
+                             f"http://127.0.0.1:{args.groq_port}", args.webapp_port, args.metrics_port)
+            bot.start()
+        # Бот готов, когда зарегистрировал webhook или начал опрашивать getUpdates
+        deadline = time.monotonic() + args.startup_timeout
+        while not (telegram.webhook_url or telegram.call_counts.get("getUpdates")):
+            if time.monotonic() > deadline or (bot is not None and not bot.alive()):
+                raise RuntimeError("Бот не запустился, подробности в logs/load_test_bot.log")
+            await asyncio.sleep(0.5)
+        ready = time.monotonic() - (deadline - args.startup_timeout)
+        logger.info(f"Бот готов к нагрузке через {ready:.1f} сек")
+
+        test = LoadTest(telegram, parse_mix(args.mix), think_time=args.think_time, reply_timeout=args.reply_timeout,
+                        bot_pid=bot.pid if bot else None,
+                        metrics_url=f"http://127.0.0.1:{args.metrics_port}/metrics")
+        await test.run([int(users) for users in args.ramp.split(",")], args.stage_seconds)
+        report = {
+            "label": args.label or version_label(),
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "mode": args.mode,
+            "startup_s": round(ready, 1),
+            "config": {key: value for key, value in vars(args).items() if key not in ("command", "reports")},
+            "stages": test.stages,
+            "groq": groq.stats(),
+            "telegram_calls": telegram.call_counts,
+        }
+        path = save_report(report, report["label"])
+        logger.info(f"Отчёт сохранён: {path}")
+        compare_reports([path])
+    finally:
+        if bot is not None:
+            await bot.stop()
+        await groq.stop()
+        await telegram.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота на фейковых Telegram Bot API и Groq")
+    sub = parser.add_subparsers(dest="command")
+    run = sub.add_parser("run", help="провести тест и сохранить отчёт")
+    run.add_argument("--mode", choices=("webhook", "polling"), default="webhook")
+    run.add_argument("--no-spawn", action="store_true", help="бот уже запущен и направлен на фейковые серверы")
+    run.add_argument("--ramp", default="1,5,10,20", help="число пользователей на ступенях")
+    run.add_argument("--stage-seconds", type=float, default=30)
+    run.add_argument("--mix", default=DEFAULT_MIX, help="веса сценариев: private, group, button, callback, add_qa")
+    run.add_argument("--think-time", type=float, default=1.0, help="средняя пауза пользователя между сообщениями, сек")
+    run.add_argument("--reply-timeout", type=float, default=60)
+    run.add_argument("--startup-timeout", type=float, default=300)
+    run.add_argument("--label", help="метка версии в имени отчёта (по умолчанию — коммит git)")
+    run.add_argument("--telegram-port", type=int, default=8081)
+    run.add_argument("--groq-port", type=int, default=8082)
+    run.add_argument("--webapp-port", type=int, default=8083)
+    run.add_argument("--metrics-port", type=int, default=9111)
+    run.add_argument("--groq-latency", type=float, default=0.8)
+    run.add_argument("--groq-jitter", type=float, default=0.3)
+    run.add_argument("--groq-tps", type=float, default=200, help="скорость выдачи токенов фейковым Groq")
+    run.add_argument("--groq-rate-limit", type=int, default=0, help="запросов в минуту до 429")
+    run.add_argument("--groq-429-rate", type=float, default=0.0)
+    compare = sub.add_parser("compare", help="сравнить сохранённые отчёты")
+    compare.add_argument("reports", nargs="+")
+    args = parser.parse_args()
+    if args.command == "compare":
+        compare_reports(args.reports)
+    elif args.command == "run":
+        asyncio.run(_run(args))
+    else:
+        parser.print_help()
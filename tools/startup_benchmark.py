@@ -0,0 +1,271 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_telegram import FakeTelegram                                   # noqa: E402
+from fake_groq import FakeGroq                                           # noqa: E402
+from load_test import BotProcess, process_rss, version_label, REPORT_DIR  # noqa: E402
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+    handlers=[
+        logging.FileHandler("logs/startup_benchmark.log", encoding='utf-8'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger(__name__)
+
+REPORT_PREFIX = "startup-"
+ADMIN_URL = "http://127.0.0.1:5000/login"  # admin_panel.py запускается app.run() на порту Flask по умолчанию
+
+# Модули, импорт которых замеряется (каждый — в чистом процессе)
+MODULES = ("Config", "Google_sheets", "Utils", "Commands", "Handlers", "Webhook", "App", "admin_panel")
+# Тяжёлые зависимости: видно, какой модуль их подтягивает при импорте
+HEAVY = ("torch", "sentence_transformers", "faiss", "numpy", "groq", "bs4", "gspread", "aiogram", "flask")
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+rss = 0
+try:
+    with open('/proc/self/status') as f:
+        rss = next((int(line.split()[1]) * 1024 for line in f if line.startswith('VmRSS:')), 0)
+except OSError:
+    pass
+print(json.dumps({{'seconds': seconds, 'rss': rss, 'heavy': [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def parse_importtime(stderr: str, limit: int = 10) -> List[dict]:
+    """Самые дорогие импорты из вывода python -X importtime (накопленное время, мс)."""
+    rows = []
+    for line in stderr.splitlines():
+        parts = line[len("import time:"):].split("|") if line.startswith("import time:") else []
+        if len(parts) != 3:
+            continue
+        try:
+            cumulative_us = int(parts[1])
+        except ValueError:
+            continue  # Строка заголовка
+        rows.append({"module": parts[2].strip(), "ms": round(cumulative_us / 1000, 1)})
+    return sorted(rows, key=lambda row: row["ms"], reverse=True)[:limit]
+
+
+def measure_import(module: str, runs: int) -> dict:
+    """Импорт модуля в новом процессе: время, память и подтянутые тяжёлые зависимости."""
+    seconds = []
+    result = {"module": module}
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", IMPORT_PROBE.format(module=module, heavy=HEAVY)],
+            cwd=ROOT, capture_output=True, text=True, timeout=600
+        )
+        if completed.returncode != 0:
+            error = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "ошибка импорта"
+            return {"module": module, "error": error}
+        probe = json.loads(completed.stdout.strip().splitlines()[-1])
+        seconds.append(probe["seconds"])
+        result.update(rss=probe["rss"], heavy=probe["heavy"], slowest=parse_importtime(completed.stderr))
+    result["seconds"] = round(statistics.median(seconds), 3)
+    return result
+
+
+def probe_url(url: str) -> Tuple[Optional[int], Optional[dict]]:
+    """Статус и JSON ответа (None, если сервер ещё не слушает)."""
+    try:
+        with urllib.request.urlopen(url, timeout=2) as response:
+            status, body = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, body = e.code, e.read()
+    except Exception:
+        return None, None
+    try:
+        return status, json.loads(body)
+    except ValueError:
+        return status, None
+
+
+async def measure_bot(mode: str, args) -> dict:
+    """Время от запуска процесса бота до /ready = 200 (по шагам App) и время штатной остановки."""
+    telegram = FakeTelegram(keep_calls=False)
+    groq = FakeGroq()
+    await telegram.start(port=args.telegram_port)
+    await groq.start(port=args.groq_port)
+    bot = BotProcess(mode, f"http://127.0.0.1:{args.telegram_port}", f"http://127.0.0.1:{args.groq_port}",
+                     args.webapp_port, args.metrics_port)
+    ready_url = f"http://127.0.0.1:{args.metrics_port}/ready"
+    result = {"entry": "Webhook.py" if mode == "webhook" else "bot.py", "mode": mode}
+    try:
+        started = time.monotonic()
+        bot.start()
+        status, body = None, None
+        while time.monotonic() - started < args.startup_timeout and bot.alive():
+            status, body = await asyncio.to_thread(probe_url, ready_url)
+            if status is not None and "metrics_seconds" not in result:
+                result["metrics_seconds"] = round(time.monotonic() - started, 3)
+            if status == 200:
+                break
+            await asyncio.sleep(0.05)
+        result["ok"] = status == 200
+        if status == 200:
+            result["ready_seconds"] = round(time.monotonic() - started, 3)
+            result["rss"] = process_rss(bot.pid)
+        elif not bot.alive():
+            result["error"] = "бот завершился при запуске, подробности в logs/load_test_bot.log"
+        else:
+            result["error"] = f"нет готовности за {args.startup_timeout:.0f} сек"
+        result["stages"] = (body or {}).get("stages", [])
+    finally:
+        stopping = time.monotonic()
+        await bot.stop()
+        result["shutdown_seconds"] = round(time.monotonic() - stopping, 3)
+        await groq.stop()
+        await telegram.stop()
+    return result
+
+
+async def measure_admin(args) -> dict:
+    """Время от запуска admin_panel.py до первого ответа страницы входа."""
+    result = {"entry": "admin_panel.py"}
+    with open(os.path.join(REPORT_DIR, "startup_admin.log"), "w", encoding='utf-8') as log:
+        # Своя группа процессов: Flask в режиме отладки порождает дочерний процесс перезагрузчика
+        process = subprocess.Popen([sys.executable, "admin_panel.py"], cwd=ROOT, stdout=log,
+                                   stderr=subprocess.STDOUT, start_new_session=True)
+        started = time.monotonic()
+        try:
+            status = None
+            while time.monotonic() - started < args.startup_timeout and process.poll() is None:
+                status, _ = await asyncio.to_thread(probe_url, ADMIN_URL)
+                if status is not None:
+                    break
+                await asyncio.sleep(0.05)
+            result["ok"] = status is not None
+            if status is not None:
+                result["ready_seconds"] = round(time.monotonic() - started, 3)
+            else:
+                result["error"] = "админ-панель не ответила, подробности в logs/startup_admin.log"
+        finally:
+            try:
+                os.killpg(process.pid, signal.SIGINT)
+                await asyncio.to_thread(process.wait, 10)
+            except (ProcessLookupError, subprocess.TimeoutExpired):
+                process.kill()
+    return result
+
+
+def print_report(report: dict):
+    print(f"{'модуль':<16}{'импорт, с':>10}{'RSS, МБ':>9}  тяжёлые зависимости")
+    for item in report["imports"]:
+        if "error" in item:
+            print(f"{item['module']:<16}{'—':>10}{'—':>9}  {item['error']}")
+            continue
+        print(f"{item['module']:<16}{item['seconds']:>10.3f}{item['rss'] / 1048576:>9.0f}  {', '.join(item['heavy'])}")
+    print()
+    print(f"{'точка входа':<16}{'готов, с':>10}{'метрики, с':>11}{'стоп, с':>9}")
+    for item in report["entry_points"]:
+        if not item.get("ok"):
+            print(f"{item['entry']:<16}{'—':>10}  {item.get('error', '')}")
+            continue
+        metrics = item.get("metrics_seconds")
+        shutdown = item.get("shutdown_seconds")
+        print(f"{item['entry']:<16}{item['ready_seconds']:>10.2f}"
+              f"{metrics if metrics is not None else '—':>11}{shutdown if shutdown is not None else '—':>9}")
+        for stage in item.get("stages", []):
+            print(f"    {stage['title']:<44}{stage['seconds']:>8.2f}")
+
+
+def save_report(report: dict, label: str) -> str:
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(REPORT_DIR, f"{REPORT_PREFIX}{label}-{stamp}.json")
+    with open(path, "w", encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def compare_reports(paths: List[str]):
+    """Время импорта и готовности из нескольких отчётов рядом."""
+    reports = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            reports.append(json.load(f))
+    print(f"{'':<16}" + "".join(f"{report['label']:>16}" for report in reports))
+
+    def row(title: str, values: List[Optional[float]]):
+        print(f"{title:<16}" + "".join(f"{value:>16.3f}" if value is not None else f"{'—':>16}" for value in values))
+
+    modules = list(dict.fromkeys(item["module"] for report in reports for item in report["imports"]))
+    for module in modules:
+        row(f"import {module}", [next((item.get("seconds") for item in report["imports"]
+                                        if item["module"] == module), None) for report in reports])
+    entries = list(dict.fromkeys(item["entry"] for report in reports for item in report["entry_points"]))
+    for entry in entries:
+        row(f"{entry} готов", [next((item.get("ready_seconds") for item in report["entry_points"]
+                                      if item["entry"] == entry), None) for report in reports])
+
+
+async def _run(args):
+    modules = args.modules.split(",") if args.modules else list(MODULES)
+    imports = []
+    for module in modules:
+        logger.info(f"Импорт {module}...")
+        imports.append(await asyncio.to_thread(measure_import, module, args.runs))
+    entry_points = []
+    for entry in args.entries.split(","):
+        logger.info(f"Запуск {entry}...")
+        if entry == "admin":
+            entry_points.append(await measure_admin(args))
+        else:
+            entry_points.append(await measure_bot(entry, args))
+    report = {
+        "label": args.label or version_label(),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "imports": imports,
+        "entry_points": entry_points,
+    }
+    path = save_report(report, report["label"])
+    print_report(report)
+    logger.info(f"Отчёт сохранён: {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Время импорта модулей и запуска до готовности для точек входа")
+    sub = parser.add_subparsers(dest="command")
+    run = sub.add_parser("run", help="замерить и сохранить отчёт")
+    run.add_argument("--modules", help=f"модули через запятую (по умолчанию: {','.join(MODULES)})")
+    run.add_argument("--entries", default="polling,webhook,admin",
+                     help="точки входа: polling (bot.py), webhook (Webhook.py), admin (admin_panel.py)")
+    run.add_argument("--runs", type=int, default=3, help="повторов импорта (берётся медиана)")
+    run.add_argument("--startup-timeout", type=float, default=300)
+    run.add_argument("--label", help="метка версии в имени отчёта (по умолчанию — коммит git)")
+    run.add_argument("--telegram-port", type=int, default=8081)
+    run.add_argument("--groq-port", type=int, default=8082)
+    run.add_argument("--webapp-port", type=int, default=8083)
+    run.add_argument("--metrics-port", type=int, default=9111)
+    compare = sub.add_parser("compare", help="сравнить сохранённые отчёты")
+    compare.add_argument("reports", nargs="+")
+    args = parser.parse_args()
+    if args.command == "compare":
+        compare_reports(args.reports)
+    elif args.command == "run":
+        asyncio.run(_run(args))
+    else:
+        parser.print_help()